@@ -0,0 +1,55 @@
+# Case Index Benchmark
+# One city with many polygons (like the UPZs of Bogota). Builds the active cases index of every polygon and date
+# by filtering all the cases (as the per polygon queries do) against the case index service (see
+# functions/case_index.py):
+#   python benchmarks/case_index_benchmark.py
+
+import os
+import sys
+import time
+import pathlib
+import numpy as np
+
+current_path = pathlib.Path(__file__).parent.parent.absolute()
+sys.path.append(os.path.join(current_path, 'functions/'))
+
+import spatial_engine as se
+import case_index as ci
+
+
+num_cases = 300000
+num_days = 400
+num_polygons = 40
+num_dates = 30
+num_houses = 5000
+
+rng = np.random.default_rng(0)
+start_date = np.datetime64('2020-03-01', 'D')
+case_dates = start_date + rng.integers(0, num_days, num_cases).astype('timedelta64[D]')
+case_lat, case_lon = rng.uniform(4.45, 4.85, num_cases), rng.uniform(-74.25, -73.98, num_cases)
+house_lat, house_lon = rng.uniform(4.45, 4.85, num_houses), rng.uniform(-74.25, -73.98, num_houses)
+
+dates = [str(start_date + np.timedelta64(int(d), 'D')) for d in np.linspace(30, num_days - 30, num_dates).astype(int)]
+
+# Per polygon
+t = time.time()
+for _ in range(num_polygons):
+    for date_string in dates:
+        date = np.datetime64(date_string, 'D')
+        active = (case_dates >= date - np.timedelta64(ci.days_after_start, 'D')) & (case_dates <= date + np.timedelta64(ci.days_before_start, 'D'))
+        distances = se.NearestPointIndex(case_lat[active], case_lon[active]).query(house_lat, house_lon)
+time_polygons = time.time() - t
+
+# Service (cases already loaded)
+service = ci.CaseIndexService(max_indices = num_dates)
+order = np.argsort(case_dates, kind = 'stable')
+service.cases['benchmark'] = (case_dates[order], case_lat[order], case_lon[order])
+
+t = time.time()
+for _ in range(num_polygons):
+    for date_string in dates:
+        distances = service.get_active_index(None, 'benchmark', date_string).query(house_lat, house_lon)
+time_service = time.time() - t
+
+print(f'{num_cases} cases, {num_polygons} polygons, {num_dates} dates')
+print(f'Per polygon: {round(time_polygons, 2)} seconds. Service: {round(time_service, 2)} seconds ({service.get_summary()})')
@@ -0,0 +1,67 @@
+# Centrality Engine Benchmark
+# igraph (one Graph per computation) against the sparse engine (one build per window, see
+# functions/centrality_engine.py) for weighted and unweighted pagerank, eigenvector centrality and 8
+# personalized pageranks. Time, memory and max differences:
+#   python benchmarks/centrality_engine_benchmark.py
+
+import os
+import sys
+import time
+import pathlib
+import resource
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+current_path = pathlib.Path(__file__).parent.parent.absolute()
+sys.path.append(os.path.join(current_path, 'functions/'))
+
+import utils
+import centrality_engine as ce
+
+
+num_nodes = 200000
+num_edges = 1000000
+num_resets = 8
+
+rng = np.random.default_rng(0)
+id1 = (num_nodes*rng.power(0.3, num_edges)).astype(int)
+id2 = rng.integers(0, num_nodes, num_edges)
+edges = pd.DataFrame({'id1': id1.astype(str), 'id2': id2.astype(str), 'weight': rng.integers(1, 10, num_edges)})
+edges = edges.groupby(['id1','id2'], as_index = False).weight.sum()
+nodes = pd.DataFrame({'identifier': pd.unique(np.concatenate((edges.id1.values, edges.id2.values)))})
+resets = rng.random((nodes.shape[0], num_resets))
+
+# Sparse
+tracemalloc.start()
+t = time.time()
+engine = ce.CentralityEngine(*utils.build_csr_pair(nodes, edges))
+x_pr_w, _ = engine.pagerank(weighted = True)
+x_pr_u, _ = engine.pagerank(weighted = False)
+x_ev, _ = engine.eigenvector(weighted = True)
+x_ppr, _ = engine.pagerank(weighted = True, resets = resets)
+time_sparse = time.time() - t
+_, peak_sparse = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+
+# igraph
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t = time.time()
+G, _ = utils.build_graph(nodes, edges, weighted = True)
+y_pr_w = np.array(G.pagerank(weights = 'weight', directed = False))
+G, _ = utils.build_graph(nodes, edges, weighted = False)
+y_pr_u = np.array(G.pagerank(directed = False))
+G, _ = utils.build_graph(nodes, edges, weighted = True)
+y_ev = np.array(G.eigenvector_centrality(weights = 'weight'))
+y_ppr = []
+for i in range(num_resets):
+    G, _ = utils.build_graph(nodes, edges, weighted = True)
+    y_ppr.append(G.personalized_pagerank(weights = 'weight', directed = False, reset = resets[:, i]))
+y_ppr = np.array(y_ppr).T
+time_igraph = time.time() - t
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+print(f'Graph: {nodes.shape[0]} nodes, {edges.shape[0]} edges')
+print(f'Sparse: {round(time_sparse, 2)} seconds. Peak memory: {round(peak_sparse/1024**2, 1)} MB (matrices: {round(engine.get_memory_bytes()/1024**2, 1)} MB)')
+print(f'igraph: {round(time_igraph, 2)} seconds. Max RSS increase: {round((rss_after - rss_before)/1024, 1)} MB')
+print(f'Max differences. Pagerank: {np.abs(x_pr_w - y_pr_w).max():.2e} (weighted), {np.abs(x_pr_u - y_pr_u).max():.2e} (unweighted). Eigenvector: {np.abs(x_ev - y_ev).max():.2e}. Personalized: {np.abs(x_ppr - y_ppr).max():.2e}')
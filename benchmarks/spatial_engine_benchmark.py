@@ -0,0 +1,55 @@
+# Spatial Engine Benchmark
+# Bogota sized synthetic polygon: nearest case of every house with the indices (see functions/spatial_engine.py)
+# against all the pairs (the cross join):
+#   python benchmarks/spatial_engine_benchmark.py
+
+import os
+import sys
+import time
+import pathlib
+import numpy as np
+
+current_path = pathlib.Path(__file__).parent.parent.absolute()
+sys.path.append(os.path.join(current_path, 'functions/'))
+
+import spatial_engine as se
+
+
+num_houses = 500000
+num_cases = 20000
+
+rng = np.random.default_rng(0)
+house_lat, house_lon = rng.uniform(4.45, 4.85, num_houses), rng.uniform(-74.25, -73.98, num_houses)
+case_lat, case_lon = rng.uniform(4.45, 4.85, num_cases), rng.uniform(-74.25, -73.98, num_cases)
+
+t = time.time()
+index = se.NearestPointIndex(case_lat, case_lon)
+distances = index.query(house_lat, house_lon, num_processes = -1)
+time_index = time.time() - t
+
+# All pairs for a sample of the houses (in chunks)
+sample = rng.choice(num_houses, 2000, replace = False)
+t = time.time()
+expected = np.array([se.haversine(house_lat[i], house_lon[i], case_lat, case_lon).min() for i in sample])
+time_pairs = (time.time() - t)*num_houses/sample.shape[0]
+
+print(f'{num_houses} houses, {num_cases} cases')
+print(f'Index: {round(time_index, 2)} seconds. All pairs (extrapolated): {round(time_pairs, 2)} seconds')
+print(f'Max difference: {np.abs(distances[sample] - expected).max():.2e} meters')
+
+# Geometries: block sized polygons (as the cases of Bogota) against all the arcs for a sample of the houses
+sizes = rng.uniform(0.0003, 0.0015, num_cases)
+geometries = [{'type': 'Polygon', 'coordinates': [[[x, y], [x + s, y], [x + s, y + s], [x, y + s], [x, y]]]} for x, y, s in zip(case_lon, case_lat, sizes)]
+
+t = time.time()
+index = se.NearestGeometryIndex(geometries)
+distances = index.query(house_lat, house_lon)
+time_index = time.time() - t
+
+expected = []
+for i in sample[:200]:
+    point = se.to_unit_vectors(house_lat[i:i+1], house_lon[i:i+1])
+    inside = ((house_lat[i] >= case_lat) & (house_lat[i] <= case_lat + sizes) & (house_lon[i] >= case_lon) & (house_lon[i] <= case_lon + sizes)).any()
+    expected.append(0 if inside else se.chord_to_meters(se.arc_chord_distance(np.repeat(point, index.arc_a.shape[0], axis = 0), index.arc_a, index.arc_b).min()))
+
+print(f'Geometries index: {round(time_index, 2)} seconds. Max difference: {np.abs(distances[sample[:200]] - np.array(expected)).max():.2e} meters')
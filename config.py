@@ -1,4 +1,15 @@
 # Congifuration
+import os
+
 project='grafos-alcaldia-bogota'
 zone='us-central1-a'
 instance = 'update-graphs'
+
+# Attribute update
+# Hierarchical mode (see update_attributes/attribute_generic.py). Can also be enabled with the command line
+# argument "hierarchical" of excecute_attributes_update.py
+attributes_hierarchical_mode = False
+
+# Log of the predicted and actual costs of the attributes, used to recalibrate the cost model (see
+# update_attributes/cost_model.py). Must be a persistent location
+attributes_cost_log_file = os.path.join(os.path.expanduser('~'), '.covid_contact_graphs', 'attribute_costs', 'task_costs.csv')
@@ -15,6 +15,12 @@ sys.path.append(os.path.join(current_path,'functions/'))
 from config import *
 import update_attributes
 
+# Hierarchical mode: edgelists of the children derived from their parent (see attribute_generic)
+update_attributes.attribute_generic.hierarchical_mode = attributes_hierarchical_mode or 'hierarchical' in [arg.lower() for arg in sys.argv[1:]]
+
+# Persistent log of the task costs (see cost_model)
+update_attributes.task_cost_model.log_file = attributes_cost_log_file
+
 print('')
 print('')
 print('')
@@ -23,6 +29,8 @@ print('-------------------------------------------------------------------------
 print('----------------------------------------------------------------------------------------------------------------------------')
 print('Time: {}'.format(datetime.now()))
 print('Started Update Process')
+print('Hierarchical Mode: {}'.format(update_attributes.attribute_generic.hierarchical_mode))
+print('Cost Log: {}'.format(update_attributes.task_cost_model.log_file))
 print('--------------------------------------')
 print('')
 update_attributes.main()
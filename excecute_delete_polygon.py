@@ -109,6 +109,7 @@ def main(location_id, remove_from_geo = False):
         """
 
         utils.run_simple_query_no_result(client,sql)
+        utils.location_registry.clear()
 
     print('Done')
     print("----------------------")
@@ -3,8 +3,12 @@ import pandas as pd
 import numpy as np
 from google.cloud import bigquery
 import igraph as ig
+from functions.utils import build_graph
+from functions.parquet_cache import ParquetCache, EDGES, TRANSITS
 # Starts the client
 client = bigquery.Client(location="US")
+# Local cache of the daily edges and transits (only the missing dates are downloaded)
+parquet_cache = ParquetCache()
 import seaborn as sns
 from datetime import timedelta
 
@@ -21,18 +25,9 @@ def compute_personalized_pagerank(nodes, edges, weighted):
     '''
     
     # Create the graph
-    G = ig.Graph()
-
-    # Adds the values
-    G.add_vertices(nodes.identifier.values)        
-
-    if edges.shape[0] > 0:
-        G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
+    G, _ = build_graph(nodes, edges, weighted)
     
     if weighted:
-        # Adds weights to edges
-        G.es['weight'] = edges.weight.values
-
         # Exctracs the personalized pagerank
         personalized_page_rank = G.personalized_pagerank(weights = 'weight', directed = False, reset = nodes['dist_weight'].values)
     
@@ -47,18 +42,9 @@ def compute_pagerank(nodes, edges, weighted):
     
     
     # Create the graph
-    G = ig.Graph()
-
-    # Adds the values
-    G.add_vertices(nodes.identifier.values)        
-
-    if edges.shape[0] > 0:
-        G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
+    G, _ = build_graph(nodes, edges, weighted)
     
     if weighted:
-        # Adds weights to edges
-        G.es['weight'] = edges.weight.values
-
         # Exctracs the personalized pagerank
         page_rank = G.pagerank(weights = 'weight', directed = False)
     
@@ -76,18 +62,9 @@ def compute_eigenvector(nodes, edges, weighted):
     '''
     
     # Create the graph
-    G = ig.Graph()
-
-    # Adds the values
-    G.add_vertices(nodes.identifier.values)        
-
-    if edges.shape[0] > 0:
-        G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
+    G, _ = build_graph(nodes, edges, weighted)
     
     if weighted:
-        # Adds weights to edges
-        G.es['weight'] = edges.weight.values
-
         # Exctracs the personalized pagerank
         eigen_vector = G.evcent(weights = 'weight', directed = False)
     
@@ -105,18 +82,9 @@ def compute_eigenvalue(nodes, edges, weighted):
     '''
     
     # Create the graph
-    G = ig.Graph()
-
-    # Adds the values
-    G.add_vertices(nodes.identifier.values)        
-
-    if edges.shape[0] > 0:
-        G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
+    G, _ = build_graph(nodes, edges, weighted)
 
     if weighted:        
-        # Adds weights to edges
-        G.es['weight'] = edges.weight.values
-
         # Exctracs the eigen value
         _, eigen_value = G.evcent(weights = 'weight', directed = False, return_eigenvalue = True)
 
@@ -167,40 +135,15 @@ def get_edges(dataset_id, location_id, start_date, end_date ):
     
     
     # Edges 
-    query = f"""
-            SELECT id1, id2, COUNT(*) as weight, SUM(contacts) as total_contacts
-            FROM grafos-alcaldia-bogota.{dataset_id}.{location_id}
-            WHERE date >= "{start_date}" AND date <= "{end_date}"
-            GROUP BY id1, id2
-    """
-
-
-    job_config = bigquery.QueryJobConfig(allow_large_results = True)
-    query_job = client.query(query, job_config=job_config) 
-
-    # Return the results as a pandas DataFrame
-    edges = query_job.to_dataframe() 
+    df = parquet_cache.read(client, EDGES, location_id, start_date, end_date, dataset_id = dataset_id, columns = ['id1', 'id2', 'contacts'])
+    edges = df.groupby(['id1', 'id2']).agg(weight = ('contacts', 'size'), total_contacts = ('contacts', 'sum')).reset_index()
     
     return(edges)
 
 def get_nodes(location_id, start_date, end_date ):
     # Nodes
-
-    query = f"""
-            SELECT identifier
-            FROM grafos-alcaldia-bogota.transits.hourly_transits
-            WHERE location_id = "{location_id}"
-                  AND date >= "{start_date}"
-                  AND date <=  "{end_date}"
-            GROUP BY identifier
-    """
-
-
-    job_config = bigquery.QueryJobConfig(allow_large_results = True)
-    query_job = client.query(query, job_config=job_config) 
-
-    # Return the results as a pandas DataFrame
-    nodes = query_job.to_dataframe() 
+    df = parquet_cache.read(client, TRANSITS, location_id, start_date, end_date, columns = ['identifier'])
+    nodes = pd.DataFrame({'identifier': df.identifier.unique()})
     
     return(nodes)
     
@@ -210,20 +153,8 @@ def get_contacts(dataset_id, location_id, date, hour):
     Extracts the contacts of the given lo cation at date and hour
     '''
     
-    # Edges 
-    query = f"""
-            SELECT id1, id2, lat, lon
-            FROM grafos-alcaldia-bogota.{dataset_id}.{location_id}
-            WHERE date = "{date}" AND hour = {hour}
-
-    """
-
-
-    job_config = bigquery.QueryJobConfig(allow_large_results = True)
-    query_job = client.query(query, job_config=job_config) 
-
-    # Return the results as a pandas DataFrame
-    edges = query_job.to_dataframe() 
+    # Edges (only the row groups of the hour are read)
+    edges = parquet_cache.read(client, EDGES, location_id, date, date, dataset_id = dataset_id, columns = ['id1', 'id2', 'lat', 'lon'], hours = [hour])
     
     return(edges)
 
@@ -235,26 +166,9 @@ def get_contacs_by_location(dataset_id, location_id, start_date, end_date):
     '''
     
     # Edges 
-    query = f"""
-            SELECT lat, lon, COUNT(*) total_contacts
-            FROM
-            (
-              SELECT  ROUND(lat,4) AS lat, ROUND(lon,4) AS lon
-              FROM grafos-alcaldia-bogota.{dataset_id}.{location_id}
-              WHERE date >= "{start_date}" AND date <= "{end_date}"
-
-            )
-            GROUP BY lat, lon
-            ORDER BY total_contacts DESC
-
-    """
-
-
-    job_config = bigquery.QueryJobConfig(allow_large_results = True)
-    query_job = client.query(query, job_config=job_config) 
-
-    # Return the results as a pandas DataFrame
-    edges = query_job.to_dataframe() 
+    df = parquet_cache.read(client, EDGES, location_id, start_date, end_date, dataset_id = dataset_id, columns = ['lat', 'lon'])
+    df = df.round({'lat': 4, 'lon': 4})
+    edges = df.groupby(['lat', 'lon']).size().rename('total_contacts').reset_index()
+    edges.sort_values('total_contacts', ascending = False, inplace = True)
     
     return(edges)
-    
\ No newline at end of file
@@ -8,7 +8,7 @@ from datetime import timedelta
 import matplotlib.pyplot as plt
 from google.cloud import bigquery
 
-from functions.utils import get_edges, get_nodes
+from functions.utils import get_edges, get_nodes, build_graph
 
 # Constants
 date_format = "%Y-%m-%d"
@@ -32,11 +32,7 @@ def pre_quarentine(dataset_id, location_id):
     df_pre_nodes = df_pre_nodes.drop_duplicates()
 
     # Create the graph
-    G = ig.Graph()
-
-    # Adds the values
-    G.add_vertices(df_pre_nodes.identifier.values)        
-    G.add_edges(df_pre.apply(lambda df: (df.id1, df.id2), axis = 1))
+    G, _ = build_graph(df_pre_nodes, df_pre, weighted = False)
 
     degrees = np.array(G.indegree()) + np.array(G.outdegree())
         
@@ -57,11 +53,7 @@ def quarentine(dataset_id, location_id):
     df_quar_nodes = df_quar_nodes.drop_duplicates()
 
     # Create the graph
-    G = ig.Graph()
-
-    # Adds the values
-    G.add_vertices(df_quar_nodes.identifier.values)        
-    G.add_edges(df_quar.apply(lambda df: (df.id1, df.id2), axis = 1))
+    G, _ = build_graph(df_quar_nodes, df_quar, weighted = False)
 
     degrees = np.array(G.indegree()) + np.array(G.outdegree())
         
@@ -83,11 +75,7 @@ def pos_quarentine(dataset_id, location_id):
     df_pos_nodes = df_pos_nodes.drop_duplicates()
 
     # Create the graph
-    G = ig.Graph()
-
-    # Adds the values
-    G.add_vertices(df_pos_nodes.identifier.values)        
-    G.add_edges(df_pos.apply(lambda df: (df.id1, df.id2), axis = 1))
+    G, _ = build_graph(df_pos_nodes, df_pos, weighted = False)
 
 
 
@@ -0,0 +1,235 @@
+# Attribute Writer
+# Buffers the attribute frames (across dates, locations and attributes) and inserts them into their
+# table with a single load job per flush. Rows that are buffered but not yet inserted are kept in
+# a local spill file, so they can be recovered if the process dies. The types of its columns are kept
+# next to it (CSV does not keep them), so the recovered rows match the schema of the table.
+
+import os
+import json
+import glob
+import time
+import atexit
+import tempfile
+import threading
+import pandas as pd
+from google.cloud import bigquery
+
+
+# Default flush limits
+default_max_rows = 500000
+default_max_bytes = 256*1024*1024 # 256 MB
+default_max_seconds = 15*60 # 15 minutes
+
+# Folder for the spill files
+default_spill_folder = os.path.join(tempfile.gettempdir(), 'attribute_writer')
+
+
+def read_spill_file(file_name, dtypes_file):
+    '''
+    Reads the spill file, with the types of its columns (see AttributeWriter.append). Files without types
+    (left by older versions) are read as the attribute tables (date and float attribute_value).
+
+    returns
+        pd.DataFrame
+    '''
+
+    df = pd.read_csv(file_name, dtype = str)
+
+    if os.path.isfile(dtypes_file):
+        with open(dtypes_file) as f:
+            dtypes = json.load(f)
+    else:
+        dtypes = {'date': 'datetime64[ns]', 'attribute_value': 'float64'}
+
+    for column, dtype in dtypes.items():
+        if column not in df.columns:
+            continue
+
+        if dtype.startswith('datetime64'):
+            df[column] = pd.to_datetime(df[column])
+        elif dtype == 'bool':
+            df[column] = df[column].map({'True': True, 'False': False})
+        elif dtype != 'object':
+            df[column] = df[column].astype(dtype)
+
+    return(df)
+
+
+class AttributeWriter():
+    '''
+    Buffered writer for an attributes table.
+
+    The buffer is flushed (one load job) when any of the limits (rows, bytes or seconds since the first
+    buffered frame) is reached, when flush or close are called and when the interpreter exits.
+    '''
+
+    def __init__(self, table_id, client = None, max_rows = default_max_rows, max_bytes = default_max_bytes, max_seconds = default_max_seconds, spill_folder = default_spill_folder):
+        '''
+        params
+            - table_id (str): Full id of the table
+            - client (bigquery.Client): Client used for the load jobs. If None, one is created on the first flush
+            - max_rows (int): Max buffered rows
+            - max_bytes (int): Max buffered bytes
+            - max_seconds (int): Max seconds a row can be buffered (checked on each append)
+            - spill_folder (str): Folder for the spill file. None to disable it
+        '''
+
+        self.table_id = table_id
+        self.client = client
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.spill_folder = spill_folder
+
+        # Buffer
+        self.frames = []
+        self.num_rows = 0
+        self.num_bytes = 0
+        self.first_append_time = None
+
+        # Spill files recovered from a previous run, removed after the next flush
+        self.recovered_files = []
+
+        self.lock = threading.Lock()
+
+        # Statistics
+        self.total_rows = 0
+        self.total_flushes = 0
+
+        atexit.register(self.close)
+
+
+    def get_spill_file(self):
+        '''
+        Returns the spill file of the current process
+        '''
+        return(os.path.join(self.spill_folder, f'{self.table_id}.{os.getpid()}.spill.csv'))
+
+
+    def get_dtypes_file(self, spill_file):
+        '''
+        Returns the file with the types of the columns of the spill file
+        '''
+        return(spill_file[:-len('.csv')] + '.dtypes.json')
+
+
+    def append(self, df):
+        '''
+        Adds the frame to the buffer. Flushes if any limit is reached.
+
+        params
+            - df (pd.DataFrame): Frame with the same columns as the table
+        '''
+
+        if df.shape[0] == 0:
+            return
+
+        with self.lock:
+
+            if self.spill_folder is not None:
+                if not os.path.exists(self.spill_folder):
+                    os.makedirs(self.spill_folder, exist_ok = True)
+
+                spill_file = self.get_spill_file()
+                if not os.path.isfile(spill_file):
+                    with open(self.get_dtypes_file(spill_file), 'w') as f:
+                        json.dump({column: str(dtype) for column, dtype in df.dtypes.items()}, f)
+
+                df.to_csv(spill_file, mode = 'a', header = not os.path.isfile(spill_file), index = False)
+
+            self.frames.append(df)
+            self.num_rows += df.shape[0]
+            self.num_bytes += int(df.memory_usage(index = True, deep = True).sum())
+
+            if self.first_append_time is None:
+                self.first_append_time = time.time()
+
+            full = self.num_rows >= self.max_rows or self.num_bytes >= self.max_bytes or time.time() - self.first_append_time >= self.max_seconds
+
+        if full:
+            self.flush()
+
+
+    def flush(self):
+        '''
+        Inserts all the buffered rows with a single load job
+        '''
+
+        with self.lock:
+
+            if len(self.frames) == 0:
+                return
+
+            df = pd.concat(self.frames, ignore_index = True)
+
+            if self.client is None:
+                self.client = bigquery.Client(location="US")
+
+            job_config = bigquery.LoadJobConfig()
+            job = self.client.load_table_from_dataframe(df, self.table_id, job_config=job_config)
+
+            # Wait for the load job to complete.
+            job.result()
+
+            self.total_rows += df.shape[0]
+            self.total_flushes += 1
+
+            # Clears the buffer
+            self.frames = []
+            self.num_rows = 0
+            self.num_bytes = 0
+            self.first_append_time = None
+
+            # Removes the spill files (the rows are already in the table)
+            if self.spill_folder is not None:
+                for file_name in self.recovered_files + [self.get_spill_file()]:
+                    for spill_file in [file_name, self.get_dtypes_file(file_name)]:
+                        if os.path.isfile(spill_file):
+                            os.remove(spill_file)
+
+            self.recovered_files = []
+
+
+    def recover_spilled_rows(self):
+        '''
+        Adds to the buffer the rows left in spill files by previous runs that did not finish. Must be called
+        before other processes start writing to the same table.
+
+        returns
+            Number of recovered rows
+        '''
+
+        if self.spill_folder is None:
+            return(0)
+
+        num_rows = 0
+        with self.lock:
+            for file_name in glob.glob(os.path.join(self.spill_folder, f'{self.table_id}.*.spill.csv')):
+
+                if file_name == self.get_spill_file() or file_name in self.recovered_files:
+                    continue
+
+                df = read_spill_file(file_name, self.get_dtypes_file(file_name))
+
+                self.frames.append(df)
+                self.num_rows += df.shape[0]
+                self.num_bytes += int(df.memory_usage(index = True, deep = True).sum())
+                self.recovered_files.append(file_name)
+
+                num_rows += df.shape[0]
+
+        return(num_rows)
+
+
+    def close(self):
+        '''
+        Flushes the remaining rows
+        '''
+        self.flush()
+
+
+    def get_summary(self):
+        '''
+        Returns a string with the writer statistics
+        '''
+        return(f'{self.total_rows} rows in {self.total_flushes} load jobs')
@@ -0,0 +1,256 @@
+# Case Index
+# Positive cases of each city, loaded once per run and shared by all the polygons (locations) of the city.
+# Cases are kept sorted by their symptom start date, so the active cases of any date are a contiguous slice
+# (binary search). The spatial index of each active set is kept (LRU), and the accumulated cases of every
+# polygon of the city are computed with a single query.
+#
+# The cases of Bogota are geometries, so their index measures the distance to the geometry (0 inside it, see
+# spatial_engine.NearestGeometryIndex) as the original ST_DISTANCE did, instead of the distance to its centroid.
+
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+import utils
+import spatial_engine as se
+
+
+# A case is active on a date if its symptoms started at most days_after_start days before, or at most
+# days_before_start days after
+days_before_start = 5
+days_after_start = 15
+
+# Max number of spatial indices kept
+default_max_indices = 16
+
+
+# Queries
+# ---------
+# All the cases of the city (with symptom start date)
+bogota_cases_sql = """
+
+        SELECT DATE(TIMESTAMP(fechainici)) as date, ST_Y(ST_CENTROID(geometry)) as lat, ST_X(ST_CENTROID(geometry)) as lon, ST_ASGEOJSON(geometry) as geometry
+        FROM `servinf-unacast-prod.AlcaldiaBogota.positivos_agg_fecha`
+        WHERE TRIM(fechainici) <> ""
+
+"""
+
+generic_cases_sql = """
+
+        SELECT DATE(date_start_symtoms) as date, lat, lon
+        FROM  grafos-alcaldia-bogota.positives.{table_name}
+        WHERE date_start_symtoms IS NOT NULL
+
+"""
+
+# Cases inside (within the precision of) each location, by symptom start date
+bogota_location_cases_sql = """
+
+        SELECT loc.location_id, cases.fechainici as date, COUNT(*) as total
+        FROM `servinf-unacast-prod.AlcaldiaBogota.positivos_agg_fecha` as cases
+        JOIN (SELECT location_id, ANY_VALUE(geometry) as geometry, ANY_VALUE(precision) as precision
+              FROM grafos-alcaldia-bogota.geo.locations_geometries
+              WHERE location_id IN ({location_ids})
+              GROUP BY location_id) as loc
+        ON ST_DWithin(cases.geometry, loc.geometry, loc.precision)
+        GROUP BY location_id, date
+
+"""
+
+generic_location_cases_sql = """
+
+        SELECT loc.location_id, CAST(DATE(cases.date_start_symtoms) AS STRING) as date, COUNT(*) as total
+        FROM grafos-alcaldia-bogota.positives.{table_name} as cases
+        JOIN (SELECT location_id, ANY_VALUE(geometry) as geometry, ANY_VALUE(precision) as precision
+              FROM grafos-alcaldia-bogota.geo.locations_geometries
+              WHERE location_id IN ({location_ids})
+              GROUP BY location_id) as loc
+        ON ST_DWithin(ST_GeogPoint(cases.lon, cases.lat), loc.geometry, loc.precision)
+        WHERE cases.date_start_symtoms IS NOT NULL
+        GROUP BY location_id, date
+
+"""
+
+
+def get_city_location_ids(client, city):
+    '''
+    Returns the locations (location_id) of the city
+    '''
+
+    location_ids = []
+    for location_id in utils.get_current_locations(client).location_id.values:
+        try:
+            if utils.get_city(client, location_id) == city:
+                location_ids.append(location_id)
+        except (KeyError, ValueError):
+            # Locations without geo codes or without city support
+            continue
+
+    return(location_ids)
+
+
+class CaseIndexService():
+    '''
+    Cases of each city, with the active cases of each date and their spatial index
+    '''
+
+    def __init__(self, max_indices = default_max_indices):
+        '''
+        params
+            - max_indices (int): Max number of spatial indices kept (one per city and active set)
+        '''
+
+        self.max_indices = max_indices
+
+        # city -> (dates, lat, lon) sorted by date
+        self.cases = {}
+        # city -> GeoJSON of the cases (same order), only for the cities with geometries
+        self.geometries = {}
+        # city -> {location_id -> (dates, accumulated totals)} sorted by date
+        self.location_cases = {}
+        # (city, start, end) -> se.NearestPointIndex
+        self.indices = OrderedDict()
+
+        # Statistics
+        self.queries = 0
+        self.index_hits = 0
+        self.index_builds = 0
+
+
+    def load_cases(self, client, city):
+        '''
+        Loads (once) all the cases of the city
+
+        returns
+            dates (np.array datetime64[D]): sorted symptom start dates
+            lat (np.array)
+            lon (np.array)
+        '''
+
+        if city not in self.cases:
+
+            if city == utils.BOGOTA:
+                query = bogota_cases_sql
+            else:
+                query = generic_cases_sql.format(table_name = city)
+
+            df = utils.run_simple_query(client, query)
+            self.queries += 1
+
+            dates = pd.to_datetime(df.date).values.astype('datetime64[D]')
+            order = np.argsort(dates, kind = 'stable')
+
+            self.cases[city] = (dates[order], df.lat.values[order].astype(np.float64), df.lon.values[order].astype(np.float64))
+            if 'geometry' in df.columns:
+                self.geometries[city] = df.geometry.values[order]
+
+        return(self.cases[city])
+
+
+    def get_active_range(self, client, city, date_string):
+        '''
+        Returns the slice (start, end) of the cases of the city active on the date (see days_before_start and
+        days_after_start)
+        '''
+
+        dates, _, _ = self.load_cases(client, city)
+        date = np.datetime64(date_string, 'D')
+
+        start = np.searchsorted(dates, date - np.timedelta64(days_after_start, 'D'), side = 'left')
+        end = np.searchsorted(dates, date + np.timedelta64(days_before_start, 'D'), side = 'right')
+
+        return(int(start), int(end))
+
+
+    def get_active_index(self, client, city, date_string):
+        '''
+        Returns the spatial index (see spatial_engine) of the cases of the city active on the date (over their
+        geometries if the city has them). Dates with the same active cases share the index.
+        '''
+
+        start, end = self.get_active_range(client, city, date_string)
+        key = (city, start, end)
+
+        if key in self.indices:
+            self.indices.move_to_end(key)
+            self.index_hits += 1
+            return(self.indices[key])
+
+        _, lat, lon = self.cases[city]
+        if city in self.geometries:
+            index = se.NearestGeometryIndex(self.geometries[city][start:end])
+        else:
+            index = se.NearestPointIndex(lat[start:end], lon[start:end])
+        self.index_builds += 1
+
+        self.indices[key] = index
+        while len(self.indices) > self.max_indices:
+            self.indices.popitem(last = False)
+
+        return(index)
+
+
+    def get_accumulated_cases(self, client, city, location_id, date_string):
+        '''
+        Returns the number of cases of the city inside the location (within its precision) with symptoms
+        started on or before the date. The first call of each city computes the totals of all its locations
+        with a single query.
+        '''
+
+        if city not in self.location_cases:
+            self.load_location_cases(client, city, get_city_location_ids(client, city))
+
+        if location_id not in self.location_cases[city]:
+            self.load_location_cases(client, city, [location_id])
+
+        dates, totals = self.location_cases[city][location_id]
+        position = np.searchsorted(dates, date_string, side = 'right')
+
+        if position == 0:
+            return(0)
+
+        return(int(totals[position - 1]))
+
+
+    def load_location_cases(self, client, city, location_ids):
+        '''
+        Loads the accumulated cases of the given locations of the city (single query)
+        '''
+
+        if city not in self.location_cases:
+            self.location_cases[city] = {}
+
+        location_ids = [location_id for location_id in location_ids if location_id not in self.location_cases[city]]
+        if len(location_ids) == 0:
+            return
+
+        location_ids_string = ', '.join([f'"{location_id}"' for location_id in location_ids])
+        if city == utils.BOGOTA:
+            query = bogota_location_cases_sql.format(location_ids = location_ids_string)
+        else:
+            query = generic_location_cases_sql.format(table_name = city, location_ids = location_ids_string)
+
+        df = utils.run_simple_query(client, query)
+        self.queries += 1
+
+        # Dates are compared as strings (as the original date filters)
+        df.date = df.date.astype(str)
+        df = df.sort_values(['location_id', 'date'])
+
+        for location_id in location_ids:
+            self.location_cases[city][location_id] = (np.array([], dtype = str), np.array([], dtype = np.int64))
+
+        for location_id, df_location in df.groupby('location_id'):
+            self.location_cases[city][location_id] = (df_location.date.values.astype(str), np.cumsum(df_location.total.values))
+
+
+    def get_summary(self):
+        '''
+        Returns a string with the statistics
+        '''
+        return(f'{self.queries} queries, {len(self.cases)} cities loaded, {self.index_builds} spatial indices built ({self.index_hits} reused)')
+
+
+
+# Shared by the process
+case_index_service = CaseIndexService()
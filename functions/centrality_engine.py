@@ -0,0 +1,154 @@
+# Centrality Engine
+# Sparse (scipy CSR) backend for the centralities, alternative to building an igraph Graph for every
+# computation. The adjacency matrices of a window are built once and shared by PageRank (weighted and
+# unweighted), personalized PageRank and eigenvector centrality.
+
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse.linalg import eigsh
+
+import pagerank_engine as pe
+
+
+# Backends
+BACKEND_IGRAPH = 'igraph'
+BACKEND_SPARSE = 'sparse'
+
+# Tolerance of the eigenvector (ARPACK). 0 for machine precision
+default_eigen_tol = 0
+# Max number of engines (windows) kept
+max_engines = 4
+
+
+class CentralityEngine():
+    '''
+    Centralities of an undirected graph over its weighted and unweighted adjacency matrices
+    (see utils.build_csr_pair). Rows follow the order of the identifiers.
+    '''
+
+    def __init__(self, A_weighted, A_unweighted, identifiers):
+        '''
+        params
+            - A_weighted (sp.csr_matrix): Symmetric weighted adjacency matrix
+            - A_unweighted (sp.csr_matrix): Symmetric unweighted adjacency matrix
+            - identifiers (pd.Index): identifier of each row
+        '''
+
+        self.A_weighted = A_weighted
+        self.A_unweighted = A_unweighted
+        self.identifiers = identifiers
+
+
+    def get_matrix(self, weighted = True):
+        '''
+        Returns the weighted or unweighted adjacency matrix
+        '''
+        if weighted:
+            return(self.A_weighted)
+
+        return(self.A_unweighted)
+
+
+    def pagerank(self, weighted = True, resets = None, damping = pe.default_damping, tol = pe.default_tol, max_iter = pe.default_max_iter):
+        '''
+        PageRank (or personalized PageRank). Several reset vectors can be given as the columns of a (n x c) matrix
+        and are computed together.
+
+        returns
+            x (np.array): n or (n x c)
+            iterations (int)
+        '''
+
+        return(pe.pagerank(self.get_matrix(weighted), damping = damping, reset = resets, tol = tol, max_iter = max_iter))
+
+
+    def eigenvector(self, weighted = True, v0 = None, tol = default_eigen_tol):
+        '''
+        Eigenvector centrality (scaled so the max is 1, as in igraph) and the largest eigenvalue of the adjacency
+        matrix. Uses Lanczos (ARPACK).
+
+        returns
+            x (np.array): the centrality of each node
+            eigenvalue (float)
+        '''
+
+        return(leading_eigenvector(self.get_matrix(weighted), v0 = v0, tol = tol))
+
+
+    def get_memory_bytes(self):
+        '''
+        Returns the bytes used by the matrices
+        '''
+        return(sum([A.data.nbytes + A.indices.nbytes + A.indptr.nbytes for A in [self.A_weighted, self.A_unweighted]]))
+
+
+
+def leading_eigenvector(A, v0 = None, tol = default_eigen_tol):
+    '''
+    Leading eigenvector (scaled so the max is 1) and eigenvalue of the symmetric matrix A.
+    Small matrices are solved densely.
+
+    returns
+        x (np.array)
+        eigenvalue (float)
+    '''
+
+    n = A.shape[0]
+
+    if n == 0:
+        return(np.zeros(0), 0.0)
+
+    if A.nnz == 0:
+        return(np.ones(n), 0.0)
+
+    if n < 3:
+        values, vectors = np.linalg.eigh(A.toarray())
+        value, x = values[-1], vectors[:, -1]
+    else:
+        if v0 is None:
+            v0 = np.ones(n)
+        values, vectors = eigsh(A, k = 1, which = 'LA', v0 = v0, tol = tol)
+        value, x = values[0], vectors[:, 0]
+
+    # Positive orientation (Perron vector), scaled to max 1
+    if x.sum() < 0:
+        x = -1*x
+
+    x[np.abs(x) < 1e-14*np.abs(x).max()] = 0
+    x = x/x.max()
+
+    return(x, float(value))
+
+
+# Engines of the recent windows (one matrix build per location and date range)
+engines = OrderedDict()
+
+def get_engine(key, build_function, identifiers = None):
+    '''
+    Returns the engine of the given key (for example, (location_id, start_date, end_date)). If it does not
+    exist, it is built with build_function (without parameters, returns a CentralityEngine)
+
+    params
+        - key (hashable): Key of the engine
+        - build_function (function): Builds the engine
+        - identifiers (pd.Index): Order of the rows expected by the caller (the order of its nodes). None to not check it
+
+    generates
+        - ValueError if the rows of the engine do not follow the given identifiers
+    '''
+
+    if key in engines:
+        engines.move_to_end(key)
+        engine = engines[key]
+    else:
+        engine = build_function()
+        engines[key] = engine
+
+        while len(engines) > max_engines:
+            engines.popitem(last = False)
+
+    # Results are assigned to the nodes by position
+    if identifiers is not None and not engine.identifiers.equals(identifiers):
+        raise ValueError(f'The rows of the centrality engine of {key} do not follow the order of the nodes')
+
+    return(engine)
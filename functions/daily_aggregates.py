@@ -0,0 +1,479 @@
+# Daily Aggregates
+# Per day aggregates of the edges and nodes of a location. Windows (weekly, etc...) are assembled by merging
+# the days they contain, so each day is only grouped once in the warehouse. Consecutive windows of the
+# same location are computed incrementally: the days that leave the window are subtracted and the days
+# that enter it are added.
+
+import time
+import threading
+from collections import OrderedDict
+import pandas as pd
+from google.cloud import bigquery
+
+import utils
+import graph_data_cache as gdc
+import parquet_cache as pqc
+
+
+# Columns
+EDGE_KEYS = ['id1','id2']
+EDGE_VALUES = ['weight','total_contacts']
+NODE_KEYS = ['identifier']
+NODE_VALUES = ['weight']
+
+# Max number of window states (one per location and kind) kept for the incremental computation
+max_window_states = 16
+
+# Minimum fraction of days shared with the previous window, for the incremental computation to be used
+min_shared_fraction = 0.5
+
+# Rows per page of the streamed downloads
+page_size = 500000
+
+# Raw table (see parquet_cache) whose coverage decides if a day block is complete
+coverage_kinds = {gdc.KIND_DAILY_EDGES : pqc.EDGES, gdc.KIND_DAILY_NODES : pqc.TRANSITS}
+
+
+def get_dates(start_date_string, end_date_string):
+    '''
+    Returns the list of day strings between both dates (inclusive)
+    '''
+    return([d.strftime(utils.date_format) for d in pd.date_range(start_date_string, end_date_string, freq = 'D')])
+
+
+class DailyAggregateStore():
+    '''
+    Store of the per day aggregated edges and nodes of each location.
+
+    The day blocks are kept in a GraphDataCache (so they share its memory cap and disk tier) under the
+    kinds KIND_DAILY_EDGES and KIND_DAILY_NODES:
+        - edges: id1, id2, weight (number of records), total_contacts (sum of contacts)
+        - nodes: identifier, weight (sum of total_transits)
+
+    The missing days of a window are downloaded with a single query grouped by date. In batch mode (see
+    set_pending_span) the first download of a location includes every missing day of its pending span, so
+    the rest of its windows are assembled locally. With a parquet cache, the days are read from it (only the
+    days it does not have are downloaded) and grouped locally.
+
+    Only complete days are stored (the same rule as the parquet cache: before today and at or before the
+    coverage of the location), since the tables of the latest days may still be loading. Incomplete days are
+    downloaded each time they are used.
+    '''
+
+    def __init__(self, cache, identifier_dictionary = None, parquet_cache = None):
+        '''
+        params
+            - cache (GraphDataCache): Cache where the day blocks are stored
+            - identifier_dictionary (IdentifierDictionary): Encodes the identifiers of the downloaded blocks to
+                int32 (see identifier_dictionary). None to keep them as strings
+            - parquet_cache (ParquetCache): Local cache of the raw daily edges and transits (see parquet_cache).
+                None to group the days in the warehouse
+        '''
+
+        self.cache = cache
+        self.identifier_dictionary = identifier_dictionary
+        self.parquet_cache = parquet_cache
+
+        # Last window assembled for each (location_id, kind)
+        self.window_states = OrderedDict()
+
+        # Pending span of each location (batch mode): location_id -> list of day strings
+        self.pending_spans = {}
+
+        # Coverage (see get_complete_dates): kind -> (load time, location_id -> last loaded date)
+        self.coverage = {}
+
+        # Days used that were not complete: (location_id, kind, day string)
+        self.incomplete_days = set()
+
+        # Concurrency (a single download per location at a time)
+        self.lock = threading.Lock()
+        self.location_locks = {}
+
+        # Statistics
+        self.days_downloaded = 0
+        self.incremental_windows = 0
+        self.full_windows = 0
+
+
+    # -- Batch Mode
+    # -----------------------------------------------
+    def set_pending_span(self, location_id, start_date_string, end_date_string):
+        '''
+        Declares the days (inclusive) that the pending windows of the location cover. When a window of the
+        location misses days, all the missing days of the span are downloaded with it (single streamed query).
+
+        params
+            - location_id(str): The graph id
+            - start_date_string (str): First day of the first pending window in %Y-%m-%d
+            - end_date_string (str): Last day of the last pending window in %Y-%m-%d
+        '''
+
+        with self.lock:
+            self.pending_spans[location_id] = get_dates(start_date_string, end_date_string)
+
+
+    def prefetch_pending_span(self, client, location_id, dataset_id = None):
+        '''
+        Downloads the missing days of the pending span of the location into the cache. Called before the
+        worker processes are forked, with a disk tier shared by them (see GraphDataCache), so each span is
+        downloaded once in total instead of once per worker that computes a window of the location.
+
+        params
+            - client (bigquery.Client)
+            - location_id(str): The graph id
+            - dataset_id (str): Dataset of the location. None to only download the nodes
+
+        returns
+            number of days of the span
+        '''
+
+        dates = self.pending_spans.get(location_id, [])
+        if len(dates) == 0:
+            return(0)
+
+        self.get_day_blocks(client, location_id, dates, gdc.KIND_DAILY_NODES, lambda days: self.download_daily_nodes(client, location_id, days))
+        if dataset_id is not None:
+            self.get_day_blocks(client, location_id, dates, gdc.KIND_DAILY_EDGES, lambda days: self.download_daily_edges(client, location_id, dataset_id, days))
+
+        return(len(dates))
+
+
+    def clear_pending_spans(self):
+        '''
+        Disables the batch mode for every location
+        '''
+
+        with self.lock:
+            self.pending_spans = {}
+
+
+    # -- Windows
+    # -----------------------------------------------
+    def get_window_edgelist(self, client, location_id, dataset_id, start_date_string, end_date_string):
+        '''
+        Gets the compact edgelist of the location between the given dates (inclusive)
+
+        returns
+            pd.DataFrame with the grouped edglist.
+                - id1 (int32): encoded identifier (str without identifier dictionary)
+                - id2 (int32): encoded identifier
+                - weight (num) : number of records of the pair
+                - total_contacts (num) : sum of contacts
+        '''
+
+        fetch_function = lambda dates: self.download_daily_edges(client, location_id, dataset_id, dates)
+
+        return(self.get_window(client, location_id, start_date_string, end_date_string, gdc.KIND_DAILY_EDGES, EDGE_KEYS, EDGE_VALUES, fetch_function))
+
+
+    def get_window_nodes(self, client, location_id, start_date_string, end_date_string):
+        '''
+        Gets the compact nodes of the location between the given dates (inclusive)
+
+        returns
+            pd.DataFrame with the grouped nodes.
+                - identifier (int32): encoded identifier (str without identifier dictionary)
+                - weight (int): the sum of the total_transits
+        '''
+
+        fetch_function = lambda dates: self.download_daily_nodes(client, location_id, dates)
+
+        return(self.get_window(client, location_id, start_date_string, end_date_string, gdc.KIND_DAILY_NODES, NODE_KEYS, NODE_VALUES, fetch_function))
+
+
+    def get_window(self, client, location_id, start_date_string, end_date_string, kind, keys, values, fetch_function):
+        '''
+        Assembles the window from the day blocks. If the previous window of the location shares enough days,
+        it is updated by subtracting the leaving days and adding the entering ones. Windows with incomplete days
+        are not kept for the next one (their shared days would not be updated).
+        '''
+
+        dates = get_dates(start_date_string, end_date_string)
+        state_key = (location_id, kind)
+
+        with self.lock:
+            state = self.window_states.get(state_key)
+
+        df = None
+        if state is not None:
+            previous_dates, previous_df = state
+            set_dates, set_previous_dates = set(dates), set(previous_dates)
+            leaving = [d for d in previous_dates if d not in set_dates]
+            entering = [d for d in dates if d not in set_previous_dates]
+
+            if len(dates) - len(entering) >= min_shared_fraction*len(dates):
+                # Leaving blocks must still be available (they are not downloaded again)
+                leaving_blocks = [self.cache.get_if_present(location_id, d, d, kind) for d in leaving]
+                if all(block is not None for block in leaving_blocks):
+                    entering_blocks = self.get_day_blocks(client, location_id, entering, kind, fetch_function)
+                    df = self.slide(previous_df, leaving_blocks, entering_blocks, keys, values)
+                    self.incremental_windows += 1
+
+        if df is None:
+            blocks = self.get_day_blocks(client, location_id, dates, kind, fetch_function)
+            df = merge_blocks(blocks, keys, values)
+            self.full_windows += 1
+
+        with self.lock:
+            if any((location_id, kind, d) in self.incomplete_days for d in dates):
+                self.window_states.pop(state_key, None)
+            else:
+                self.window_states[state_key] = (dates, df)
+                self.window_states.move_to_end(state_key)
+                while len(self.window_states) > max_window_states:
+                    self.window_states.popitem(last = False)
+
+        return(df.reset_index())
+
+
+    def slide(self, previous_df, leaving_blocks, entering_blocks, keys, values):
+        '''
+        Subtracts the leaving blocks and adds the entering ones to the previous window (indexed by keys)
+        '''
+
+        df = previous_df
+
+        if len(leaving_blocks) > 0:
+            df = df.sub(merge_blocks(leaving_blocks, keys, values), fill_value = 0)
+
+        if len(entering_blocks) > 0:
+            df = df.add(merge_blocks(entering_blocks, keys, values), fill_value = 0)
+
+        # Pairs (or nodes) that are no longer in the window
+        df = df[df.weight > 0]
+
+        return(df.astype(previous_df.dtypes.to_dict()))
+
+
+    # -- Day Blocks
+    # -----------------------------------------------
+    def get_day_blocks(self, client, location_id, dates, kind, fetch_function):
+        '''
+        Gets the day blocks of the location for the given dates, downloading the missing ones in a single query.
+        Only the complete days are stored (see get_complete_dates)
+        '''
+
+        blocks = {d : self.cache.get_if_present(location_id, d, d, kind) for d in dates}
+        if all(block is not None for block in blocks.values()):
+            return([blocks[d] for d in dates])
+
+        with self.get_location_lock(location_id):
+
+            # Another thread might have downloaded them
+            for d in dates:
+                if blocks[d] is None:
+                    blocks[d] = self.cache.get_if_present(location_id, d, d, kind)
+
+            missing = [d for d in dates if blocks[d] is None]
+            if len(missing) > 0:
+
+                # Batch mode: the rest of the missing days of the pending span come in the same query (only
+                # the complete ones, the rest would not be stored)
+                set_missing = set(missing)
+                extra = [d for d in self.pending_spans.get(location_id, []) if d not in set_missing and not self.cache.contains(location_id, d, d, kind)]
+                complete = set(self.get_complete_dates(client, location_id, kind, missing + extra))
+                extra = [d for d in extra if d in complete]
+
+                groups, empty = fetch_function(missing + extra)
+                self.days_downloaded += len(missing) + len(extra)
+
+                for d in missing + extra:
+                    if d in groups:
+                        block = groups[d]
+                    else:
+                        # Days without records are also stored, so they are not downloaded again
+                        block = empty
+
+                    if d in complete:
+                        self.cache.store(location_id, d, d, kind, block)
+                    else:
+                        with self.lock:
+                            self.incomplete_days.add((location_id, kind, d))
+
+                    if d in blocks:
+                        blocks[d] = block
+
+        return([blocks[d] for d in dates])
+
+
+    def get_complete_dates(self, client, location_id, kind, dates):
+        '''
+        Dates that are complete for the location (see parquet_cache.get_complete_dates). The coverage comes from
+        the parquet cache (if any) or from a single query for all the locations (reloaded after
+        parquet_cache.coverage_ttl)
+        '''
+
+        coverage_kind = coverage_kinds[kind]
+
+        if self.parquet_cache is not None:
+            return(pqc.get_complete_dates(dates, self.parquet_cache.get_coverage(client, coverage_kind, location_id)))
+
+        with self.lock:
+            if coverage_kind not in self.coverage or time.time() - self.coverage[coverage_kind][0] > pqc.coverage_ttl:
+                self.coverage[coverage_kind] = (time.time(), pqc.load_coverage(client, coverage_kind))
+
+            max_date = self.coverage[coverage_kind][1].get(location_id)
+
+        return(pqc.get_complete_dates(dates, max_date))
+
+
+    def get_location_lock(self, location_id):
+        '''
+        Returns the lock of the location
+        '''
+        with self.lock:
+            if location_id not in self.location_locks:
+                self.location_locks[location_id] = threading.Lock()
+
+            return(self.location_locks[location_id])
+
+
+    def download_daily_edges(self, client, location_id, dataset_id, dates):
+        '''
+        Downloads the edges of the location grouped by day, for the given dates
+
+        returns
+            dict with the block of each day (see read_by_date)
+            empty block
+        '''
+
+        if self.parquet_cache is not None:
+            df = self.parquet_cache.read_dates(client, pqc.EDGES, location_id, dates, dataset_id = dataset_id, columns = ['date', 'id1', 'id2', 'contacts'])
+            df = self.encode(df)
+            df = df.groupby(['date'] + EDGE_KEYS).agg(weight = ('contacts', 'size'), total_contacts = ('contacts', 'sum')).reset_index()
+
+            return(split_by_date([df], identifier_dictionary = self.identifier_dictionary))
+
+        date_list = ', '.join([f'"{d}"' for d in dates])
+
+        query = f"""
+
+            SELECT CAST(date AS STRING) as date, id1, id2, COUNT(*) as weight, SUM(contacts) as total_contacts
+            FROM grafos-alcaldia-bogota.{dataset_id}.{location_id}
+            WHERE date IN ({date_list})
+            GROUP BY date, id1, id2
+
+        """
+
+        job_config = bigquery.QueryJobConfig(allow_large_results=True)
+        query_job = client.query(query, job_config=job_config)
+
+        return(read_by_date(query_job, identifier_dictionary = self.identifier_dictionary))
+
+
+    def download_daily_nodes(self, client, location_id, dates):
+        '''
+        Downloads the nodes (transits) of the location grouped by day, for the given dates
+
+        returns
+            dict with the block of each day (see read_by_date)
+            empty block
+        '''
+
+        if self.parquet_cache is not None:
+            df = self.parquet_cache.read_dates(client, pqc.TRANSITS, location_id, dates, columns = ['date', 'identifier', 'total_transits'])
+            df = self.encode(df)
+            df = df.groupby(['date'] + NODE_KEYS).total_transits.sum().rename('weight').reset_index()
+
+            return(split_by_date([df], identifier_dictionary = self.identifier_dictionary))
+
+        date_list = ', '.join([f'"{d}"' for d in dates])
+
+        query = f"""
+
+            SELECT CAST(date AS STRING) as date, identifier, SUM(total_transits) as weight
+            FROM grafos-alcaldia-bogota.transits.hourly_transits
+            WHERE location_id = "{location_id}"
+                  AND date IN ({date_list})
+            GROUP BY date, identifier
+
+        """
+
+        job_config = bigquery.QueryJobConfig(allow_large_results=True)
+        query_job = client.query(query, job_config=job_config)
+
+        return(read_by_date(query_job, identifier_dictionary = self.identifier_dictionary))
+
+
+    def encode(self, df):
+        '''
+        Encodes the identifiers of the raw records (before grouping them, so the groupby works over integers)
+        '''
+
+        if self.identifier_dictionary is None:
+            return(df)
+
+        return(self.identifier_dictionary.encode_frame(df))
+
+
+    def get_summary(self):
+        '''
+        Returns a string with the store statistics
+        '''
+        return(f'Days downloaded: {self.days_downloaded}, Incremental windows: {self.incremental_windows}, Full windows: {self.full_windows}')
+
+
+
+def merge_blocks(blocks, keys, values):
+    '''
+    Merges the given day blocks, summing the values of each key
+
+    returns
+        pd.DataFrame indexed by keys
+    '''
+
+    df = pd.concat(blocks, ignore_index = True)
+
+    return(df.groupby(keys)[values].sum())
+
+
+def read_by_date(query_job, identifier_dictionary = None):
+    '''
+    Reads the result of the query batch by batch, splitting each batch by its date column. The whole result is
+    never held as a single frame. The identifiers of each page are encoded with the dictionary (if given).
+
+    returns
+        dict with the block (without the date column) of each day
+        empty block (with the columns and types of the result)
+    '''
+
+    # Arrow record batches when the storage API is available (see utils.query_to_dataframe_iterable)
+    pages = utils.query_to_dataframe_iterable(query_job, page_size = page_size)
+
+    groups, empty = split_by_date(pages, identifier_dictionary = identifier_dictionary)
+
+    if empty is None:
+        empty = query_job.to_dataframe().iloc[:0].drop(columns = ['date'])
+        if identifier_dictionary is not None:
+            empty = identifier_dictionary.encode_frame(empty)
+
+    return(groups, empty)
+
+
+def split_by_date(pages, identifier_dictionary = None):
+    '''
+    Splits the given pages (pd.DataFrame with a date column) by date. The identifiers of each page are encoded
+    with the dictionary (if given).
+
+    returns
+        dict with the block (without the date column) of each day
+        empty block (None if there are no pages)
+    '''
+
+    parts = {}
+    empty = None
+    for df_page in pages:
+
+        if identifier_dictionary is not None:
+            df_page = identifier_dictionary.encode_frame(df_page)
+
+        if empty is None:
+            empty = df_page.iloc[:0].drop(columns = ['date'])
+
+        for d, df_day in df_page.groupby('date'):
+            parts.setdefault(d, []).append(df_day.drop(columns = ['date']))
+
+    groups = {d : pd.concat(parts[d], ignore_index = True) for d in parts}
+
+    return(groups, empty)
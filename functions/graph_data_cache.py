@@ -0,0 +1,398 @@
+# Graph Data Cache
+# Cache shared by all the attributes for the data (nodes, edges, etc...) of a location on a given window.
+# Has an in memory LRU tier (with a memory cap) and an optional on disk tier.
+
+import os
+import time
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+
+# Kinds of data stored
+KIND_COMPACT_NODES = "compact_nodes"
+KIND_COMPACT_EDGES = "compact_edges"
+KIND_DAILY_NODES = "daily_nodes"
+KIND_DAILY_EDGES = "daily_edges"
+# Approximated compact edges (degraded mode), followed by the approximation (see attribute_generic.get_approximation_key)
+KIND_APPROXIMATED_EDGES = "approximated_edges"
+
+# Default memory cap (in bytes)
+default_max_memory_bytes = 4*1024*1024*1024 # 4 GB
+
+# Lock files (disk tier) hold the pid and creation time of their process. The lock of a dead process or older
+# than stale_lock_seconds is taken over
+stale_lock_seconds = 10*60
+lock_poll_seconds = 2
+
+
+def create_lock_file(lock_file_name):
+    '''
+    Creates the lock file with the pid and time of this process
+
+    returns
+        False if it already exists
+    '''
+
+    try:
+        fd = os.open(lock_file_name, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return(False)
+
+    with os.fdopen(fd, 'w') as f:
+        f.write(f'{os.getpid()} {time.time()}')
+
+    return(True)
+
+
+def read_lock_file(lock_file_name):
+    '''
+    Reads the lock file
+
+    returns
+        (pid, creation time), pid is None if it is still being written. None if there is no lock file
+    '''
+
+    try:
+        with open(lock_file_name) as f:
+            content = f.read().split()
+        modified = os.path.getmtime(lock_file_name)
+    except FileNotFoundError:
+        return(None)
+
+    if len(content) != 2:
+        return((None, modified))
+
+    return((int(content[0]), float(content[1])))
+
+
+def is_process_alive(pid):
+    '''
+    Checks if the process exists
+    '''
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return(False)
+    except PermissionError:
+        return(True)
+
+    return(True)
+
+
+def remove_stale_lock_file(lock_file_name, stale_seconds = stale_lock_seconds):
+    '''
+    Removes the lock file if its process is dead or it is older than stale_seconds
+
+    returns
+        True if it was removed
+    '''
+
+    lock = read_lock_file(lock_file_name)
+    if lock is None:
+        return(False)
+
+    pid, created = lock
+    if (pid is None or is_process_alive(pid)) and time.time() - created <= stale_seconds:
+        return(False)
+
+    # Another process might have taken it over meanwhile
+    if read_lock_file(lock_file_name) != lock:
+        return(False)
+
+    try:
+        os.remove(lock_file_name)
+    except FileNotFoundError:
+        return(False)
+
+    return(True)
+
+
+def remove_lock_file(lock_file_name):
+    '''
+    Removes the lock file only if it belongs to this process (it might have been taken over)
+    '''
+
+    lock = read_lock_file(lock_file_name)
+    if lock is not None and lock[0] == os.getpid():
+        os.remove(lock_file_name)
+
+
+class GraphDataCache():
+    '''
+    Cache of pandas DataFrames keyed by (location_id, start_date, end_date, kind).
+
+    - Memory tier: LRU evicted, bounded by max_memory_bytes.
+    - Disk tier (optional): parquet files inside disk_location. Can be shared by several processes.
+
+    Only one fetch is excecuted for a given key at a time. Threads asking for a key that is being
+    fetched wait for the result and processes sharing the disk tier wait for the lock file.
+
+    Frames are always returned as copies, since attributes edit the nodes and edges they receive.
+    '''
+
+    def __init__(self, max_memory_bytes = default_max_memory_bytes, disk_location = None, identifier_dictionary = None):
+        '''
+        params
+            - max_memory_bytes (int): Max bytes to keep in memory
+            - disk_location (str): Folder for the disk tier. None to use only memory
+            - identifier_dictionary (IdentifierDictionary): Dictionary of the encoded identifiers (see
+                identifier_dictionary). The disk tier stores them decoded, since codes are only valid in the process
+        '''
+
+        self.max_memory_bytes = max_memory_bytes
+        self.identifier_dictionary = identifier_dictionary
+        self.set_disk_location(disk_location)
+
+        # Memory tier
+        self.frames = OrderedDict()
+        self.sizes = {}
+        self.memory_bytes = 0
+
+        # Concurrency
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+        # Statistics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+
+    def set_disk_location(self, disk_location):
+        '''
+        Sets the folder of the disk tier (None to use only memory). Must be set before the processes that
+        share it are forked.
+        '''
+
+        self.disk_location = disk_location
+
+        if self.disk_location is not None and not os.path.exists(self.disk_location):
+            os.makedirs(self.disk_location, exist_ok = True)
+
+
+    def get(self, location_id, start_date_string, end_date_string, kind, fetch_function):
+        '''
+        Gets the frame for the given key. If not found, invokes fetch_function (only once for concurrent calls)
+        and stores the result.
+
+        params
+            - location_id (str): The graph id
+            - start_date_string (str): Start date in %Y-%m-%d
+            - end_date_string (str): End date in %Y-%m-%d
+            - kind (str): The kind of data (see KIND_*)
+            - fetch_function (function): Function without parameters that returns the pd.DataFrame
+
+        returns
+            pd.DataFrame (copy of the cached one)
+        '''
+
+        key = (location_id, start_date_string, end_date_string, kind)
+
+        while True:
+
+            with self.lock:
+
+                # Memory Hit
+                if key in self.frames:
+                    self.frames.move_to_end(key)
+                    self.hits += 1
+                    return(self.frames[key].copy())
+
+                # Another thread is fetching
+                event = self.in_flight.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self.in_flight[key] = event
+                    owner = True
+                else:
+                    owner = False
+
+            if not owner:
+                # Waits and retries (if the owner failed, this thread will become the owner)
+                event.wait()
+                continue
+
+            try:
+                df = self.get_from_disk_or_fetch(key, fetch_function)
+                self.put(key, df)
+                return(df.copy())
+            finally:
+                with self.lock:
+                    self.in_flight.pop(key, None)
+                event.set()
+
+
+    def get_if_present(self, location_id, start_date_string, end_date_string, kind):
+        '''
+        Gets the frame for the given key only if it is already stored (memory or disk). Does not fetch.
+
+        returns
+            pd.DataFrame (copy of the cached one) or None
+        '''
+
+        key = (location_id, start_date_string, end_date_string, kind)
+
+        with self.lock:
+            if key in self.frames:
+                self.frames.move_to_end(key)
+                self.hits += 1
+                return(self.frames[key].copy())
+
+        if self.disk_location is not None and os.path.isfile(self.get_file_name(key)):
+            df = self.read_from_disk(self.get_file_name(key))
+            self.disk_hits += 1
+            self.put(key, df)
+            return(df.copy())
+
+        return(None)
+
+
+    def contains(self, location_id, start_date_string, end_date_string, kind):
+        '''
+        Checks if the key is stored (memory or disk), without reading it
+        '''
+
+        key = (location_id, start_date_string, end_date_string, kind)
+
+        with self.lock:
+            if key in self.frames:
+                return(True)
+
+        return(self.disk_location is not None and os.path.isfile(self.get_file_name(key)))
+
+
+    def store(self, location_id, start_date_string, end_date_string, kind, df):
+        '''
+        Stores the given frame (memory and disk tier)
+        '''
+
+        key = (location_id, start_date_string, end_date_string, kind)
+
+        if self.disk_location is not None:
+            file_name = self.get_file_name(key)
+            temp_file_name = file_name + f'.{os.getpid()}.tmp'
+            self.write_to_disk(df, temp_file_name)
+            os.replace(temp_file_name, file_name)
+
+        self.put(key, df)
+
+
+    def put(self, key, df):
+        '''
+        Stores the frame in the memory tier, evicting the least recently used ones if the cap is exceeded.
+        Frames larger than the cap are not kept in memory.
+        '''
+
+        size = int(df.memory_usage(index = True, deep = True).sum())
+
+        with self.lock:
+
+            if key in self.frames:
+                self.memory_bytes -= self.sizes.pop(key)
+                self.frames.pop(key)
+
+            if size > self.max_memory_bytes:
+                return
+
+            self.frames[key] = df
+            self.sizes[key] = size
+            self.memory_bytes += size
+
+            while self.memory_bytes > self.max_memory_bytes:
+                old_key, _ = self.frames.popitem(last = False)
+                self.memory_bytes -= self.sizes.pop(old_key)
+
+
+    def clear(self):
+        '''
+        Clears the memory tier. The disk tier is left untouched.
+        '''
+        with self.lock:
+            self.frames.clear()
+            self.sizes.clear()
+            self.memory_bytes = 0
+
+
+    def get_summary(self):
+        '''
+        Returns a string with the cache statistics
+        '''
+        return(f'Memory hits: {self.hits}, Disk hits: {self.disk_hits}, Misses: {self.misses}, Memory: {round(self.memory_bytes/(1024*1024),1)} MB in {len(self.frames)} frames')
+
+
+    # -- Disk Tier
+    # -----------------------------------------------
+    def get_file_name(self, key):
+        '''
+        Returns the parquet file of the given key
+        '''
+        return(os.path.join(self.disk_location, '__'.join(key) + '.parquet'))
+
+
+    def read_from_disk(self, file_name):
+        '''
+        Reads the frame of the disk tier (encoding its identifiers, see identifier_dictionary)
+        '''
+
+        df = pd.read_parquet(file_name)
+        if self.identifier_dictionary is not None:
+            df = self.identifier_dictionary.encode_frame(df)
+
+        return(df)
+
+
+    def write_to_disk(self, df, file_name):
+        '''
+        Writes the frame to the disk tier (with its identifiers decoded, see identifier_dictionary)
+        '''
+
+        if self.identifier_dictionary is not None:
+            df = self.identifier_dictionary.decode_frame(df)
+
+        df.to_parquet(file_name, index = False)
+
+
+    def get_from_disk_or_fetch(self, key, fetch_function):
+        '''
+        Reads the key from the disk tier. If it does not exists, fetches it and stores it. Uses a lock file
+        so that a single process fetches a given key (see create_lock_file)
+        '''
+
+        if self.disk_location is None:
+            self.misses += 1
+            return(fetch_function())
+
+        file_name = self.get_file_name(key)
+        lock_file_name = file_name + '.lock'
+
+        while True:
+
+            if os.path.isfile(file_name):
+                self.disk_hits += 1
+                return(self.read_from_disk(file_name))
+
+            if create_lock_file(lock_file_name):
+                break
+
+            # Another process is fetching. Its lock is taken over if it died or the lock is stale
+            if remove_stale_lock_file(lock_file_name):
+                print(f'   Lock for {file_name} is stale. Taking it.')
+                continue
+
+            time.sleep(lock_poll_seconds)
+
+        try:
+            self.misses += 1
+            df = fetch_function()
+
+            # Writes and renames, so readers never see partial files
+            temp_file_name = file_name + f'.{os.getpid()}.tmp'
+            self.write_to_disk(df, temp_file_name)
+            os.replace(temp_file_name, file_name)
+
+            return(df)
+
+        finally:
+            remove_lock_file(lock_file_name)
@@ -0,0 +1,153 @@
+# Identifier Dictionary
+# Maps the device identifiers (long strings) to int32 codes right after they are downloaded, so the frames of
+# nodes and edges, the joins, groupbys and graph builds work over integers. Identifiers are decoded back to
+# strings only when the results are written. Codes are only valid inside the process that created them
+# (anything stored outside of it, like the disk tier of the graph data cache, must be decoded).
+
+import threading
+import numpy as np
+import pandas as pd
+
+
+# Columns with identifiers
+identifier_columns = ['identifier', 'id1', 'id2']
+
+# Initial capacity of the decoding array
+initial_capacity = 1024
+
+
+class IdentifierDictionary():
+    '''
+    Dictionary (string <-> int32) of the identifiers of the run. Thread safe.
+    '''
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+
+        # Identifier -> code
+        self.codes = {}
+        # Code -> identifier
+        self.values = np.empty(initial_capacity, dtype = object)
+
+
+    def __len__(self):
+        return(len(self.codes))
+
+
+    def encode(self, identifiers):
+        '''
+        Codes of the identifiers. Identifiers not in the dictionary are added.
+
+        params
+            - identifiers (np.array): The identifiers (strings)
+
+        returns
+            np.array int32
+        '''
+
+        positions, uniques = pd.factorize(np.asarray(identifiers, dtype = object))
+
+        with self.lock:
+
+            mapping = np.empty(len(uniques), dtype = np.int32)
+            for i, identifier in enumerate(uniques):
+                code = self.codes.get(identifier)
+                if code is None:
+                    code = len(self.codes)
+                    self.codes[identifier] = code
+                    self.append_value(code, identifier)
+
+                mapping[i] = code
+
+        if len(uniques) == 0:
+            return(np.empty(len(positions), dtype = np.int32))
+
+        return(mapping[positions])
+
+
+    def lookup(self, identifiers):
+        '''
+        Codes of the identifiers, without adding them (-1 for the identifiers that are not in the dictionary)
+
+        returns
+            np.array int32
+        '''
+
+        positions, uniques = pd.factorize(np.asarray(identifiers, dtype = object))
+        mapping = np.array([self.codes.get(identifier, -1) for identifier in uniques], dtype = np.int32)
+
+        if len(uniques) == 0:
+            return(np.empty(len(positions), dtype = np.int32))
+
+        return(mapping[positions])
+
+
+    def decode(self, codes):
+        '''
+        Identifiers (strings) of the codes
+
+        returns
+            np.array object
+        '''
+        return(self.values[np.asarray(codes, dtype = np.int64)])
+
+
+    def append_value(self, code, identifier):
+        '''
+        Stores the identifier of the code, growing the decoding array if needed (called with the lock)
+        '''
+
+        if code >= self.values.shape[0]:
+            values = np.empty(2*self.values.shape[0], dtype = object)
+            values[:self.values.shape[0]] = self.values
+            self.values = values
+
+        self.values[code] = identifier
+
+
+    def encode_frame(self, df):
+        '''
+        Encodes (in place) the identifier columns of the frame (see identifier_columns) that are not encoded
+
+        returns
+            pd.DataFrame
+        '''
+
+        for col in identifier_columns:
+            if col in df.columns and not is_encoded(df[col]):
+                df[col] = self.encode(df[col].values)
+
+        return(df)
+
+
+    def decode_frame(self, df):
+        '''
+        Copy of the frame with its encoded identifier columns decoded
+
+        returns
+            pd.DataFrame
+        '''
+
+        columns = [col for col in identifier_columns if col in df.columns and is_encoded(df[col])]
+        if len(columns) == 0:
+            return(df)
+
+        df = df.copy()
+        for col in columns:
+            df[col] = self.decode(df[col].values)
+
+        return(df)
+
+
+
+def is_encoded(series):
+    '''
+    Checks if the column holds codes (integers) instead of identifiers
+    '''
+    return(pd.api.types.is_integer_dtype(series.dtype))
+
+
+
+# Shared by the process
+identifier_dictionary = IdentifierDictionary()
@@ -0,0 +1,78 @@
+# PageRank Engine
+# Power iteration PageRank over the sparse adjacency matrix (see utils.build_csr). Every window starts from
+# its reset vector: the error decays at the same rate from any start (damping times the second eigenvalue), and
+# the vector of the previous window of the location is not closer to the solution than the reset vector.
+
+import numpy as np
+
+
+# Defaults
+default_damping = 0.85
+default_tol = 1e-10 # L1 distance between consecutive iterations
+default_max_iter = 1000
+
+
+def pagerank(A, damping = default_damping, reset = None, tol = default_tol, max_iter = default_max_iter):
+    '''
+    Computes the PageRank of the undirected graph with the given (symmetric) adjacency matrix by power iteration.
+    Dangling nodes (no edges) jump according to the reset vector.
+
+    Several reset vectors can be given as the columns of a (n x c) matrix. They are iterated together as
+    a dense block (one sparse product per iteration).
+
+    params
+        - A (sp.csr_matrix): Symmetric adjacency matrix (n x n)
+        - damping (float): Damping factor
+        - reset (np.array): Reset (personalization) vector (n) or vectors (n x c). None for uniform
+        - tol (float): Tolerance (L1 distance between consecutive iterations, for every column)
+        - max_iter (int): Max number of iterations
+
+    returns
+        x (np.array): the PageRank of each node (each column sums 1)
+        iterations (int): the number of iterations excecuted
+    '''
+
+    n = A.shape[0]
+    one_column = reset is None or np.ndim(reset) == 1
+
+    if n == 0:
+        return(np.zeros(0) if one_column else np.zeros((0, np.shape(reset)[1])), 0)
+
+    # Reset vectors (as columns)
+    if reset is None:
+        r = np.full((n, 1), 1/n)
+    else:
+        r = np.asarray(reset, dtype = np.float64).reshape(n, -1).copy()
+        totals = r.sum(axis = 0)
+        r[:, totals <= 0] = 1/n
+        r = r/r.sum(axis = 0)
+
+    # Starts from the reset vectors
+    x = r.copy()
+
+    strength = np.asarray(A.sum(axis = 1)).ravel()
+    dangling = strength == 0
+    inv_strength = np.zeros(n)
+    inv_strength[~dangling] = 1/strength[~dangling]
+
+    iterations = 0
+    while iterations < max_iter:
+
+        iterations += 1
+
+        # A is symmetric, so A^T (D^-1 x) = A (D^-1 x)
+        y = damping*(A @ (x*inv_strength[:, None]))
+        y += (damping*x[dangling].sum(axis = 0) + (1 - damping))*r
+
+        error = np.abs(y - x).sum(axis = 0).max()
+        x = y
+
+        if error < tol:
+            break
+
+    x = x/x.sum(axis = 0)
+
+    if one_column:
+        x = x[:, 0]
+
+    return(x, iterations)
@@ -0,0 +1,615 @@
+# Parquet Cache
+# Local columnar cache of the per day edges (contacts) and transits of each location. Each (kind, location, date)
+# is a parquet file (sorted by hour, so reads filtered by hour skip row groups) and a manifest keeps the
+# synced dates, their size and last access. Syncs only download the dates that are missing (a single query per
+# sync) and the least recently used dates are evicted when the cache exceeds its size.
+#
+# Only complete dates are cached: before today and at or before the last date loaded for the location (its
+# coverage), since the tables of the latest dates may still be loading. Later dates are read but not stored.
+#
+# Shared by the attribute engine (see daily_aggregates), the figure generation and the intervention scripts, so
+# it does not import any other module of the repository.
+
+import os
+import json
+import time
+import tempfile
+import threading
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.cloud import bigquery
+
+
+# Kinds
+EDGES = 'edges'
+TRANSITS = 'transits'
+
+# Cached columns of each kind
+kind_columns = {}
+kind_columns[EDGES] = ['id1', 'id2', 'date', 'hour', 'minute', 'contacts', 'lat', 'lon']
+kind_columns[TRANSITS] = ['identifier', 'date', 'hour', 'total_transits']
+
+# Defaults
+default_location = os.path.join(tempfile.gettempdir(), 'parquet_cache')
+default_max_bytes = 50*1024*1024*1024 # 50 GB
+
+# Rows per row group (row groups are the unit skipped by the hour filters)
+row_group_size = 100000
+
+# The manifest lock file holds the pid and creation time of its process. The lock of a dead process or older
+# than stale_lock_seconds is taken over
+stale_lock_seconds = 5*60
+lock_poll_seconds = 0.5
+
+# Seconds before the coverage of the locations is reloaded
+coverage_ttl = 60*60 # 1 hour
+
+# Last access times are written to the manifest in batches: after this many dates or seconds (and before evicting)
+access_flush_size = 100
+access_flush_seconds = 60
+
+date_format = '%Y-%m-%d'
+
+
+# Queries
+# ---------
+edges_sql = """
+
+        SELECT id1, id2, CAST(date AS STRING) as date, hour, minute, contacts, lat, lon
+        FROM grafos-alcaldia-bogota.{dataset_id}.{location_id}
+        WHERE date IN ({dates})
+
+"""
+
+transits_sql = """
+
+        SELECT identifier, CAST(date AS STRING) as date, hour, total_transits
+        FROM grafos-alcaldia-bogota.transits.hourly_transits
+        WHERE location_id = "{location_id}"
+            AND date IN ({dates})
+
+"""
+
+# Last date loaded of each location (its coverage)
+coverage_sql = {}
+coverage_sql[EDGES] = """
+
+        SELECT location_id, CAST(MAX(date) AS STRING) as max_date
+        FROM grafos-alcaldia-bogota.graph_attributes.graph_sizes
+        GROUP BY location_id
+
+"""
+
+coverage_sql[TRANSITS] = """
+
+        SELECT location_id, CAST(MAX(date) AS STRING) as max_date
+        FROM grafos-alcaldia-bogota.transits.hourly_transits
+        GROUP BY location_id
+
+"""
+
+
+def default_fetch_function(client, query):
+    '''
+    Runs the query and returns its result as an iterable of pandas DataFrames
+    '''
+
+    job_config = bigquery.QueryJobConfig(allow_large_results = True)
+    rows = client.query(query, job_config = job_config).result()
+
+    if hasattr(rows, 'to_dataframe_iterable'):
+        return(rows.to_dataframe_iterable())
+
+    return([rows.to_dataframe()])
+
+
+def read_lock_file(lock_file_name):
+    '''
+    Reads the lock file
+
+    returns
+        (pid, creation time), pid is None if it is still being written. None if there is no lock file
+    '''
+
+    try:
+        with open(lock_file_name) as f:
+            content = f.read().split()
+        modified = os.path.getmtime(lock_file_name)
+    except FileNotFoundError:
+        return(None)
+
+    if len(content) != 2:
+        return((None, modified))
+
+    return((int(content[0]), float(content[1])))
+
+
+def is_stale_lock(lock):
+    '''
+    Checks if the lock (see read_lock_file) belongs to a dead process or is older than stale_lock_seconds
+    '''
+
+    pid, created = lock
+    if time.time() - created > stale_lock_seconds:
+        return(True)
+
+    if pid is None:
+        return(False)
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return(True)
+    except PermissionError:
+        return(False)
+
+    return(False)
+
+
+def load_coverage(client, kind, fetch_function = default_fetch_function):
+    '''
+    Last date loaded of each location (single query for all the locations)
+
+    returns
+        dict location_id -> max date (str, %Y-%m-%d)
+    '''
+
+    df = pd.concat(list(fetch_function(client, coverage_sql[kind])) + [pd.DataFrame(columns = ['location_id', 'max_date'])], ignore_index = True)
+    df = df.dropna()
+
+    return(dict(zip(df.location_id.values, df.max_date.astype(str).values)))
+
+
+def get_complete_dates(dates, max_date):
+    '''
+    Dates that are complete: before today and at or before the coverage (max_date) of the location. None
+    coverage means nothing is loaded
+    '''
+
+    if max_date is None:
+        return([])
+
+    today = datetime.now().strftime(date_format)
+
+    return([d for d in dates if d < today and d <= max_date])
+
+
+def get_dates(start_date_string, end_date_string):
+    '''
+    Dates (strings) between the given dates (inclusive)
+    '''
+    return([d.strftime(date_format) for d in pd.date_range(start_date_string, end_date_string, freq = 'D')])
+
+
+class ParquetCache():
+    '''
+    Local parquet cache of the per day edges and transits of the locations
+    '''
+
+    def __init__(self, location = default_location, max_bytes = default_max_bytes, fetch_function = default_fetch_function):
+        '''
+        params
+            - location (str): Folder of the cache
+            - max_bytes (int): Max size of the cache (the least recently read dates are evicted)
+            - fetch_function (function): Receives the client and the query and returns an iterable of
+                pd.DataFrame (for example, read through Arrow, see utils.query_to_dataframe_iterable)
+        '''
+
+        self.location = location
+        self.max_bytes = max_bytes
+        self.fetch_function = fetch_function
+
+        os.makedirs(self.location, exist_ok = True)
+        self.manifest_file = os.path.join(self.location, 'manifest.json')
+
+        self.lock = threading.RLock()
+
+        # kind -> (load time, location_id -> last loaded date)
+        self.coverage = {}
+
+        # partition key -> last access not yet written to the manifest (see flush_access)
+        self.pending_access = {}
+        self.last_access_flush = time.time()
+
+        # Statistics
+        self.dates_downloaded = 0
+        self.dates_read = 0
+        self.dates_evicted = 0
+
+
+    # -- Manifest
+    # -----------------------------------------------
+    def get_partition_key(self, kind, location_id, date_string):
+        return(f'{kind}/{location_id}/{date_string}')
+
+
+    def get_file_name(self, kind, location_id, date_string):
+        '''
+        Returns the parquet file of the date
+        '''
+        return(os.path.join(self.location, kind, location_id, f'date={date_string}.parquet'))
+
+
+    def load_manifest(self):
+        '''
+        Reads the manifest (partition key -> dict with kind, location_id, date, rows, bytes, synced_at and last_access)
+        '''
+
+        if not os.path.isfile(self.manifest_file):
+            return({})
+
+        with open(self.manifest_file) as f:
+            return(json.load(f)['partitions'])
+
+
+    def update_manifest(self, update_function):
+        '''
+        Applies the function to the manifest (partitions dict, edited in place) and writes it. Uses a lock file,
+        so processes sharing the cache do not lose each other's updates (see read_lock_file).
+        '''
+
+        lock_file_name = self.manifest_file + '.lock'
+
+        with self.lock:
+
+            while True:
+                try:
+                    fd = os.open(lock_file_name, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                except FileExistsError:
+                    lock = read_lock_file(lock_file_name)
+                    if lock is not None and is_stale_lock(lock) and read_lock_file(lock_file_name) == lock:
+                        print(f'   Lock for {self.manifest_file} is stale. Taking it.')
+                        try:
+                            os.remove(lock_file_name)
+                        except FileNotFoundError:
+                            pass
+                    else:
+                        time.sleep(lock_poll_seconds)
+                    continue
+
+                with os.fdopen(fd, 'w') as f:
+                    f.write(f'{os.getpid()} {time.time()}')
+                break
+
+            try:
+                partitions = self.load_manifest()
+                result = update_function(partitions)
+
+                temp_file_name = self.manifest_file + f'.{os.getpid()}.tmp'
+                with open(temp_file_name, 'w') as f:
+                    json.dump({'version': 1, 'partitions': partitions}, f)
+                os.replace(temp_file_name, self.manifest_file)
+
+                return(result)
+
+            finally:
+                # Only if it was not taken over by another process
+                lock = read_lock_file(lock_file_name)
+                if lock is not None and lock[0] == os.getpid():
+                    os.remove(lock_file_name)
+
+
+    # -- Sync
+    # -----------------------------------------------
+    def get_coverage(self, client, kind, location_id):
+        '''
+        Last date loaded for the location (single query for all the locations, reloaded after coverage_ttl)
+
+        returns
+            str (%Y-%m-%d) or None if nothing is loaded
+        '''
+
+        with self.lock:
+
+            if kind not in self.coverage or time.time() - self.coverage[kind][0] > coverage_ttl:
+                self.coverage[kind] = (time.time(), load_coverage(client, kind, self.fetch_function))
+
+            return(self.coverage[kind][1].get(location_id))
+
+
+    def get_missing_dates(self, client, kind, location_id, dates):
+        '''
+        Dates that are not in the cache and can be cached: complete dates (before today and at or before the
+        coverage of the location, see get_coverage)
+        '''
+
+        partitions = self.load_manifest()
+        today = datetime.now().strftime(date_format)
+
+        missing = [d for d in dates if d < today and self.get_partition_key(kind, location_id, d) not in partitions]
+        if len(missing) == 0:
+            return(missing)
+
+        return(get_complete_dates(missing, self.get_coverage(client, kind, location_id)))
+
+
+    def sync(self, client, kind, location_id, dates, dataset_id = None):
+        '''
+        Downloads (single query) the given dates of the location that are not in the cache
+
+        params
+            - client (bigquery.Client)
+            - kind (str): EDGES or TRANSITS
+            - location_id (str): The location
+            - dates (list): Dates in %Y-%m-%d
+            - dataset_id (str): Dataset of the location (required for the edges)
+
+        returns
+            number of downloaded dates
+        '''
+
+        missing = self.get_missing_dates(client, kind, location_id, dates)
+        if len(missing) == 0:
+            return(0)
+
+        frames = {}
+        for df_day, d in self.download(client, kind, location_id, missing, dataset_id):
+            frames.setdefault(d, []).append(df_day)
+
+        entries = {}
+        for d in missing:
+            df = pd.concat(frames[d], ignore_index = True) if d in frames else pd.DataFrame(columns = kind_columns[kind])
+            entries[self.get_partition_key(kind, location_id, d)] = self.write_date(kind, location_id, d, df)
+
+        def add_entries(partitions):
+            partitions.update(entries)
+
+        self.update_manifest(add_entries)
+        self.dates_downloaded += len(missing)
+
+        self.evict()
+
+        return(len(missing))
+
+
+    def download(self, client, kind, location_id, dates, dataset_id = None):
+        '''
+        Downloads the dates of the location (see sync)
+
+        returns
+            iterator of (pd.DataFrame, date)
+        '''
+
+        date_list = ', '.join([f'"{d}"' for d in dates])
+
+        if kind == EDGES:
+            if dataset_id is None:
+                raise ValueError(f'The dataset of {location_id} is required to download its edges')
+            query = edges_sql.format(dataset_id = dataset_id, location_id = location_id, dates = date_list)
+        elif kind == TRANSITS:
+            query = transits_sql.format(location_id = location_id, dates = date_list)
+        else:
+            raise ValueError(f'Kind: {kind} not supported')
+
+        for df_page in self.fetch_function(client, query):
+            df_page['date'] = df_page['date'].astype(str)
+            for d, df_day in df_page.groupby('date'):
+                yield(df_day, d)
+
+
+    def write_date(self, kind, location_id, date_string, df):
+        '''
+        Writes the date (sorted by hour) and returns its manifest entry
+        '''
+
+        file_name = self.get_file_name(kind, location_id, date_string)
+        os.makedirs(os.path.dirname(file_name), exist_ok = True)
+
+        df = df[kind_columns[kind]].sort_values('hour', kind = 'mergesort').reset_index(drop = True)
+
+        # Writes and renames, so readers never see partial files
+        temp_file_name = file_name + f'.{os.getpid()}.tmp'
+        pq.write_table(pa.Table.from_pandas(df, preserve_index = False), temp_file_name, row_group_size = row_group_size)
+        os.replace(temp_file_name, file_name)
+
+        now = time.time()
+        return({'kind': kind, 'location_id': location_id, 'date': date_string, 'rows': int(df.shape[0]),
+                'bytes': os.path.getsize(file_name), 'synced_at': now, 'last_access': now})
+
+
+    # -- Read
+    # -----------------------------------------------
+    def read(self, client, kind, location_id, start_date_string, end_date_string, dataset_id = None, columns = None, hours = None):
+        '''
+        Reads the dates (inclusive) of the location, syncing the missing ones first
+
+        params
+            - client (bigquery.Client)
+            - kind (str): EDGES or TRANSITS
+            - location_id (str): The location
+            - start_date_string (str): Start date in %Y-%m-%d
+            - end_date_string (str): End date in %Y-%m-%d
+            - dataset_id (str): Dataset of the location (required for the edges)
+            - columns (list): Columns to read. None for all (see kind_columns)
+            - hours (list): Only reads these hours (row groups of other hours are skipped). None for all
+
+        returns
+            pd.DataFrame
+        '''
+        return(self.read_dates(client, kind, location_id, get_dates(start_date_string, end_date_string), dataset_id = dataset_id, columns = columns, hours = hours))
+
+
+    def read_dates(self, client, kind, location_id, dates, dataset_id = None, columns = None, hours = None):
+        '''
+        Reads the given dates of the location (see read). Dates that can't be cached (see get_missing_dates)
+        are downloaded and not stored.
+        '''
+
+        self.sync(client, kind, location_id, dates, dataset_id = dataset_id)
+
+        read_columns = kind_columns[kind] if columns is None else columns
+        filters = None if hours is None else [('hour', 'in', [int(h) for h in hours])]
+
+        partitions = self.load_manifest()
+
+        tables = []
+        read_keys = []
+        uncached = []
+        lost = []
+        for d in dates:
+            key = self.get_partition_key(kind, location_id, d)
+            if key not in partitions:
+                uncached.append(d)
+                continue
+
+            if partitions[key]['rows'] > 0:
+                file_name = self.get_file_name(kind, location_id, d)
+                try:
+                    tables.append(pq.read_table(file_name, columns = read_columns, filters = filters))
+                except OSError:
+                    # Evicted by another process after the manifest was read. Downloaded as a not cached date
+                    if os.path.isfile(file_name):
+                        raise
+                    uncached.append(d)
+                    lost.append(key)
+                    continue
+
+            read_keys.append(key)
+
+        # Entries left without file are removed, so the next sync downloads them again
+        if len(lost) > 0:
+            def remove_lost(partitions):
+                for key in lost:
+                    p = partitions.get(key)
+                    if p is not None and not os.path.isfile(self.get_file_name(p['kind'], p['location_id'], p['date'])):
+                        partitions.pop(key)
+
+            self.update_manifest(remove_lost)
+
+        if len(tables) > 0:
+            df = pa.concat_tables(tables).to_pandas()
+        else:
+            df = pd.DataFrame(columns = read_columns)
+
+        # Not cacheable dates
+        if len(uncached) > 0:
+            df_uncached = pd.concat([df_day for df_day, _ in self.download(client, kind, location_id, uncached, dataset_id)] + [pd.DataFrame(columns = kind_columns[kind])], ignore_index = True)
+            if hours is not None:
+                df_uncached = df_uncached[df_uncached.hour.isin(hours)]
+            df = pd.concat([df, df_uncached[read_columns]], ignore_index = True)
+
+        # Last access (for the eviction), written in batches
+        if len(read_keys) > 0:
+            now = time.time()
+            with self.lock:
+                for key in read_keys:
+                    self.pending_access[key] = now
+                flush = len(self.pending_access) >= access_flush_size or now - self.last_access_flush > access_flush_seconds
+
+            if flush:
+                self.flush_access()
+
+        self.dates_read += len(read_keys)
+
+        return(df)
+
+
+    def flush_access(self):
+        '''
+        Writes the pending last access times to the manifest (see read_dates)
+        '''
+
+        with self.lock:
+            pending = self.pending_access
+            self.pending_access = {}
+            self.last_access_flush = time.time()
+
+        if len(pending) == 0:
+            return
+
+        def touch(partitions):
+            for key, last_access in pending.items():
+                if key in partitions:
+                    partitions[key]['last_access'] = max(partitions[key]['last_access'], last_access)
+
+        self.update_manifest(touch)
+
+
+    # -- Eviction
+    # -----------------------------------------------
+    def remove_date(self, partition):
+        '''
+        Removes the file of the partition (manifest entry). It may have been removed by another process
+        '''
+
+        try:
+            os.remove(self.get_file_name(partition['kind'], partition['location_id'], partition['date']))
+        except FileNotFoundError:
+            pass
+
+
+    def invalidate(self, kind = None, location_id = None, dates = None):
+        '''
+        Removes the given dates from the cache, so they are downloaded again on the next read (for example,
+        after the tables of a location are reloaded)
+
+        params
+            - kind (str): EDGES or TRANSITS. None for both
+            - location_id (str): The location. None for all
+            - dates (list): Dates in %Y-%m-%d. None for all
+
+        returns
+            number of removed dates
+        '''
+
+        dates = None if dates is None else set(dates)
+
+        def remove_matching(partitions):
+
+            keys = [key for key, p in partitions.items() if (kind is None or p['kind'] == kind)
+                    and (location_id is None or p['location_id'] == location_id)
+                    and (dates is None or p['date'] in dates)]
+
+            for key in keys:
+                self.remove_date(partitions.pop(key))
+
+            return(len(keys))
+
+        # The coverage may have changed too
+        with self.lock:
+            self.coverage = {}
+
+        return(self.update_manifest(remove_matching))
+
+
+    def evict(self):
+        '''
+        Removes the least recently read dates until the cache fits in max_bytes
+        '''
+
+        self.flush_access()
+
+        def remove_oldest(partitions):
+
+            total_bytes = sum([p['bytes'] for p in partitions.values()])
+            if total_bytes <= self.max_bytes:
+                return(0)
+
+            evicted = 0
+            for key in sorted(partitions, key = lambda k: partitions[k]['last_access']):
+                if total_bytes <= self.max_bytes:
+                    break
+
+                p = partitions.pop(key)
+                self.remove_date(p)
+
+                total_bytes -= p['bytes']
+                evicted += 1
+
+            return(evicted)
+
+        self.dates_evicted += self.update_manifest(remove_oldest)
+
+
+    def get_summary(self):
+        '''
+        Returns a string with the statistics (writes the pending last access times)
+        '''
+
+        self.flush_access()
+        partitions = self.load_manifest()
+        total_bytes = sum([p['bytes'] for p in partitions.values()])
+
+        return(f'{len(partitions)} dates cached ({round(total_bytes/(1024*1024),1)} MB), {self.dates_downloaded} downloaded, {self.dates_read} read, {self.dates_evicted} evicted')
@@ -0,0 +1,285 @@
+# Power Law Engine
+# Power law test over a discrete (integer) distribution, for example the degrees of the nodes (Clauset,
+# Shalizi & Newman). The power law, exponential (geometric) and lognormal models are fitted to the tail
+# (values >= xmin) by discrete maximum likelihood (closed form when it exists), and compared through their
+# KS statistics. Everything is vectorized over the distinct values of the distribution.
+#
+# The p value of the power law is the asymptotic KS one over the tail by default. It is optimistic (too large),
+# since alpha and xmin are fitted on the same data. The semi-parametric bootstrap (Clauset et al., section 4.1)
+# corrects it but is opt in (see default_num_bootstrap): each synthetic set (empirical body below xmin, fitted
+# power law above it) is refitted, so it costs num_bootstrap times the fit.
+
+import numpy as np
+from scipy.special import zeta, ndtr
+from scipy.stats import kstwo
+from scipy.optimize import minimize_scalar, minimize
+
+
+# Models
+POWERLAW = 'powerlaw'
+EXPONENTIAL = 'exponential'
+LOGNORMAL = 'lognormal'
+
+# Max number of xmin candidates (distinct values, evenly spaced in rank) scanned
+default_max_xmin_candidates = 100
+# Min number of values in the tail
+default_min_tail = 50
+# Bootstrap of the p value (synthetic sets and xmin candidates scanned on each one). 0 for the asymptotic p value
+default_num_bootstrap = 0
+default_bootstrap_xmin_candidates = 20
+bootstrap_seed = 42
+# Bounds of the exponent
+min_alpha = 1.01
+max_alpha = 10
+
+
+def get_support(values):
+    '''
+    Distinct values and the empirical CDF at each one
+
+    returns
+        x (np.array): sorted distinct values
+        ecdf (np.array): fraction of values <= x
+    '''
+
+    x, counts = np.unique(values, return_counts = True)
+    return(x, np.cumsum(counts)/counts.sum())
+
+
+def fit_powerlaw(values, xmin):
+    '''
+    Discrete maximum likelihood exponent of the power law p(x) ~ x^(-alpha) for x >= xmin, over the exact
+    likelihood (Hurwitz zeta). The negative log likelihood is convex in alpha, so the bounded search over
+    [min_alpha, max_alpha] finds its minimum (the bound itself if the optimum is outside)
+
+    returns
+        alpha (float)
+    '''
+
+    n = values.shape[0]
+    sum_log = np.log(values).sum()
+
+    def negative_log_likelihood(alpha):
+        return(n*np.log(zeta(alpha, xmin)) + alpha*sum_log)
+
+    result = minimize_scalar(negative_log_likelihood, bounds = (min_alpha, max_alpha), method = 'bounded', options = {'xatol': 1e-8})
+
+    return(float(result.x))
+
+
+def powerlaw_cdf(x, alpha, xmin):
+    '''
+    CDF of the discrete power law at the (integer) values x
+    '''
+    return(1 - zeta(alpha, x + 1)/zeta(alpha, xmin))
+
+
+def fit_exponential(values, xmin):
+    '''
+    Closed form maximum likelihood of the discrete exponential (geometric) p(x) ~ q^(x - xmin) for x >= xmin
+
+    returns
+        q (float)
+    '''
+
+    m = values.mean() - xmin
+    return(m/(1 + m))
+
+
+def exponential_cdf(x, q, xmin):
+    '''
+    CDF of the discrete exponential at the (integer) values x
+    '''
+    return(1 - q**(x - xmin + 1))
+
+
+def fit_lognormal(values, xmin):
+    '''
+    Maximum likelihood of the lognormal discretized (continuity correction) and truncated at xmin. Starts
+    from the closed form estimators (mean and standard deviation of the logarithm). If Nelder-Mead does not
+    converge, it is refined with L-BFGS-B and a ValueError is raised if that does not converge either.
+
+    returns
+        mu (float)
+        sigma (float)
+    '''
+
+    x, counts = np.unique(values, return_counts = True)
+
+    log_values = np.log(values)
+    start = np.array([log_values.mean(), np.log(max(log_values.std(), 1e-3))])
+
+    def negative_log_likelihood(params):
+        mu, sigma = params[0], np.exp(params[1])
+        lower = ndtr((np.log(xmin - 0.5) - mu)/sigma)
+        mass = ndtr((np.log(x + 0.5) - mu)/sigma) - ndtr((np.log(x - 0.5) - mu)/sigma)
+        return(-1*(counts*np.log(np.maximum(mass, 1e-300))).sum() + counts.sum()*np.log(max(1 - lower, 1e-300)))
+
+    result = minimize(negative_log_likelihood, start, method = 'Nelder-Mead', options = {'maxiter': 2000})
+    if not result.success:
+        result = minimize(negative_log_likelihood, result.x, method = 'L-BFGS-B')
+        if not result.success:
+            raise ValueError(f'The lognormal fit did not converge: {result.message}')
+
+    return(float(result.x[0]), float(np.exp(result.x[1])))
+
+
+def lognormal_cdf(x, mu, sigma, xmin):
+    '''
+    CDF of the lognormal discretized (continuity correction) and truncated at xmin, at the (integer) values x
+    '''
+
+    lower = ndtr((np.log(xmin - 0.5) - mu)/sigma)
+    upper = ndtr((np.log(x + 0.5) - mu)/sigma)
+
+    return((upper - lower)/max(1 - lower, 1e-300))
+
+
+def ks_statistic(ecdf, cdf):
+    '''
+    KS statistic of a discrete distribution, given the empirical and model CDF at its distinct values
+    '''
+    return(float(np.abs(ecdf - cdf).max()))
+
+
+def select_xmin(values, max_candidates = default_max_xmin_candidates, min_tail = default_min_tail):
+    '''
+    Selects xmin as the value that minimizes the KS statistic of the power law fitted to the tail
+    (Clauset et al.). At most max_candidates distinct values are scanned, always leaving min_tail values
+    in the tail.
+
+    params
+        - values (np.array): Positive integer values
+
+    returns
+        xmin (int)
+    '''
+
+    values = np.sort(values)
+    x, counts = np.unique(values, return_counts = True)
+
+    # Number of values >= each distinct value
+    tail_sizes = values.shape[0] - np.concatenate(([0], np.cumsum(counts)[:-1]))
+    candidates = x[tail_sizes >= min(min_tail, values.shape[0])]
+
+    if candidates.shape[0] > max_candidates:
+        candidates = candidates[np.unique(np.linspace(0, candidates.shape[0] - 1, max_candidates).astype(int))]
+
+    best_xmin, best_ks = x[0], np.inf
+    for xmin in candidates:
+        tail = values[np.searchsorted(values, xmin):]
+        alpha = fit_powerlaw(tail, xmin)
+        support, ecdf = get_support(tail)
+        ks = ks_statistic(ecdf, powerlaw_cdf(support, alpha, xmin))
+        if ks < best_ks:
+            best_xmin, best_ks = xmin, ks
+
+    return(int(best_xmin))
+
+
+def sample_powerlaw(alpha, xmin, size, rng):
+    '''
+    Samples the discrete power law for x >= xmin (rounded continuous inverse transform, Clauset et al. D.6)
+    '''
+
+    r = rng.random(size)
+    return(np.floor((xmin - 0.5)*(1 - r)**(-1/(alpha - 1)) + 0.5))
+
+
+def bootstrap_p_value(values, ks, alpha, xmin, num_bootstrap = default_num_bootstrap, max_candidates = default_bootstrap_xmin_candidates, seed = bootstrap_seed):
+    '''
+    Semi-parametric bootstrap of the p value of the power law (Clauset et al.). Each synthetic set has the
+    size of values: with probability n_tail/n a value is drawn from the fitted power law, otherwise from the
+    empirical values below xmin. xmin and alpha are fitted again on each set, so the p value accounts for
+    both estimations.
+
+    params
+        - values (np.array): Positive integer values
+        - ks (float): KS statistic of the power law fitted to values
+        - alpha (float): Fitted exponent
+        - xmin (int): Selected xmin
+
+    returns
+        p_value (float): fraction of the synthetic sets with a KS statistic >= ks
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    body = values[values < xmin]
+    n = values.shape[0]
+    tail_probability = (n - body.shape[0])/n
+
+    larger = 0
+    for _ in range(num_bootstrap):
+
+        num_tail = rng.binomial(n, tail_probability)
+        synthetic = sample_powerlaw(alpha, xmin, num_tail, rng)
+        if body.shape[0] > 0:
+            synthetic = np.concatenate((rng.choice(body, n - num_tail), synthetic))
+
+        synthetic_xmin = select_xmin(synthetic, max_candidates = max_candidates)
+        tail = synthetic[synthetic >= synthetic_xmin]
+        synthetic_alpha = fit_powerlaw(tail, synthetic_xmin)
+        support, ecdf = get_support(tail)
+
+        if ks_statistic(ecdf, powerlaw_cdf(support, synthetic_alpha, synthetic_xmin)) >= ks:
+            larger += 1
+
+    return(larger/num_bootstrap)
+
+
+def powerlaw_test(values, xmin = None, num_bootstrap = default_num_bootstrap):
+    '''
+    Fits the power law, exponential and lognormal models to the tail of the distribution and compares them.
+
+    params
+        - values (np.array): Non negative integer values (for example, degrees). Zeros are excluded
+        - xmin (int): Start of the tail. None to select it (see select_xmin)
+        - num_bootstrap (int): Synthetic sets of the p value (see bootstrap_p_value). 0 for the asymptotic
+            KS p value over the tail
+
+    returns
+        dict with:
+            - is_powerlaw (int): 1 if the power law has the smallest KS statistic
+            - ks (float): KS statistic of the power law
+            - p_value (float): p value of the KS statistic of the power law
+            - alpha (float): exponent of the power law
+            - xmin (int)
+            - ks_<model> (float): KS statistic of each model
+        None if there are no positive values
+    '''
+
+    values = np.asarray(values, dtype = np.float64)
+    values = np.round(values[values > 0])
+
+    if values.shape[0] == 0:
+        return(None)
+
+    if xmin is None:
+        xmin = select_xmin(values)
+
+    tail = values[values >= xmin]
+    support, ecdf = get_support(tail)
+
+    alpha = fit_powerlaw(tail, xmin)
+    q = fit_exponential(tail, xmin)
+    mu, sigma = fit_lognormal(tail, xmin)
+
+    ks = {}
+    ks[POWERLAW] = ks_statistic(ecdf, powerlaw_cdf(support, alpha, xmin))
+    ks[EXPONENTIAL] = ks_statistic(ecdf, exponential_cdf(support, q, xmin))
+    ks[LOGNORMAL] = ks_statistic(ecdf, lognormal_cdf(support, mu, sigma, xmin))
+
+    response = {}
+    response['is_powerlaw'] = int(ks[POWERLAW] < ks[EXPONENTIAL] and ks[POWERLAW] < ks[LOGNORMAL])
+    response['ks'] = ks[POWERLAW]
+    if num_bootstrap > 0:
+        response['p_value'] = bootstrap_p_value(values, ks[POWERLAW], alpha, xmin, num_bootstrap = num_bootstrap)
+    else:
+        response['p_value'] = float(kstwo.sf(ks[POWERLAW], tail.shape[0]))
+    response['alpha'] = alpha
+    response['xmin'] = int(xmin)
+    for model in ks:
+        response[f'ks_{model}'] = ks[model]
+
+    return(response)
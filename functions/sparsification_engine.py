@@ -0,0 +1,120 @@
+# Sparsification Engine
+# Bounded size approximations of an edgelist, for graphs above the max number of edges of an attribute
+# (see the degraded_mode property of the attributes). Both methods keep at most max_edges edges and are
+# deterministic given the seed:
+#   - Top k: keeps the heaviest edges (weights unchanged)
+#   - Edge sample: keeps each edge with probability proportional to its weight (capped at 1) and divides the
+#     weight of the kept edges by their probability (Horvitz-Thompson), so the weighted degree of every node
+#     is preserved in expectation
+
+import numpy as np
+
+
+# Methods
+TOP_K = 'top_k'
+EDGE_SAMPLE = 'edge_sample'
+
+METHODS = [TOP_K, EDGE_SAMPLE]
+
+default_seed = 42
+
+
+def top_k(edges, max_edges):
+    '''
+    Keeps the max_edges heaviest edges
+
+    params
+        - edges (pd.DataFrame): Edgelist with the weight column
+        - max_edges (int): Max number of edges
+
+    returns
+        pd.DataFrame
+        dict with the parameters
+    '''
+
+    max_edges = int(max_edges)
+    if edges.shape[0] <= max_edges:
+        return(edges, {'max_edges': max_edges, 'min_weight': float(edges.weight.min()) if edges.shape[0] > 0 else 0.0})
+
+    # Stable, so ties are broken by the order of the edgelist
+    order = np.argsort(-1*edges.weight.values, kind = 'stable')[:max_edges]
+    kept = edges.iloc[np.sort(order)].reset_index(drop = True)
+
+    return(kept, {'max_edges': max_edges, 'min_weight': float(kept.weight.min())})
+
+
+def get_sampling_scale(weights, expected_edges):
+    '''
+    Finds the scale c such that sum(min(1, c*w)) = expected_edges (the probabilities of the edge sample).
+    Uses the sorted weights: the heaviest edges (probability 1) are kept and the rest share the remaining
+    expected count.
+    '''
+
+    w = np.sort(weights)[::-1]
+    n = w.shape[0]
+
+    # Sum of the weights after each position
+    suffix = np.concatenate((np.cumsum(w[::-1])[::-1], [0]))
+
+    # Scale if the j heaviest are kept with probability 1 (the first valid j is the solution)
+    j = np.arange(n)
+    scales = (expected_edges - j)/np.maximum(suffix[:n], 1e-300)
+    valid = scales*w <= 1
+
+    if not valid.any():
+        return(np.inf)
+
+    return(float(scales[np.argmax(valid)]))
+
+
+def edge_sample(edges, max_edges, seed = default_seed):
+    '''
+    Weight proportional edge sample with Horvitz-Thompson reweighting. The expected number of edges is
+    max_edges (and the result is truncated to max_edges, keeping the most probable).
+
+    params
+        - edges (pd.DataFrame): Edgelist with the weight column
+        - max_edges (int): Max number of edges
+        - seed (int): Seed of the sample
+
+    returns
+        pd.DataFrame
+        dict with the parameters
+    '''
+
+    max_edges = int(max_edges)
+    if edges.shape[0] <= max_edges:
+        return(edges, {'max_edges': max_edges, 'seed': seed, 'scale': np.inf})
+
+    weights = edges.weight.values.astype(np.float64)
+    scale = get_sampling_scale(weights, max_edges)
+    probabilities = np.minimum(1, scale*weights)
+
+    rng = np.random.default_rng(seed)
+    selected = np.where(rng.random(weights.shape[0]) < probabilities)[0]
+
+    if selected.shape[0] > max_edges:
+        selected = np.sort(selected[np.argsort(-1*probabilities[selected], kind = 'stable')[:max_edges]])
+
+    kept = edges.iloc[selected].reset_index(drop = True)
+    kept['weight'] = weights[selected]/probabilities[selected]
+
+    return(kept, {'max_edges': max_edges, 'seed': seed, 'scale': float(scale)})
+
+
+def sparsify(edges, method, max_edges, seed = default_seed):
+    '''
+    Bounded size approximation of the edgelist with the given method
+
+    returns
+        pd.DataFrame
+        dict with the parameters
+    '''
+
+    if method == TOP_K:
+        return(top_k(edges, max_edges))
+
+    if method == EDGE_SAMPLE:
+        return(edge_sample(edges, max_edges, seed = seed))
+
+    raise ValueError(f'Sparsification method: {method} not supported')
@@ -0,0 +1,395 @@
+# Spatial Engine
+# Nearest point queries on the sphere. Points are mapped to 3D unit vectors, where the euclidean (chord)
+# distance is monotonic with the great circle distance, so a KD-tree (scipy cKDTree) over the cases answers
+# the exact nearest case of every house in O(log(cases)) instead of comparing every pair.
+#
+# Cases given as geometries (for example, the polygons of Bogota) are indexed through their boundaries, split
+# into short arcs: the KD-tree over the arc midpoints bounds the candidates and the distance to each candidate
+# arc is exact, as BigQuery ST_DISTANCE (0 for points inside a polygon).
+
+import json
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+# Earth radius in meters (spherical model, as BigQuery ST_DISTANCE)
+earth_radius = 6371008.8
+
+# Max length (meters) of the arcs the boundaries of the geometries are split into
+default_max_arc_meters = 50
+
+# Polygons with a larger radius (meters) are tested against all the points instead of through the KD-tree
+max_indexed_polygon_meters = 1000
+
+def to_unit_vectors(lat, lon):
+    '''
+    Maps latitudes and longitudes (degrees) to 3D unit vectors
+
+    returns
+        np.array (n x 3)
+    '''
+
+    lat = np.radians(np.asarray(lat, dtype = np.float64))
+    lon = np.radians(np.asarray(lon, dtype = np.float64))
+
+    return(np.column_stack((np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat))))
+
+
+def chord_to_meters(chord):
+    '''
+    Converts chord distances (between unit vectors) to great circle distances in meters
+    '''
+    return(2*earth_radius*np.arcsin(np.minimum(np.asarray(chord)/2, 1)))
+
+
+def meters_to_chord(meters):
+    '''
+    Converts great circle distances in meters to chord distances (between unit vectors)
+    '''
+    return(2*np.sin(np.minimum(np.asarray(meters)/(2*earth_radius), np.pi/2)))
+
+
+def query_tree(function, *args, num_processes = 1, **kwargs):
+    '''
+    Calls the cKDTree query function with the given threads (-1 for all)
+    '''
+
+    try:
+        return(function(*args, workers = num_processes, **kwargs))
+    except TypeError:
+        # Older scipy
+        return(function(*args, n_jobs = num_processes, **kwargs))
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    '''
+    Great circle distance in meters (vectorized)
+    '''
+
+    lat1, lon1, lat2, lon2 = [np.radians(np.asarray(v, dtype = np.float64)) for v in [lat1, lon1, lat2, lon2]]
+    a = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2 - lon1)/2)**2
+
+    return(2*earth_radius*np.arcsin(np.sqrt(np.minimum(a, 1))))
+
+
+class NearestPointIndex():
+    '''
+    Index over a set of points (for example, the active cases) that returns the distance from any point to
+    the nearest one
+    '''
+
+    def __init__(self, lat, lon):
+        '''
+        params
+            - lat (np.array): Latitudes of the points (degrees)
+            - lon (np.array): Longitudes of the points (degrees)
+        '''
+
+        lat = np.asarray(lat, dtype = np.float64)
+        lon = np.asarray(lon, dtype = np.float64)
+        valid = ~(np.isnan(lat) | np.isnan(lon))
+
+        self.num_points = int(valid.sum())
+        self.tree = None
+        if self.num_points > 0:
+            self.tree = cKDTree(to_unit_vectors(lat[valid], lon[valid]))
+
+
+    def query(self, lat, lon, num_processes = 1):
+        '''
+        Distance (meters) from each point to the nearest indexed point. NaN if there are no indexed points or
+        the coordinates are missing.
+
+        params
+            - lat (np.array): Latitudes (degrees)
+            - lon (np.array): Longitudes (degrees)
+            - num_processes (int): Threads of the query (-1 for all)
+
+        returns
+            np.array
+        '''
+
+        lat = np.asarray(lat, dtype = np.float64)
+        lon = np.asarray(lon, dtype = np.float64)
+
+        distances = np.full(lat.shape[0], np.nan)
+        valid = ~(np.isnan(lat) | np.isnan(lon))
+
+        if self.tree is None or not valid.any():
+            return(distances)
+
+        chord, _ = query_tree(self.tree.query, to_unit_vectors(lat[valid], lon[valid]), k = 1, num_processes = num_processes)
+        distances[valid] = chord_to_meters(chord)
+
+        return(distances)
+
+
+def parse_geometry(geometry):
+    '''
+    Parses a GeoJSON geometry (for example, the output of BigQuery ST_ASGEOJSON)
+
+    params
+        - geometry (str or dict)
+
+    returns
+        lines (list): np.array (n x 2, lon and lat) with the vertices of each point and line string
+        rings (list): np.array (n x 2, lon and lat) with the vertices of each (closed) polygon ring
+    '''
+
+    if isinstance(geometry, str):
+        geometry = json.loads(geometry)
+
+    kind = geometry['type']
+
+    if kind == 'GeometryCollection':
+        lines, rings = [], []
+        for part in geometry['geometries']:
+            part_lines, part_rings = parse_geometry(part)
+            lines += part_lines
+            rings += part_rings
+        return(lines, rings)
+
+    coordinates = geometry['coordinates']
+
+    if kind == 'Point':
+        return([np.array([coordinates], dtype = np.float64)], [])
+    if kind == 'MultiPoint':
+        return([np.array([c], dtype = np.float64) for c in coordinates], [])
+    if kind == 'LineString':
+        return([np.array(coordinates, dtype = np.float64)], [])
+    if kind == 'MultiLineString':
+        return([np.array(c, dtype = np.float64) for c in coordinates], [])
+    if kind == 'Polygon':
+        return([], [np.array(r, dtype = np.float64) for r in coordinates])
+    if kind == 'MultiPolygon':
+        return([], [np.array(r, dtype = np.float64) for polygon in coordinates for r in polygon])
+
+    raise ValueError(f'Geometry: {kind} not supported')
+
+
+def arc_chord_distance(p, a, b):
+    '''
+    Chord distance from the unit vectors p to the great circle arcs from a to b (vectorized, rows are paired)
+    '''
+
+    endpoints = np.minimum(np.linalg.norm(p - a, axis = 1), np.linalg.norm(p - b, axis = 1))
+
+    normal = np.cross(a, b)
+    norm = np.linalg.norm(normal, axis = 1)
+    degenerate = norm < 1e-12
+    normal = normal/np.where(degenerate, 1, norm)[:,None]
+
+    # Projection over the plane of the arc: the perpendicular distance is valid if it falls inside the arc
+    sine = np.einsum('ij,ij->i', p, normal)
+    projection = p - sine[:,None]*normal
+    within = ~degenerate
+    within &= np.einsum('ij,ij->i', np.cross(a, projection), normal) >= 0
+    within &= np.einsum('ij,ij->i', np.cross(projection, b), normal) >= 0
+    within &= np.einsum('ij,ij->i', projection, a + b) > 0
+
+    perpendicular = 2*np.sin(np.arcsin(np.minimum(np.abs(sine), 1))/2)
+
+    return(np.where(within, np.minimum(perpendicular, endpoints), endpoints))
+
+
+class NearestGeometryIndex():
+    '''
+    Index over a set of geometries (points, lines or polygons as GeoJSON) that returns the distance from any
+    point to the nearest one. As BigQuery ST_DISTANCE, the distance is 0 for points inside a polygon.
+    '''
+
+    def __init__(self, geometries, max_arc_meters = default_max_arc_meters):
+        '''
+        params
+            - geometries (iterable): GeoJSON geometries (str or dict). None values are ignored
+            - max_arc_meters (float): Max length of the arcs the boundaries are split into
+        '''
+
+        # Boundary edges (lon, lat) and the polygon of each one (-1 for points and lines)
+        starts, ends, polygon_ids = [], [], []
+        num_polygons = 0
+        for geometry in geometries:
+            if not isinstance(geometry, (str, dict)):
+                continue
+
+            lines, rings = parse_geometry(geometry)
+            for vertices in lines:
+                if vertices.shape[0] == 0:
+                    continue
+                if vertices.shape[0] == 1:
+                    vertices = np.vstack((vertices, vertices))
+                starts.append(vertices[:-1])
+                ends.append(vertices[1:])
+                polygon_ids.append(np.full(vertices.shape[0] - 1, -1))
+
+            rings = [ring for ring in rings if ring.shape[0] >= 4]
+            for ring in rings:
+                starts.append(ring[:-1])
+                ends.append(ring[1:])
+                polygon_ids.append(np.full(ring.shape[0] - 1, num_polygons))
+            if len(rings) > 0:
+                num_polygons += 1
+
+        self.num_polygons = num_polygons
+        self.tree = None
+        if len(starts) == 0:
+            return
+
+        start = np.vstack(starts)
+        end = np.vstack(ends)
+        polygon_ids = np.concatenate(polygon_ids)
+
+        # Arcs (edges split into pieces of at most max_arc_meters)
+        pieces = np.maximum(1, np.ceil(haversine(start[:,1], start[:,0], end[:,1], end[:,0])/max_arc_meters)).astype(np.int64)
+        edge = np.repeat(np.arange(start.shape[0]), pieces)
+        step = np.arange(edge.shape[0]) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+
+        arc_start = start[edge] + (end[edge] - start[edge])*(step/pieces[edge])[:,None]
+        arc_end = start[edge] + (end[edge] - start[edge])*((step + 1)/pieces[edge])[:,None]
+
+        self.arc_a = to_unit_vectors(arc_start[:,1], arc_start[:,0])
+        self.arc_b = to_unit_vectors(arc_end[:,1], arc_end[:,0])
+
+        midpoints = self.arc_a + self.arc_b
+        midpoints = midpoints/np.linalg.norm(midpoints, axis = 1)[:,None]
+
+        # Every point of an arc is within max_half_chord of its midpoint
+        self.max_half_chord = float(np.linalg.norm(midpoints - self.arc_a, axis = 1).max())
+        self.tree = cKDTree(midpoints)
+
+        # Polygons (edges sorted by polygon) for the inside test
+        ring = polygon_ids >= 0
+        self.ring_start = start[ring]
+        self.ring_end = end[ring]
+        self.polygon_offsets = np.searchsorted(polygon_ids[ring], np.arange(num_polygons + 1))
+
+        if num_polygons == 0:
+            return
+
+        first = self.polygon_offsets[:-1]
+        self.min_lon = np.minimum.reduceat(np.minimum(self.ring_start[:,0], self.ring_end[:,0]), first)
+        self.max_lon = np.maximum.reduceat(np.maximum(self.ring_start[:,0], self.ring_end[:,0]), first)
+        self.min_lat = np.minimum.reduceat(np.minimum(self.ring_start[:,1], self.ring_end[:,1]), first)
+        self.max_lat = np.maximum.reduceat(np.maximum(self.ring_start[:,1], self.ring_end[:,1]), first)
+
+        center_lat, center_lon = (self.min_lat + self.max_lat)/2, (self.min_lon + self.max_lon)/2
+        radius = np.maximum(haversine(center_lat, center_lon, self.min_lat, self.min_lon), haversine(center_lat, center_lon, self.max_lat, self.max_lon))
+        radius = np.maximum(radius, haversine(center_lat, center_lon, self.min_lat, self.max_lon))
+        radius = np.maximum(radius, haversine(center_lat, center_lon, self.max_lat, self.min_lon))
+
+        # Small polygons are found through the KD-tree over their centers and large ones are scanned
+        small = radius <= max_indexed_polygon_meters
+        self.small_polygons = np.where(small)[0]
+        self.large_polygons = np.where(~small)[0]
+        self.polygon_tree = None
+        if self.small_polygons.shape[0] > 0:
+            self.polygon_tree = cKDTree(to_unit_vectors(center_lat[small], center_lon[small]))
+            self.max_polygon_chord = float(meters_to_chord(radius[small].max()))
+
+
+    def get_inside(self, lat, lon, points, num_processes = 1):
+        '''
+        Checks which points are inside a polygon (even-odd rule over the rings, so holes are excluded)
+
+        params
+            - lat (np.array): Latitudes (degrees)
+            - lon (np.array): Longitudes (degrees)
+            - points (np.array): Their unit vectors
+
+        returns
+            np.array of bool
+        '''
+
+        inside = np.zeros(lat.shape[0], dtype = bool)
+        if self.num_polygons == 0:
+            return(inside)
+
+        # Candidate pairs (point, polygon)
+        pair_points, pair_polygons = [], []
+        if self.polygon_tree is not None:
+            candidates = query_tree(self.polygon_tree.query_ball_point, points, self.max_polygon_chord, num_processes = num_processes)
+            counts = np.array([len(c) for c in candidates], dtype = np.int64)
+            if counts.sum() > 0:
+                pair_points.append(np.repeat(np.arange(lat.shape[0]), counts))
+                pair_polygons.append(self.small_polygons[np.concatenate([c for c in candidates if len(c) > 0]).astype(np.int64)])
+
+        for polygon in self.large_polygons:
+            selected = np.where((lat >= self.min_lat[polygon]) & (lat <= self.max_lat[polygon]) & (lon >= self.min_lon[polygon]) & (lon <= self.max_lon[polygon]))[0]
+            pair_points.append(selected)
+            pair_polygons.append(np.full(selected.shape[0], polygon))
+
+        if len(pair_points) == 0:
+            return(inside)
+
+        pair_points = np.concatenate(pair_points)
+        pair_polygons = np.concatenate(pair_polygons)
+
+        # Bounding boxes
+        in_box = (lat[pair_points] >= self.min_lat[pair_polygons]) & (lat[pair_points] <= self.max_lat[pair_polygons])
+        in_box &= (lon[pair_points] >= self.min_lon[pair_polygons]) & (lon[pair_points] <= self.max_lon[pair_polygons])
+        pair_points, pair_polygons = pair_points[in_box], pair_polygons[in_box]
+
+        if pair_points.shape[0] == 0:
+            return(inside)
+
+        # Ray casting (towards the east) over the edges of the polygon of each pair
+        edge_counts = self.polygon_offsets[pair_polygons + 1] - self.polygon_offsets[pair_polygons]
+        pair = np.repeat(np.arange(pair_points.shape[0]), edge_counts)
+        edge = np.repeat(self.polygon_offsets[pair_polygons], edge_counts) + np.arange(pair.shape[0]) - np.repeat(np.cumsum(edge_counts) - edge_counts, edge_counts)
+
+        point_lat, point_lon = lat[pair_points[pair]], lon[pair_points[pair]]
+        lon1, lat1 = self.ring_start[edge,0], self.ring_start[edge,1]
+        lon2, lat2 = self.ring_end[edge,0], self.ring_end[edge,1]
+
+        crosses = (lat1 > point_lat) != (lat2 > point_lat)
+        crosses[crosses] = point_lon[crosses] < lon1[crosses] + (point_lat[crosses] - lat1[crosses])*(lon2[crosses] - lon1[crosses])/(lat2[crosses] - lat1[crosses])
+
+        odd = np.bincount(pair, weights = crosses, minlength = pair_points.shape[0]) % 2 == 1
+        inside[pair_points[odd]] = True
+
+        return(inside)
+
+
+    def query(self, lat, lon, num_processes = 1):
+        '''
+        Distance (meters) from each point to the nearest geometry. NaN if there are no geometries or the
+        coordinates are missing.
+
+        params
+            - lat (np.array): Latitudes (degrees)
+            - lon (np.array): Longitudes (degrees)
+            - num_processes (int): Threads of the query (-1 for all)
+
+        returns
+            np.array
+        '''
+
+        lat = np.asarray(lat, dtype = np.float64)
+        lon = np.asarray(lon, dtype = np.float64)
+
+        distances = np.full(lat.shape[0], np.nan)
+        valid = ~(np.isnan(lat) | np.isnan(lon))
+
+        if self.tree is None or not valid.any():
+            return(distances)
+
+        lat, lon = lat[valid], lon[valid]
+        points = to_unit_vectors(lat, lon)
+
+        # The nearest arc is within the distance to the nearest midpoint plus half an arc
+        nearest, _ = query_tree(self.tree.query, points, k = 1, num_processes = num_processes)
+        candidates = query_tree(self.tree.query_ball_point, points, nearest*(1 + 1e-9) + self.max_half_chord + 1e-12, num_processes = num_processes)
+
+        counts = np.array([len(c) for c in candidates], dtype = np.int64)
+        point = np.repeat(np.arange(lat.shape[0]), counts)
+        arc = np.concatenate([c for c in candidates if len(c) > 0]).astype(np.int64)
+
+        chord = np.full(lat.shape[0], np.inf)
+        np.minimum.at(chord, point, arc_chord_distance(points[point], self.arc_a[arc], self.arc_b[arc]))
+
+        result = chord_to_meters(chord)
+        result[self.get_inside(lat, lon, points, num_processes = num_processes)] = 0
+        distances[valid] = result
+
+        return(distances)
+
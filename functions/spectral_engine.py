@@ -0,0 +1,204 @@
+# Spectral Engine
+# Largest eigenvalue (spectral radius) of the adjacency matrix with sparse symmetric Lanczos (ARPACK).
+# Warm started with the leading eigenvector of the previous window of the same location, and with an
+# adaptive tolerance.
+
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse.linalg import eigsh, ArpackNoConvergence
+
+
+# Variants
+WEIGHTED = 'weighted'
+UNWEIGHTED = 'unweighted'
+
+# Tolerances (relative). Starts with the tightest and relaxes it (x10) if ARPACK does not converge
+default_tol = 1e-8
+default_max_tol = 1e-4
+# Max iterations of each ARPACK attempt (None for ARPACK default)
+default_max_iter = None
+
+# Max number of previous vectors and results kept
+max_vectors = 32
+max_results = 16
+
+
+def remap_vector(previous_identifiers, previous_values, identifiers):
+    '''
+    Maps a previous vector to a new set of identifiers. Identifiers not found in the previous vector receive
+    the mean value. The result sums 1.
+
+    params
+        - previous_identifiers (pd.Index): identifiers of the previous vector
+        - previous_values (np.array): previous vector
+        - identifiers (pd.Index): new identifiers
+
+    returns
+        np.array (one value per identifier) or None if no identifier is shared
+    '''
+
+    positions = previous_identifiers.get_indexer(identifiers)
+    found = positions >= 0
+
+    if not found.any():
+        return(None)
+
+    x = np.full(len(identifiers), previous_values[positions[found]].mean())
+    x[found] = previous_values[positions[found]]
+
+    return(x/x.sum())
+
+
+def spectral_radius(A, v0 = None, tol = default_tol, max_tol = default_max_tol, max_iter = default_max_iter):
+    '''
+    Largest eigenvalue of the symmetric, non negative, matrix A (its spectral radius) and its eigenvector.
+
+    If the starting vector v0 already satisfies the tolerance (relative residual), it is returned without
+    calling ARPACK. If ARPACK does not converge, the tolerance is relaxed (x10) until max_tol.
+
+    params
+        - A (sp.csr_matrix): Symmetric adjacency matrix
+        - v0 (np.array): Starting vector (for example the eigenvector of a previous window). None for ones
+        - tol (float): Target relative tolerance
+        - max_tol (float): Max relative tolerance
+        - max_iter (int): Max iterations of each ARPACK attempt
+
+    returns
+        value (float): the spectral radius
+        x (np.array): the eigenvector (positive, norm 1)
+        tol_used (float): the tolerance achieved (0 for dense solutions)
+    '''
+
+    n = A.shape[0]
+
+    if n == 0 or A.nnz == 0:
+        return(0.0, np.ones(n)/np.sqrt(max(n, 1)), 0.0)
+
+    if n < 3:
+        values, vectors = np.linalg.eigh(A.toarray())
+        return(float(values[-1]), orient(vectors[:, -1]), 0.0)
+
+    # Warm start check
+    if v0 is not None:
+        v = v0/np.linalg.norm(v0)
+        Av = A @ v
+        value = v @ Av
+        if value > 0 and np.linalg.norm(Av - value*v)/value < tol:
+            return(float(value), orient(v), tol)
+    else:
+        v0 = np.ones(n)
+
+    current_tol = tol
+    while True:
+        try:
+            values, vectors = eigsh(A, k = 1, which = 'LA', v0 = v0, tol = current_tol, maxiter = max_iter)
+            return(float(values[0]), orient(vectors[:, 0]), current_tol)
+
+        except ArpackNoConvergence as e:
+            if current_tol*10 > max_tol:
+                raise
+
+            # Restarts from the best vector found
+            if e.eigenvectors.shape[1] > 0:
+                v0 = e.eigenvectors[:, 0]
+
+            current_tol = current_tol*10
+
+
+def orient(x):
+    '''
+    Returns the eigenvector with positive orientation (Perron vector)
+    '''
+    if x.sum() < 0:
+        return(-1*x)
+
+    return(x)
+
+
+class WarmStartSpectral():
+    '''
+    Spectral radius that remembers the last eigenvector of each key (for example (location_id, variant)) and
+    uses it as the starting vector of the next computation of the same key.
+    '''
+
+    def __init__(self, tol = default_tol, max_tol = default_max_tol, max_iter = default_max_iter):
+
+        self.tol = tol
+        self.max_tol = max_tol
+        self.max_iter = max_iter
+
+        self.vectors = OrderedDict()
+
+        # Statistics
+        self.computations = 0
+        self.warm_starts = 0
+
+
+    def compute(self, key, A, identifiers):
+        '''
+        Computes the spectral radius, warm started with the previous vector of the key (if any)
+
+        returns
+            value (float)
+            tol_used (float)
+            warm (boolean)
+        '''
+
+        v0 = None
+        if key in self.vectors:
+            previous_identifiers, previous_vector = self.vectors[key]
+            v0 = remap_vector(previous_identifiers, np.abs(previous_vector), identifiers)
+
+        value, x, tol_used = spectral_radius(A, v0 = v0, tol = self.tol, max_tol = self.max_tol, max_iter = self.max_iter)
+
+        self.vectors[key] = (identifiers, x)
+        self.vectors.move_to_end(key)
+        while len(self.vectors) > max_vectors:
+            self.vectors.popitem(last = False)
+
+        self.computations += 1
+        self.warm_starts += int(v0 is not None)
+
+        return(value, tol_used, v0 is not None)
+
+
+# Shared by the attributes
+warm_start_spectral = WarmStartSpectral()
+
+# Results of the recent windows
+results = OrderedDict()
+
+def get_spectral_radii(location_id, start_date_string, end_date_string, engine, approximation = None):
+    '''
+    Weighted and unweighted spectral radius of the window, both computed from the same engine (single matrix
+    build, see centrality_engine). Results are kept, so the second variant of the window is not recomputed.
+
+    params
+        - location_id(str): The graph id
+        - start_date_string (str): Start date in %Y-%m-%d
+        - end_date_string (str): End date in %Y-%m-%d
+        - engine (ce.CentralityEngine): The engine of the window
+        - approximation (tuple): Approximation of the edgelist of the engine, None if complete (see
+            attribute_generic.get_approximation_key)
+
+    returns
+        dict with the value of each variant (WEIGHTED and UNWEIGHTED)
+    '''
+
+    key = (location_id, start_date_string, end_date_string, approximation)
+
+    if key in results:
+        results.move_to_end(key)
+        return(results[key])
+
+    radii = {}
+    for variant, A in [(WEIGHTED, engine.A_weighted), (UNWEIGHTED, engine.A_unweighted)]:
+        value, tol_used, warm = warm_start_spectral.compute((location_id, variant), A, engine.identifiers)
+        radii[variant] = value
+        print(f'            Spectral radius ({variant}) for {location_id}: {value} (tolerance: {tol_used}, warm start: {warm})')
+
+    results[key] = radii
+    while len(results) > max_results:
+        results.popitem(last = False)
+
+    return(radii)
@@ -0,0 +1,79 @@
+# Subgraph Engine
+# Induced subgraphs of a parent graph (for example, the localidades and UPZs of Bogota inside the city graph).
+# The parent edgelist is encoded once (integer codes of its nodes) and the edges of each child are selected
+# with vectorized membership masks over the codes, instead of downloading the edgelist of every child.
+
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+# Max number of parent graphs kept
+max_parents = 2
+
+
+class ParentGraph():
+    '''
+    Encoded edgelist of a parent graph
+    '''
+
+    def __init__(self, edges):
+        '''
+        params
+            - edges (pd.DataFrame): Compact edgelist (id1, id2, ...). Not copied, must not be edited
+        '''
+
+        self.edges = edges
+
+        codes, self.identifiers = pd.factorize(pd.concat([edges.id1, edges.id2], ignore_index = True))
+        self.code1 = codes[:edges.shape[0]]
+        self.code2 = codes[edges.shape[0]:]
+
+
+    def get_membership(self, identifiers):
+        '''
+        Boolean mask over the nodes of the parent, True for the given identifiers
+        '''
+
+        member = np.zeros(self.identifiers.shape[0], dtype = bool)
+        positions = self.identifiers.get_indexer(pd.Index(identifiers).unique())
+        member[positions[positions >= 0]] = True
+
+        return(member)
+
+
+    def induced_edgelist(self, identifiers):
+        '''
+        Edges of the parent with both ends in the given identifiers
+
+        returns
+            pd.DataFrame (copy, with the columns of the parent edgelist)
+        '''
+
+        member = self.get_membership(identifiers)
+        mask = member[self.code1] & member[self.code2]
+
+        return(self.edges[mask].reset_index(drop = True))
+
+
+
+# Parents of the recent windows
+parents = OrderedDict()
+
+def get_parent_graph(key, build_function):
+    '''
+    Returns the encoded parent of the given key (for example, (parent_id, start_date, end_date)). If it does not
+    exist, it is built with build_function (without parameters, returns a ParentGraph)
+    '''
+
+    if key in parents:
+        parents.move_to_end(key)
+        return(parents[key])
+
+    parent = build_function()
+    parents[key] = parent
+
+    while len(parents) > max_parents:
+        parents.popitem(last = False)
+
+    return(parent)
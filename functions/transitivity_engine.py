@@ -0,0 +1,122 @@
+# Transitivity Engine
+# Approximate global clustering coefficient (transitivity) by uniform wedge sampling (Seshadhri, Pinar &
+# Kolda). Wedges (paths of length two) are sampled uniformly through their center and the fraction of closed
+# ones estimates the transitivity. The number of wedges comes from the Hoeffding bound, so the error is
+# at most epsilon with probability 1 - delta, regardless of the size of the graph.
+
+import math
+import numpy as np
+import scipy.sparse as sp
+
+
+# Defaults
+default_epsilon = 0.005 # Target (absolute) error
+default_delta = 0.01 # Probability of exceeding the error
+default_seed = 42
+
+# Max wedges checked at once (bounds the memory)
+max_chunk_size = 1000000
+
+
+def get_sample_size(epsilon = default_epsilon, delta = default_delta):
+    '''
+    Number of wedges for the given error bound (Hoeffding):
+
+        k = ln(2/delta)/(2*epsilon^2)
+    '''
+    return(int(math.ceil(math.log(2/delta)/(2*epsilon**2))))
+
+
+def simple_adjacency(n, sources, targets):
+    '''
+    Binary symmetric adjacency matrix (CSR, sorted indices) without self loops or parallel edges
+
+    params
+        - n (int): Number of nodes
+        - sources (np.array): integer ids (see utils.factorize_graph)
+        - targets (np.array): integer ids
+    '''
+
+    not_loop = sources != targets
+    sources, targets = sources[not_loop], targets[not_loop]
+
+    A = sp.csr_matrix((np.ones(2*sources.shape[0]), (np.concatenate((sources, targets)), np.concatenate((targets, sources)))), shape = (n, n))
+    A.sum_duplicates()
+    A.data[:] = 1
+    A.sort_indices()
+
+    return(A)
+
+
+def count_wedges(A):
+    '''
+    Number of wedges centered at each node: d*(d-1)/2
+    '''
+    degrees = np.diff(A.indptr).astype(np.float64)
+    return(degrees*(degrees - 1)/2)
+
+
+def are_adjacent(A, u, v):
+    '''
+    Checks (vectorized) if the pairs (u, v) are edges of A. Uses the sorted indices of each row.
+    '''
+
+    n = A.shape[0]
+    # Edge keys of the CSR (sorted, since rows and their indices are sorted)
+    rows = np.repeat(np.arange(n, dtype = np.int64), np.diff(A.indptr))
+    keys = rows*n + A.indices
+
+    query = u.astype(np.int64)*n + v
+    positions = np.minimum(np.searchsorted(keys, query), keys.shape[0] - 1)
+
+    return(keys[positions] == query)
+
+
+def transitivity(n, sources, targets, epsilon = default_epsilon, delta = default_delta, seed = default_seed):
+    '''
+    Approximates the transitivity (3*triangles/wedges) of the undirected graph by uniform wedge sampling.
+    Deterministic given the seed.
+
+    params
+        - n (int): Number of nodes
+        - sources (np.array): integer ids (see utils.factorize_graph)
+        - targets (np.array): integer ids
+        - epsilon (float): Target error
+        - delta (float): Probability of exceeding the error
+        - seed (int): Seed of the sample
+
+    returns
+        float (nan if the graph has no wedges, as igraph)
+    '''
+
+    A = simple_adjacency(n, sources, targets)
+    wedges = count_wedges(A)
+    total_wedges = wedges.sum()
+
+    if total_wedges == 0:
+        return(np.nan)
+
+    rng = np.random.default_rng(seed)
+    sample_size = get_sample_size(epsilon, delta)
+
+    # Centers with probability proportional to their wedges
+    cumulative = np.cumsum(wedges)
+
+    closed = 0
+    for start in range(0, sample_size, max_chunk_size):
+        k = min(max_chunk_size, sample_size - start)
+
+        centers = np.minimum(np.searchsorted(cumulative, rng.random(k)*total_wedges, side = 'right'), n - 1)
+        degrees = A.indptr[centers + 1] - A.indptr[centers]
+
+        # Two different neighbors, uniformly
+        i = (rng.random(k)*degrees).astype(np.int64)
+        j = (rng.random(k)*(degrees - 1)).astype(np.int64)
+        j[j >= i] += 1
+
+        u = A.indices[A.indptr[centers] + i]
+        v = A.indices[A.indptr[centers] + j]
+
+        closed += int(are_adjacent(A, u, v).sum())
+
+    return(closed/sample_size)
@@ -10,6 +10,9 @@ import time
 import numpy as np
 from datetime import timedelta, datetime
 import os
+import threading
+import igraph as ig
+import scipy.sparse as sp
 
 
 
@@ -35,6 +38,7 @@ temp_data_set_id = "download_temp"
 
 graphs_attribute_table = 'grafos-alcaldia-bogota.graph_attributes.graph_attributes'
 nodes_attribute_table = 'grafos-alcaldia-bogota.graph_attributes.node_attributes'
+approximations_table = 'grafos-alcaldia-bogota.graph_attributes.attribute_approximations'
 
 bogota_codes = ['CO.34','CO.33']
 
@@ -134,7 +138,7 @@ def run_simple_query(client, query, allow_large_results=False):
     query_job = client.query(query, job_config=job_config) 
 
     # Return the results as a pandas DataFrame
-    df = query_job.to_dataframe()
+    df = query_to_dataframe(query_job)
     
     return(df)
 
@@ -151,65 +155,352 @@ def run_simple_query_no_result(client, query):
     query_job.result()
         
     
-def get_current_locations(client, only_active = True):
+# Result Fetch
+# Results are read as Arrow record batches through the BigQuery Storage API (parallel read streams) when it is
+# available, instead of the REST row API. Falls back to the REST API when the storage client is not installed
+# or fails. The storage client is created on first use, once per process (gRPC clients can't be forked).
+
+# Rows per page of the streamed reads (REST fallback)
+result_page_size = 500000
+
+bqstorage_state = {'pid': None, 'client': None}
+
+def get_bqstorage_client():
     '''
-    Gets all the current locations
+    Returns the BigQuery Storage read client of the process, or None if it is not available
     '''
-    
-    if only_active:
-        sql = f"""
-            SELECT location_id, name, precision, dataset, type, construction_type, start_date, end_date
-            FROM grafos-alcaldia-bogota.geo.locations_geometries
-            WHERE active = TRUE
-            GROUP BY location_id, name, precision, dataset, type, construction_type, start_date, end_date
-      """
 
-    else:
-        sql = f"""
-            SELECT location_id, name, precision, dataset, type, construction_type, start_date, end_date
-            FROM grafos-alcaldia-bogota.geo.locations_geometries
-            GROUP BY location_id, name, precision, dataset, type, construction_type, start_date, end_date
-      """
+    if bqstorage_state['pid'] != os.getpid():
+        bqstorage_state['pid'] = os.getpid()
+        bqstorage_state['client'] = None
 
-    return( run_simple_query(client, sql))
+        try:
+            from google.cloud import bigquery_storage_v1
+            bqstorage_state['client'] = bigquery_storage_v1.BigQueryReadClient()
+        except Exception:
+            try:
+                # Older versions of the bigquery library
+                from google.cloud import bigquery_storage_v1beta1
+                bqstorage_state['client'] = bigquery_storage_v1beta1.BigQueryStorageClient()
+            except Exception:
+                print('            BigQuery Storage API not available. Results are read with the REST API')
 
+    return(bqstorage_state['client'])
 
-def get_current_locations_complete(client, only_active = True):
+
+def query_to_dataframe(query_job):
     '''
-    Gets all the current locations (including geometry)
+    Reads the whole result of the query as a pandas DataFrame (through Arrow when the storage API is available)
     '''
-    
-    if only_active:
-        sql = f"""
-            SELECT *
-            FROM grafos-alcaldia-bogota.geo.locations_geometries
-            WHERE active = TRUE
-            
-      """
 
-    else:
-        sql = f"""
-            SELECT *
-            FROM grafos-alcaldia-bogota.geo.locations_geometries
-      """
+    bqstorage_client = get_bqstorage_client()
+    if bqstorage_client is not None:
+        try:
+            return(query_job.result().to_dataframe(bqstorage_client = bqstorage_client))
+        except Exception as e:
+            print(f'            Storage API read failed ({type(e).__name__}). Using the REST API')
 
-    return( run_simple_query(client, sql))
+    return(query_job.to_dataframe())
 
 
-def get_current_locations_for_attributes(client):
+def query_to_dataframe_iterable(query_job, page_size = result_page_size):
     '''
-    Gets all the current locations
+    Reads the result of the query as a stream of pandas DataFrames (one per record batch or page), for
+    incremental aggregation. The whole result is never held in memory. If the storage API fails before the
+    first batch, the stream is read with the REST API.
+
+    returns
+        iterator of pd.DataFrame
     '''
-    
 
-    sql = f"""
-        SELECT location_id, name, precision, dataset, type
-        FROM grafos-alcaldia-bogota.geo.locations_geometries
-        WHERE attribute_active = TRUE
-        GROUP BY location_id, name, precision, dataset, type
-      """
+    bqstorage_client = get_bqstorage_client()
 
-    return( run_simple_query(client, sql))
+    def read_storage():
+        rows = query_job.result(page_size = page_size)
+        if hasattr(rows, 'to_arrow_iterable'):
+            return((batch.to_pandas() for batch in rows.to_arrow_iterable(bqstorage_client = bqstorage_client)))
+        return(rows.to_dataframe_iterable(bqstorage_client = bqstorage_client))
+
+    def read_rest():
+        rows = query_job.result(page_size = page_size)
+        if hasattr(rows, 'to_dataframe_iterable'):
+            return(rows.to_dataframe_iterable())
+        # Older versions of the bigquery library
+        return(iter([rows.to_dataframe()]))
+
+    if bqstorage_client is None:
+        return(read_rest())
+
+    return(stream_with_fallback(read_storage, read_rest))
+
+
+def stream_with_fallback(read_function, fallback_function):
+    '''
+    Yields the items of read_function(). If it fails before the first item, yields the items of fallback_function()
+    '''
+
+    try:
+        iterator = iter(read_function())
+        first = next(iterator)
+    except StopIteration:
+        return
+    except Exception as e:
+        print(f'            Storage API read failed ({type(e).__name__}). Using the REST API')
+        yield from fallback_function()
+        return
+
+    yield first
+    yield from iterator
+
+
+def query_to_arrays(query_job):
+    '''
+    Reads the whole result of the query as NumPy arrays (one per column). Numeric columns without nulls are
+    not copied from the Arrow buffers. For example, for building graphs from the integer columns.
+
+    returns
+        dict column -> np.array
+    '''
+
+    rows = query_job.result()
+    table = None
+
+    if hasattr(rows, 'to_arrow'):
+        bqstorage_client = get_bqstorage_client()
+        try:
+            table = rows.to_arrow(bqstorage_client = bqstorage_client)
+        except Exception as e:
+            print(f'            Arrow read failed ({type(e).__name__}). Using the REST API')
+            table = None
+
+    if table is None:
+        df = query_job.to_dataframe()
+        return({col : df[col].values for col in df.columns})
+
+    arrays = {}
+    for name, column in zip(table.column_names, table.columns):
+        if column.num_chunks == 1 and column.null_count == 0:
+            arrays[name] = column.chunk(0).to_numpy(zero_copy_only = False)
+        else:
+            arrays[name] = column.to_pandas().values
+
+    return(arrays)
+
+
+
+# Location Registry
+# Location metadata (locations, datasets, construction types, geo codes, cities and min support dates) is loaded
+# once per process and shared by every caller. It is reloaded after the TTL or when refresh is called.
+
+# Seconds before the registry is reloaded
+location_registry_ttl = 60*60 # 1 hour
+
+
+class LocationRegistry():
+    '''
+    Cached location metadata, indexed by location_id
+    '''
+
+    def __init__(self, ttl = location_registry_ttl):
+        '''
+        params
+            - ttl (int): Seconds before the metadata is reloaded. None to never reload it
+        '''
+
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.clear()
+
+
+    def clear(self):
+        '''
+        Discards the loaded metadata. It is loaded again on the next access. Must be called by the methods
+        that write the metadata tables (see add_code_deptos)
+        '''
+
+        with self.lock:
+
+            self.load_time = None
+
+            self.df_locations = None
+            self.df_lookup = None
+            self.df_locations_complete = None
+            self.df_geo_codes = None
+            self.df_min_support_dates = None
+
+            # location_id -> tuple of codes and location_id -> city
+            self.codes = {}
+            self.cities = {}
+
+
+    def refresh(self, client):
+        '''
+        Reloads the locations, geo codes and min support dates (geometries are reloaded on demand)
+        '''
+
+        with self.lock:
+
+            self.clear()
+
+            sql = """
+                SELECT location_id, name, precision, dataset, type, construction_type, start_date, end_date, active, attribute_active
+                FROM grafos-alcaldia-bogota.geo.locations_geometries
+                GROUP BY location_id, name, precision, dataset, type, construction_type, start_date, end_date, active, attribute_active
+            """
+            self.df_locations = run_simple_query(client, sql)
+
+            # One row per location for the lookups (active rows first, locations can be duplicated)
+            self.df_lookup = self.df_locations.sort_values('active', ascending = False).drop_duplicates('location_id')
+            self.df_lookup.index = self.df_lookup.location_id
+
+            sql = 'SELECT location_id, code_depto FROM grafos-alcaldia-bogota.geo.locations_geo_codes'
+            self.df_geo_codes = run_simple_query(client, sql)
+            self.codes = {location_id : tuple(df.code_depto.values) for location_id, df in self.df_geo_codes.groupby('location_id')}
+
+            sql = 'SELECT location_id, min_date FROM grafos-alcaldia-bogota.coverage_dates.graphs_min_support_dates'
+            self.df_min_support_dates = run_simple_query(client, sql)
+
+            self.load_time = time.time()
+
+
+    def check_loaded(self, client):
+        '''
+        Loads the metadata if it was never loaded or the TTL expired
+        '''
+
+        with self.lock:
+            if self.load_time is None or (self.ttl is not None and time.time() - self.load_time > self.ttl):
+                self.refresh(client)
+
+
+    def get_locations(self, client, only_active = True):
+        '''
+        Returns (a copy of) the locations (without geometry)
+        '''
+
+        self.check_loaded(client)
+
+        df = self.df_locations
+        if only_active:
+            df = df[df.active == True]
+
+        return(df[['location_id', 'name', 'precision', 'dataset', 'type', 'construction_type', 'start_date', 'end_date']].reset_index(drop = True))
+
+
+    def get_locations_for_attributes(self, client):
+        '''
+        Returns (a copy of) the locations with attributes active
+        '''
+
+        self.check_loaded(client)
+
+        df = self.df_locations[self.df_locations.attribute_active == True]
+        df = df[['location_id', 'name', 'precision', 'dataset', 'type']].drop_duplicates()
+
+        return(df.reset_index(drop = True))
+
+
+    def get_locations_complete(self, client, only_active = True):
+        '''
+        Returns (a copy of) the locations including geometry. The geometries are loaded on the first call
+        '''
+
+        self.check_loaded(client)
+
+        with self.lock:
+            if self.df_locations_complete is None:
+                self.df_locations_complete = run_simple_query(client, 'SELECT * FROM grafos-alcaldia-bogota.geo.locations_geometries')
+
+        df = self.df_locations_complete
+        if only_active:
+            df = df[df.active == True]
+
+        return(df.reset_index(drop = True))
+
+
+    def get_location_value(self, client, location_id, column):
+        '''
+        Returns the value of the column (for example, dataset or construction_type) for the location
+        '''
+
+        self.check_loaded(client)
+        return(self.df_lookup.at[location_id, column])
+
+
+    def get_geo_codes(self, client, location_id = None):
+        '''
+        Returns (a copy of) the geo codes of the location (or of all locations if location_id is None)
+        '''
+
+        self.check_loaded(client)
+
+        if pd.isna(location_id):
+            return(self.df_geo_codes.copy())
+
+        return(self.df_geo_codes[self.df_geo_codes.location_id == location_id].reset_index(drop = True))
+
+
+    def is_in_bogota(self, client, location_id):
+        '''
+        Checks if all the codes of the location are in bogota
+        '''
+
+        self.check_loaded(client)
+
+        if location_id not in self.codes:
+            raise KeyError(f'No geo codes found for location_id: {location_id}')
+
+        return(all([c in bogota_codes for c in self.codes[location_id]]))
+
+
+    def get_city(self, client, location_id):
+        '''
+        Returns the city of the location (see get_city)
+        '''
+
+        self.check_loaded(client)
+
+        if location_id not in self.cities:
+            self.cities[location_id] = resolve_city(client, location_id)
+
+        return(self.cities[location_id])
+
+
+    def get_min_support_dates(self, client):
+        '''
+        Returns (a copy of) the min support date of the locations
+        '''
+
+        self.check_loaded(client)
+        return(self.df_min_support_dates.copy())
+
+
+# Shared by the process
+location_registry = LocationRegistry()
+
+
+def get_current_locations(client, only_active = True):
+    '''
+    Gets all the current locations (see LocationRegistry)
+    '''
+
+    return(location_registry.get_locations(client, only_active = only_active))
+
+
+def get_current_locations_complete(client, only_active = True):
+    '''
+    Gets all the current locations (including geometry). See LocationRegistry
+    '''
+
+    return(location_registry.get_locations_complete(client, only_active = only_active))
+
+
+def get_current_locations_for_attributes(client):
+    '''
+    Gets all the current locations (see LocationRegistry)
+    '''
+
+    return(location_registry.get_locations_for_attributes(client))
 
 
 def get_duplicate_locations(client):
@@ -238,10 +529,21 @@ def get_duplicate_locations(client):
 
 def get_city(client, location_id, df_codes = None):
     '''
-    Gets the city
+    Gets the city. Resolved once per location (see LocationRegistry)
+
+    params
+        - df_codes (pd.DataFrame): Not used, the codes come from the location registry. Kept for compatibility
+    '''
+
+    return(location_registry.get_city(client, location_id))
+
+
+def resolve_city(client, location_id):
+    '''
+    Resolves the city of the location from its geo codes and its id
     '''
     
-    if(is_in_bogota(client, location_id, df_codes = df_codes)):
+    if(is_in_bogota(client, location_id)):
         return BOGOTA
     
     if('colombia' in location_id):
@@ -263,16 +565,13 @@ def get_city(client, location_id, df_codes = None):
 
 def is_in_bogota(client, location_id, df_codes = None):
     '''
-    Checks if the given location_id is in bogota
+    Checks if the given location_id is in bogota (see LocationRegistry)
+
+    params
+        - df_codes (pd.DataFrame): Not used, the codes come from the location registry. Kept for compatibility
     '''
     
-    if df_codes is None:
-        df_codes = utils.get_geo_codes(client, location_id = None)
-        df_codes.index = df_codes.location_id
-    
-    in_bogota = df_codes.loc[[location_id]].code_depto.apply(lambda c: c not in bogota_codes).sum() == 0
-    
-    return(in_bogota)
+    return(location_registry.is_in_bogota(client, location_id))
 
 
 # ---------------------
@@ -280,29 +579,19 @@ def is_in_bogota(client, location_id, df_codes = None):
 
 def get_geo_codes(client, location_id = None):
     '''
-    Gets the geo codes of all locations
+    Gets the geo codes of all locations (see LocationRegistry)
     '''
     
-    if not pd.isna(location_id):
-        sql = f'SELECT location_id, code_depto FROM grafos-alcaldia-bogota.geo.locations_geo_codes WHERE location_id = "{location_id}"'
-    else:
-        sql = f'SELECT location_id, code_depto FROM grafos-alcaldia-bogota.geo.locations_geo_codes'
-    
-    df_codes =  run_simple_query(client, sql)
-    
-    return(df_codes)
+    return(location_registry.get_geo_codes(client, location_id = location_id))
     
 
 
 def get_dataset_of_location(client, location_id ):
     '''
-    Gets the dataset of the given location id
+    Gets the dataset of the given location id (see LocationRegistry)
     '''
 
-    df = get_current_locations(client)
-    df.index = df.location_id
-
-    return(df.loc[location_id, 'dataset'])
+    return(location_registry.get_location_value(client, location_id, 'dataset'))
 
 
 
@@ -322,20 +611,76 @@ def get_all_graph_sizes(client):
     return( run_simple_query(client, sql))
 
 
-def get_min_support_date_for_location_attributes(client):
+def get_graph_sizes(client, location_ids = None, min_date = None):
     '''
-    Gets the min date that a location is supported
+    Gets the sizes of the given locations since the given date
+
+    params
+        - location_ids (list): The locations. None for all
+        - min_date (str): Min date in %Y-%m-%d. None for all
     '''
 
+    conditions = ['TRUE']
+    if location_ids is not None:
+        conditions.append('location_id IN ({})'.format(', '.join([f'"{location_id}"' for location_id in location_ids])))
+    if min_date is not None:
+        conditions.append(f'date >= "{min_date}"')
+
     sql = f"""
         
-        SELECT location_id, min_date
-        FROM grafos-alcaldia-bogota.coverage_dates.graphs_min_support_dates
+        SELECT location_id, date, num_nodes, num_edges
+        FROM grafos-alcaldia-bogota.graph_attributes.graph_sizes
+        WHERE {' AND '.join(conditions)}
+        ORDER BY location_id, date
     
     """
 
     return( run_simple_query(client, sql))
 
+
+def get_location_hierarchy(client, location_ids = None):
+    '''
+    Gets the parent of each location: the location with the largest area whose geometry covers it (for example,
+    Bogota for its localidades and UPZs). Locations not covered by any other are not included.
+
+    params
+        - location_ids (list): Only considers these locations (as children and parents). None for all
+
+    returns
+        pd.DataFrame with location_id and parent_id
+    '''
+
+    condition = 'TRUE'
+    if location_ids is not None:
+        condition = 'location_id IN ({})'.format(', '.join([f'"{location_id}"' for location_id in location_ids]))
+
+    sql = f"""
+
+        WITH geometries AS (
+            SELECT location_id, ANY_VALUE(geometry) as geometry
+            FROM grafos-alcaldia-bogota.geo.locations_geometries
+            WHERE {condition}
+            GROUP BY location_id
+        )
+
+        SELECT child.location_id, ARRAY_AGG(parent.location_id ORDER BY ST_AREA(parent.geometry) DESC LIMIT 1)[OFFSET(0)] as parent_id
+        FROM geometries as child
+        JOIN geometries as parent
+        ON child.location_id <> parent.location_id AND ST_COVEREDBY(child.geometry, parent.geometry)
+        GROUP BY child.location_id
+
+    """
+
+    return( run_simple_query(client, sql))
+
+
+def get_min_support_date_for_location_attributes(client):
+    '''
+    Gets the min date that a location is supported (see LocationRegistry)
+    '''
+
+    return(location_registry.get_min_support_dates(client))
+
 def update_bogota_sample(client, todays_date):
     '''
     Method that updates the bogota (to save money with so many UPZ and Localities)
@@ -614,6 +959,42 @@ def graph_attribute_exists(client, location_id, attribute_name, date):
     return(df.shape[0] > 0)
 
 
+def get_existing_node_attribute_dates(client, min_date):
+    '''
+    Gets all the (location_id, attribute_name, date) that already exist in the nodes attribute table
+    from the given date. Used to avoid checking each date separately (see node_attribute_exists).
+
+    min_date must be in %Y-%m-%d format.
+    '''
+
+    query = f"""
+
+        SELECT DISTINCT location_id, attribute_name, CAST(date AS STRING) as date
+        FROM {nodes_attribute_table}
+        WHERE date >= "{min_date}"
+    """
+
+    return(run_simple_query(client, query, allow_large_results = True))
+
+
+def get_existing_graph_attribute_dates(client, min_date):
+    '''
+    Gets all the (location_id, attribute_name, date) that already exist in the graphs attribute table
+    from the given date. Used to avoid checking each date separately (see graph_attribute_exists).
+
+    min_date must be in %Y-%m-%d format.
+    '''
+
+    query = f"""
+
+        SELECT DISTINCT location_id, attribute_name, CAST(date AS STRING) as date
+        FROM {graphs_attribute_table}
+        WHERE date >= "{min_date}"
+    """
+
+    return(run_simple_query(client, query, allow_large_results = True))
+
+
 
 def insert_node_attributes(client, df):
     '''
@@ -1066,8 +1447,8 @@ def add_code_deptos(client, location_id):
     
     df_locations = run_simple_query(client, sql)
     
-    if location_id in df_locations.location_id:
-        print('Location id: {} is already in the locations_geo_codes table. Nothing will be added')
+    if location_id in df_locations.location_id.values:
+        print(f'Location id: {location_id} is already in the locations_geo_codes table. Nothing will be added')
         return(False)
     
 
@@ -1092,6 +1473,9 @@ def add_code_deptos(client, location_id):
     
     query_job = client.query(query, job_config= job_config) 
     query_job.result()
+
+    # The registry loaded before the insert does not have the new codes
+    location_registry.clear()
         
     return(True)
 
@@ -1124,6 +1508,10 @@ def compute_transits(client, location_id, start_date, end_date, ident = '   '):
     print(ident + f'Adding transtits for: {location_id}. Between: {start_date} and {end_date}')
         
     df_codes =  get_geo_codes(client, location_id)
+
+    # Without codes the location would be taken as inside Bogota
+    if df_codes.shape[0] == 0:
+        raise ValueError(f'No geo codes found for location_id: {location_id}. Add them first (see add_code_deptos)')
     
     
     if df_codes.code_depto.apply(lambda c: c not in bogota_codes).sum() == 0:
@@ -2054,6 +2442,176 @@ def gini(array):
     n = array.shape[0]#number of array elements
     return ((np.sum((2 * index - n  - 1) * array)) / (n * np.sum(array))) #Gini coefficient
 
+
+def aggregate_values(values, aggregation):
+    '''
+    Aggregates the given values (for example, the values of a node attribute) into a single value.
+    Null values are ignored.
+
+    params
+        - values (np.array): The values
+        - aggregation (str): One of:
+            - gini: gini index (see gini)
+            - mean
+            - quantile_<q>: the q quantile, for example quantile_0.5 for the median
+
+    returns
+        float (None if there are no values)
+    '''
+
+    values = np.array(values, dtype = np.float64)
+    values = values[~np.isnan(values)]
+
+    if values.shape[0] == 0:
+        return(None)
+
+    if aggregation == 'gini':
+        return(gini(values))
+
+    if aggregation == 'mean':
+        return(np.mean(values))
+
+    if aggregation.startswith('quantile_'):
+        return(np.quantile(values, float(aggregation.split('_')[1])))
+
+    raise ValueError(f'Unsupported aggregation: {aggregation}')
+
+
+# Graph Construction
+# Graphs are built from integer ids (the position of the node in the nodes dataframe)
+# so no python code is excecuted per edge.
+# ---------------------
+
+def factorize_graph(nodes, edges, weight_column = 'weight'):
+    '''
+    Maps the identifiers of the nodes to contiguous int32 ids (the position of the node in the nodes dataframe)
+    and translates the edgelist into integer arrays.
+
+    params
+        - nodes (pd.DataFrame): Nodes of the graph. Must contain the column identifier (unique)
+        - edges (pd.DataFrame): Edges of the graph. Must contain the columns id1 and id2
+        - weight_column (str): Column of the edges with the weights. None to ignore weights
+
+    returns
+        identifiers (pd.Index): the identifier of each integer id (identifiers[i] is the identifier of vertex i)
+        sources (np.array int32): integer id of id1
+        targets (np.array int32): integer id of id2
+        weights (np.array float64): weight of each edge (None if weight_column is None)
+
+    generates
+        - ValueError if the edges contain identifiers that are not in the nodes
+    '''
+
+    identifiers = pd.Index(nodes.identifier.values)
+
+    sources = identifiers.get_indexer(edges.id1.values).astype(np.int32)
+    targets = identifiers.get_indexer(edges.id2.values).astype(np.int32)
+
+    if (sources < 0).any() or (targets < 0).any():
+        raise ValueError(f'{(sources < 0).sum() + (targets < 0).sum()} edge endpoints were not found in the nodes')
+
+    weights = None
+    if weight_column is not None:
+        weights = edges[weight_column].values.astype(np.float64)
+
+    return(identifiers, sources, targets, weights)
+
+
+def build_graph(nodes, edges, weighted = True):
+    '''
+    Builds an undirected igraph Graph with one vertex per node (in the same order as nodes)
+
+    params
+        - nodes (pd.DataFrame): Nodes of the graph (see factorize_graph)
+        - edges (pd.DataFrame): Edges of the graph (see factorize_graph)
+        - weighted (boolean): If True, the column weight is set as the 'weight' edge attribute
+
+    returns
+        G (ig.Graph): the graph
+        identifiers (pd.Index): the identifier of each vertex
+    '''
+
+    identifiers, sources, targets, weights = factorize_graph(nodes, edges, weight_column = 'weight' if weighted else None)
+
+    G = ig.Graph(n = len(identifiers), edges = np.column_stack((sources, targets)).tolist(), directed = False)
+
+    if weighted:
+        G.es['weight'] = weights.tolist()
+
+    return(G, identifiers)
+
+
+def build_csr(nodes, edges, weighted = True):
+    '''
+    Builds the symmetric adjacency matrix (scipy CSR) of the undirected graph, with one row per node
+    (in the same order as nodes).
+
+    params
+        - nodes (pd.DataFrame): Nodes of the graph (see factorize_graph)
+        - edges (pd.DataFrame): Edges of the graph (see factorize_graph)
+        - weighted (boolean): If True, the entries are the weights, else 1
+
+    returns
+        A (sp.csr_matrix): the adjacency matrix (n x n)
+        identifiers (pd.Index): the identifier of each row
+    '''
+
+    identifiers, sources, targets, weights = factorize_graph(nodes, edges, weight_column = 'weight' if weighted else None)
+
+    if not weighted:
+        weights = np.ones(sources.shape[0], dtype = np.float64)
+
+    A = csr_from_arrays(len(identifiers), sources, targets, weights)
+
+    return(A, identifiers)
+
+
+def build_csr_pair(nodes, edges):
+    '''
+    Builds both the weighted and the unweighted adjacency matrices (see build_csr) with a single factorization.
+    Parallel edges count once per edge in the unweighted matrix (same as igraph).
+
+    returns
+        A_weighted (sp.csr_matrix)
+        A_unweighted (sp.csr_matrix)
+        identifiers (pd.Index): the identifier of each row
+    '''
+
+    identifiers, sources, targets, weights = factorize_graph(nodes, edges, weight_column = 'weight')
+
+    A_weighted = csr_from_arrays(len(identifiers), sources, targets, weights)
+    A_unweighted = csr_from_arrays(len(identifiers), sources, targets, np.ones(sources.shape[0], dtype = np.float64))
+
+    return(A_weighted, A_unweighted, identifiers)
+
+
+def csr_from_arrays(n, sources, targets, weights):
+    '''
+    Builds the symmetric CSR adjacency matrix from the integer arrays. Parallel edges are summed and
+    self loops have twice their weight in the diagonal (a loop adds two to the degree), as igraph does in
+    pagerank and evcent (see tests/test_centrality.py).
+
+    params
+        - n (int): number of vertices
+        - sources (np.array): integer ids
+        - targets (np.array): integer ids
+        - weights (np.array): weights
+
+    returns
+        sp.csr_matrix (n x n)
+    '''
+
+    # Both directions (self loops are added twice to the diagonal)
+    rows = np.concatenate((sources, targets))
+    cols = np.concatenate((targets, sources))
+    data = np.concatenate((weights, weights))
+
+    A = sp.csr_matrix((data, (rows, cols)), shape = (n, n))
+    A.sum_duplicates()
+
+    return(A)
+
+
 ################# FUNCTIONS FROM NOTES #####################
 
 def compute_personalized_pagerank(nodes, edges, weighted):
@@ -2062,18 +2620,9 @@ def compute_personalized_pagerank(nodes, edges, weighted):
     '''
     
     # Create the graph
-    G = ig.Graph()
-
-    # Adds the values
-    G.add_vertices(nodes.identifier.values)        
-
-    if edges.shape[0] > 0:
-        G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
+    G, _ = build_graph(nodes, edges, weighted)
     
     if weighted:
-        # Adds weights to edges
-        G.es['weight'] = edges.weight.values
-
         # Exctracs the personalized pagerank
         personalized_page_rank = G.personalized_pagerank(weights = 'weight', directed = False, reset = nodes['dist_weight'].values)
     
@@ -2088,18 +2637,9 @@ def compute_pagerank(nodes, edges, weighted):
     
     
     # Create the graph
-    G = ig.Graph()
-
-    # Adds the values
-    G.add_vertices(nodes.identifier.values)        
-
-    if edges.shape[0] > 0:
-        G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
+    G, _ = build_graph(nodes, edges, weighted)
     
     if weighted:
-        # Adds weights to edges
-        G.es['weight'] = edges.weight.values
-
         # Exctracs the personalized pagerank
         page_rank = G.pagerank(weights = 'weight', directed = False)
     
@@ -2117,18 +2657,9 @@ def compute_eigenvector(nodes, edges, weighted):
     '''
     
     # Create the graph
-    G = ig.Graph()
-
-    # Adds the values
-    G.add_vertices(nodes.identifier.values)        
-
-    if edges.shape[0] > 0:
-        G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
+    G, _ = build_graph(nodes, edges, weighted)
     
     if weighted:
-        # Adds weights to edges
-        G.es['weight'] = edges.weight.values
-
         # Exctracs the personalized pagerank
         eigen_vector = G.evcent(weights = 'weight', directed = False)
     
@@ -2146,18 +2677,9 @@ def compute_eigenvalue(nodes, edges, weighted):
     '''
     
     # Create the graph
-    G = ig.Graph()
-
-    # Adds the values
-    G.add_vertices(nodes.identifier.values)        
-
-    if edges.shape[0] > 0:
-        G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
+    G, _ = build_graph(nodes, edges, weighted)
 
     if weighted:        
-        # Adds weights to edges
-        G.es['weight'] = edges.weight.values
-
         # Exctracs the eigen value
         _, eigen_value = G.evcent(weights = 'weight', directed = False, return_eigenvalue = True)
 
@@ -12,6 +12,10 @@ from google.cloud import bigquery
 # Local funcitons
 import utils.general_functions as ge
 
+# Parquet cache of the daily contacts (appended, so the local utils package is not shadowed)
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..'))
+from functions.parquet_cache import ParquetCache, EDGES
+
 # Gets config
 # import config_constants as con
 import constants as const
@@ -19,6 +23,7 @@ import constants as const
 # Starts the client
 client = bigquery.Client(location="US")
 job_config = bigquery.QueryJobConfig(allow_large_results = True)
+parquet_cache = ParquetCache()
 
 # Constants
 indent = const.indent
@@ -83,18 +88,9 @@ treatment_end = treatment_date + datetime.timedelta(days = int(treatment_length)
 start_date = pd.Timestamp(datetime.datetime.strptime(start_date, '%Y-%m-%d'))
 end_date = pd.Timestamp(datetime.datetime.strptime(end_date, '%Y-%m-%d'))
 
-sql_0 = f"""
-    SELECT *
-    FROM {data_set_trtm}.{treatment_polygon_name} 
-    WHERE date >= "{start_date.strftime("%Y-%m-%d")}" AND date <= "{end_date.strftime("%Y-%m-%d")}"
-    """
-
-# Make query for treatment
+# Treatment contacts (from the local cache, only the missing dates are downloaded)
 print(indent + f"Retreiving treatment contacts between {start_date} and {end_date}.")
-query_job = client.query(sql_0, job_config=job_config) 
-
-# Return the results as a pandas DataFrame
-df_edges_treatment = query_job.to_dataframe()
+df_edges_treatment = parquet_cache.read(client, EDGES, treatment_polygon_name, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"), dataset_id = data_set_trtm, columns = ["date", "hour"])
 
 if df_edges_treatment.empty:
     raise Exception("No points found for the given treatment coordinates")
@@ -153,18 +149,9 @@ if control_flag:
     data_name_ctrl = df_database.at[0, "name"]
     data_name_ctrl = ge.clean_for_publication(data_name_ctrl)
     
-    sql_1 = f"""
-        SELECT *
-        FROM {data_set_ctrl}.{control_polygon_name} 
-        WHERE date >= "{start_date.strftime("%Y-%m-%d")}" AND date <= "{end_date.strftime("%Y-%m-%d")}"
-        """
-    
-    # Make query for control 
+    # Control contacts (from the local cache)
     print(indent + f"Retreiving control contacts between {start_date} and {end_date}.")
-    query_job = client.query(sql_1, job_config=job_config) 
-
-    # Return the results as a pandas DataFrame
-    df_edges_control = query_job.to_dataframe()
+    df_edges_control = parquet_cache.read(client, EDGES, control_polygon_name, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"), dataset_id = data_set_ctrl, columns = ["date", "hour"])
 
     if df_edges_treatment.empty:
         raise Exception("No points found for the given treatment coordinates")
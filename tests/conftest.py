@@ -0,0 +1,10 @@
+# Tests run offline (no BigQuery). The modules are imported as the scripts do (see excecute_attributes_update.py)
+
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.append(root)
+sys.path.append(os.path.join(root, 'functions'))
+sys.path.append(os.path.join(root, 'update_attributes'))
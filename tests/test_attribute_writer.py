@@ -0,0 +1,68 @@
+# Tests of the spill files of the attribute writer (see functions/attribute_writer.py)
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+import attribute_writer as aw
+
+
+def leave_spill(tmp_path, table_id, df):
+    '''
+    Leaves the spill file (and its types) of a run that did not finish
+    '''
+
+    writer = aw.AttributeWriter(table_id, spill_folder = str(tmp_path))
+    writer.append(df)
+
+    # The run dies: nothing is flushed and its files keep another pid
+    writer.frames = []
+    spill_file = writer.get_spill_file()
+    dead_file = spill_file.replace(f'.{os.getpid()}.', '.1.')
+    os.rename(spill_file, dead_file)
+    os.rename(writer.get_dtypes_file(spill_file), writer.get_dtypes_file(dead_file))
+
+
+def recover(tmp_path, table_id):
+    '''
+    Recovers the spill files and returns the recovered rows (not flushed)
+    '''
+
+    writer = aw.AttributeWriter(table_id, spill_folder = str(tmp_path))
+    writer.recover_spilled_rows()
+
+    df = pd.concat(writer.frames, ignore_index = True)
+    writer.frames = []
+
+    return(df)
+
+
+def test_recovers_attribute_spill(tmp_path):
+
+    df = pd.DataFrame({'location_id': ['a', 'b'], 'identifier': ['x', 'y'], 'date': pd.to_datetime(['2020-05-01', '2020-05-02']),
+                       'attribute_name': ['node_degree', 'node_degree'], 'attribute_value': [1.5, np.nan]})
+    leave_spill(tmp_path, 'project.dataset.nodes', df)
+
+    pd.testing.assert_frame_equal(recover(tmp_path, 'project.dataset.nodes'), df)
+
+
+def test_recovers_approximation_spill(tmp_path):
+
+    # The approximations table has no attribute_value and has integer columns
+    df = pd.DataFrame({'location_id': ['a'], 'date': pd.to_datetime(['2020-05-01']), 'attribute_name': ['betweenness_centrality'],
+                       'approximation': ['spanner'], 'parameters': [json.dumps({'seed': 1})], 'num_edges': [1000], 'approximated_num_edges': [100]})
+    leave_spill(tmp_path, 'project.dataset.approximations', df)
+
+    pd.testing.assert_frame_equal(recover(tmp_path, 'project.dataset.approximations'), df)
+
+
+def test_recovers_spill_without_dtypes(tmp_path):
+
+    # Spill files left by older versions (attribute tables only)
+    pd.DataFrame({'location_id': ['a'], 'date': ['2020-05-01'], 'attribute_name': ['graph_size'], 'attribute_value': ['3.0']}).to_csv(tmp_path / 'project.dataset.graphs.1.spill.csv', index = False)
+
+    df = recover(tmp_path, 'project.dataset.graphs')
+
+    assert df.attribute_value.dtype == np.float64
+    assert df.date.iloc[0] == pd.Timestamp('2020-05-01')
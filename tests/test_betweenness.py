@@ -0,0 +1,79 @@
+# Tests of the pivot sampling betweenness (see functions/betweenness_engine.py) against igraph, over graphs with
+# self loops and parallel edges
+
+import numpy as np
+import igraph as ig
+import pytest
+
+import betweenness_engine as be
+
+
+def get_graph(seed = 0, n = 150, m = 600, num_loops = 10, num_parallel = 30):
+    '''
+    Random connected graph (a ring plus random edges) with self loops and parallel edges
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    sources = np.concatenate((np.arange(n), rng.integers(0, n, m)))
+    targets = np.concatenate(((np.arange(n) + 1) % n, rng.integers(0, n, m)))
+    targets[n:n + num_loops] = sources[n:n + num_loops]
+
+    # Parallel edges
+    sources = np.concatenate((sources, sources[-num_parallel:]))
+    targets = np.concatenate((targets, targets[-num_parallel:]))
+
+    weights = rng.integers(1, 5, sources.shape[0]).astype(float)
+
+    G = ig.Graph(n = n, edges = list(zip(sources, targets)))
+    G.es['weight'] = weights
+
+    return(n, sources, targets, weights, G)
+
+
+@pytest.mark.parametrize('weighted', [True, False])
+def test_exact(weighted):
+
+    n, sources, targets, weights, G = get_graph()
+
+    expected = np.array(G.betweenness(weights = 'weight' if weighted else None, directed = False))
+    values = be.betweenness(n, sources, targets, weights if weighted else None, num_processes = 1)
+
+    assert values == pytest.approx(expected, rel = 1e-9, abs = 1e-9)
+
+
+def test_processes():
+
+    n, sources, targets, weights, _ = get_graph()
+
+    values = be.betweenness(n, sources, targets, weights, sample_size = 60, num_processes = 1)
+
+    assert np.allclose(be.betweenness(n, sources, targets, weights, sample_size = 60, num_processes = 2), values)
+
+
+def test_sampled():
+
+    n, sources, targets, weights, G = get_graph()
+    expected = np.array(G.betweenness(weights = 'weight', directed = False))
+
+    # Unbiased: the average over seeds gets close to the exact values
+    values = np.mean([be.betweenness(n, sources, targets, weights, sample_size = 30, seed = seed, num_processes = 1) for seed in range(100)], axis = 0)
+
+    assert np.abs(values - expected).sum() < 0.1*expected.sum()
+    assert np.corrcoef(values, expected)[0, 1] > 0.95
+
+
+def test_num_pivots():
+
+    assert be.get_num_pivots(100, 10) == 100
+    assert be.get_num_pivots(200000, 1000) == be.default_num_pivots
+
+    # Within the budget, but never below the minimum
+    assert be.get_num_pivots(200000, 2000000, max_work = 2e8) == 100
+    assert be.get_num_pivots(200000, 2000000, max_work = 1) == be.min_num_pivots
+
+
+def test_directed():
+
+    with pytest.raises(ValueError):
+        be.betweenness(3, np.array([0, 1]), np.array([1, 2]), None, directed = True)
@@ -0,0 +1,71 @@
+# Tests of the sparse centralities against igraph (see functions/centrality_engine.py and functions/pagerank_engine.py),
+# over graphs with self loops. Loops count twice in the adjacency matrix (see utils.csr_from_arrays)
+
+import numpy as np
+import pandas as pd
+import igraph as ig
+import pytest
+
+import utils
+import centrality_engine as ce
+import spectral_engine as se
+
+
+def get_graph(seed = 0, n = 40, m = 120, num_loops = 12):
+    '''
+    Random connected graph (a ring plus random edges) with self loops, as compact nodes and edges
+    '''
+
+    rng = np.random.default_rng(seed)
+
+    id1 = np.concatenate((np.arange(n), rng.integers(0, n, m)))
+    id2 = np.concatenate(((np.arange(n) + 1) % n, rng.integers(0, n, m)))
+    id2[n:n + num_loops] = id1[n:n + num_loops]
+
+    nodes = pd.DataFrame({'identifier': [f'node_{i}' for i in range(n)]})
+    edges = pd.DataFrame({'id1': nodes.identifier.values[id1], 'id2': nodes.identifier.values[id2], 'weight': rng.integers(1, 6, id1.shape[0]).astype(float)})
+
+    G = ig.Graph(n = n, edges = list(zip(id1, id2)))
+    G.es['weight'] = edges.weight.values
+
+    return(nodes, edges, G)
+
+
+@pytest.mark.parametrize('weighted', [True, False])
+def test_pagerank_matches_igraph_with_loops(weighted):
+
+    nodes, edges, G = get_graph()
+    engine = ce.CentralityEngine(*utils.build_csr_pair(nodes, edges))
+
+    x, _ = engine.pagerank(weighted = weighted)
+    expected = G.pagerank(weights = 'weight' if weighted else None, directed = False)
+
+    assert np.abs(x - np.array(expected)).max() < 1e-8
+
+
+def test_personalized_pagerank_matches_igraph_with_loops():
+
+    nodes, edges, G = get_graph(seed = 1)
+    engine = ce.CentralityEngine(*utils.build_csr_pair(nodes, edges))
+
+    reset = np.random.default_rng(1).random(nodes.shape[0])
+    x, _ = engine.pagerank(resets = reset)
+    expected = G.personalized_pagerank(weights = 'weight', directed = False, reset = reset)
+
+    assert np.abs(x - np.array(expected)).max() < 1e-8
+
+
+@pytest.mark.parametrize('weighted', [True, False])
+def test_eigenvector_matches_igraph_with_loops(weighted):
+
+    nodes, edges, G = get_graph(seed = 2)
+    engine = ce.CentralityEngine(*utils.build_csr_pair(nodes, edges))
+
+    x, value = engine.eigenvector(weighted = weighted)
+    expected, expected_value = G.eigenvector_centrality(weights = 'weight' if weighted else None, return_eigenvalue = True)
+
+    assert np.abs(x - np.array(expected)).max() < 1e-6
+    assert value == pytest.approx(expected_value, rel = 1e-8)
+
+    radius, _, _ = se.spectral_radius(engine.get_matrix(weighted))
+    assert radius == pytest.approx(expected_value, rel = 1e-6)
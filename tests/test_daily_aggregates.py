@@ -0,0 +1,71 @@
+# Tests of the per day aggregates (see functions/daily_aggregates.py) with fake downloads
+
+import pandas as pd
+
+import graph_data_cache as gdc
+import daily_aggregates as da
+
+
+class FakeParquetCache():
+    '''
+    Only provides the coverage of the locations
+    '''
+
+    def __init__(self, max_date):
+        self.max_date = max_date
+
+    def get_coverage(self, client, kind, location_id):
+        return(self.max_date)
+
+
+def get_day_nodes(d):
+    # Nodes that depend on the day, so every window is different and nodes leave the windows
+    day = int(d[-2:])
+    return(pd.DataFrame({'identifier': [f'node_{(day + i) % 11}' for i in range(3)], 'weight': [day, 1, 2]}))
+
+
+def fetch_nodes(days, downloaded, empty_days = []):
+    downloaded.extend(days)
+    groups = {d : get_day_nodes(d) for d in days if d not in empty_days}
+    return(groups, get_day_nodes('2021-01-01').iloc[:0])
+
+
+def test_only_complete_days_stored():
+
+    cache = gdc.GraphDataCache()
+    store = da.DailyAggregateStore(cache, parquet_cache = FakeParquetCache('2021-01-03'))
+
+    downloaded = []
+    dates = da.get_dates('2021-01-01', '2021-01-05')
+    store.get_day_blocks(None, 'A', dates, gdc.KIND_DAILY_NODES, lambda days: fetch_nodes(days, downloaded, empty_days = ['2021-01-02', '2021-01-05']))
+
+    # Empty days are stored only if complete
+    assert [d for d in dates if cache.contains('A', d, d, gdc.KIND_DAILY_NODES)] == ['2021-01-01', '2021-01-02', '2021-01-03']
+
+    # Incomplete days are downloaded again
+    downloaded.clear()
+    store.get_day_blocks(None, 'A', dates, gdc.KIND_DAILY_NODES, lambda days: fetch_nodes(days, downloaded))
+    assert downloaded == ['2021-01-04', '2021-01-05']
+
+
+def test_window_slide(monkeypatch):
+
+    cache = gdc.GraphDataCache()
+    store = da.DailyAggregateStore(cache, parquet_cache = FakeParquetCache('2021-12-31'))
+
+    downloaded = []
+    monkeypatch.setattr(store, 'download_daily_nodes', lambda client, location_id, days: fetch_nodes(days, downloaded))
+
+    # Weekly windows moving one day at a time
+    for start in pd.date_range('2021-01-01', '2021-01-20'):
+        start_date_string = start.strftime('%Y-%m-%d')
+        end_date_string = (start + pd.Timedelta(days = 6)).strftime('%Y-%m-%d')
+
+        df = store.get_window_nodes(None, 'A', start_date_string, end_date_string)
+
+        expected = pd.concat([get_day_nodes(d) for d in da.get_dates(start_date_string, end_date_string)]).groupby('identifier').weight.sum()
+        assert df.set_index('identifier').weight.sort_index().equals(expected.sort_index())
+
+    # Only the first window is assembled from scratch and each day is downloaded once
+    assert store.full_windows == 1 and store.incremental_windows == 19
+    assert sorted(downloaded) == da.get_dates('2021-01-01', '2021-01-26')
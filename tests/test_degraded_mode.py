@@ -0,0 +1,48 @@
+# Tests of the degraded mode of the attributes (see attribute_generic.get_compact_edgelist): the approximation of
+# a window is computed and recorded once, whichever attributes read it
+
+import numpy as np
+import pandas as pd
+
+import sparsification_engine as spe
+import attribute_generic
+import update_attributes as ua
+
+
+def get_attribute(monkeypatch, attribute_name, degraded_mode, max_num_edges):
+    attribute = [att for att in ua.all_graph_attributes + ua.all_node_attributes if att.attribute_name == attribute_name][0]
+    monkeypatch.setattr(attribute, 'degraded_mode', degraded_mode)
+    monkeypatch.setattr(attribute, 'max_num_edges', max_num_edges)
+    return(attribute)
+
+
+def test_approximation_recorded_once(monkeypatch):
+
+    rng = np.random.default_rng(0)
+    edges = pd.DataFrame({'id1': rng.integers(0, 50, 300).astype(np.int32), 'id2': rng.integers(50, 100, 300).astype(np.int32), 'weight': rng.integers(1, 10, 300).astype(float), 'total_contacts': 1.0})
+    downloads = []
+
+    def download_compact_edgelist(self, location_id, start_date_string, end_date_string):
+        downloads.append(location_id)
+        return(edges)
+
+    cache = attribute_generic.gdc.GraphDataCache()
+    monkeypatch.setattr(attribute_generic, 'graph_data_cache', cache)
+    monkeypatch.setattr(attribute_generic.GenericWeeklyAttribute, 'download_compact_edgelist', download_compact_edgelist)
+
+    writer = attribute_generic.approximation_writer
+    writer.frames = []
+
+    attributes = [get_attribute(monkeypatch, 'graph_num_edges', spe.TOP_K, 100), get_attribute(monkeypatch, 'graph_transitivity', spe.TOP_K, 100), get_attribute(monkeypatch, 'graph_size', spe.TOP_K, 1000)]
+    try:
+        results = [att.get_compact_edgelist('A', '2021-01-01', '2021-01-07') for att in attributes for _ in range(2)]
+        recorded = pd.concat(writer.frames, ignore_index = True)
+    finally:
+        writer.frames = []
+
+    assert downloads == ['A']
+    assert [df.shape[0] for df in results] == [100, 100, 100, 100, 300, 300]
+
+    # A single row for the shared approximation, none for the window within the limit
+    assert recorded.shape[0] == 1
+    assert recorded.approximation[0] == spe.TOP_K and recorded.max_num_edges[0] == 100
@@ -0,0 +1,65 @@
+# Tests of the graph data cache (see functions/graph_data_cache.py): returned frames are copies and the lock files
+# of dead or stale processes are taken over
+
+import os
+import time
+import subprocess
+import sys
+
+import pandas as pd
+
+import graph_data_cache as gdc
+
+
+def get_dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return(process.pid)
+
+
+def test_get_if_present_copy():
+
+    cache = gdc.GraphDataCache()
+    cache.store('A', '2021-01-01', '2021-01-01', gdc.KIND_DAILY_NODES, pd.DataFrame({'identifier': [1, 2], 'weight': [1.0, 2.0]}))
+
+    df = cache.get_if_present('A', '2021-01-01', '2021-01-01', gdc.KIND_DAILY_NODES)
+    df['weight'] = 0
+
+    assert cache.get_if_present('A', '2021-01-01', '2021-01-01', gdc.KIND_DAILY_NODES).weight.tolist() == [1.0, 2.0]
+
+
+def test_lock_of_dead_process(tmp_path):
+
+    cache = gdc.GraphDataCache(disk_location = str(tmp_path))
+    key = ('A', '2021-01-01', '2021-01-07', gdc.KIND_COMPACT_NODES)
+    lock_file_name = cache.get_file_name(key) + '.lock'
+
+    with open(lock_file_name, 'w') as f:
+        f.write(f'{get_dead_pid()} {time.time()}')
+
+    df = cache.get(*key, lambda: pd.DataFrame({'identifier': ['a'], 'weight': [1]}))
+
+    assert df.identifier.tolist() == ['a']
+    assert not os.path.exists(lock_file_name)
+
+
+def test_lock_age(tmp_path):
+
+    lock_file_name = str(tmp_path / 'test.lock')
+
+    # Alive and recent: kept
+    with open(lock_file_name, 'w') as f:
+        f.write(f'{os.getppid()} {time.time()}')
+    assert not gdc.remove_stale_lock_file(lock_file_name)
+
+    # Alive but old: taken over
+    with open(lock_file_name, 'w') as f:
+        f.write(f'{os.getppid()} {time.time() - gdc.stale_lock_seconds - 1}')
+    assert gdc.remove_stale_lock_file(lock_file_name)
+
+    # Only the owner removes its lock
+    assert gdc.create_lock_file(lock_file_name)
+    with open(lock_file_name, 'w') as f:
+        f.write(f'{os.getppid()} {time.time()}')
+    gdc.remove_lock_file(lock_file_name)
+    assert os.path.exists(lock_file_name)
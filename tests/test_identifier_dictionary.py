@@ -0,0 +1,44 @@
+# Tests of the identifier encoding (see functions/identifier_dictionary.py)
+
+import numpy as np
+import pandas as pd
+
+import identifier_dictionary as idd
+
+
+def test_round_trip():
+
+    dictionary = idd.IdentifierDictionary()
+    identifiers = np.array([f'device_{i % 3000}' for i in range(10000)], dtype = object)
+
+    codes = dictionary.encode(identifiers)
+
+    # Grows past its initial capacity
+    assert len(dictionary) == 3000 > idd.initial_capacity
+    assert codes.dtype == np.int32
+    assert np.array_equal(dictionary.decode(codes), identifiers)
+
+    # Same codes the next time, -1 for unknown identifiers on lookup
+    assert np.array_equal(dictionary.encode(identifiers[::-1]), codes[::-1])
+    assert list(dictionary.lookup(['device_5', 'unknown'])) == [dictionary.encode(['device_5'])[0], -1]
+    assert len(dictionary) == 3000
+
+    assert dictionary.encode([]).shape == (0,)
+
+
+def test_frame_round_trip():
+
+    dictionary = idd.IdentifierDictionary()
+    df = pd.DataFrame({'id1': ['a', 'b', 'c'], 'id2': ['b', 'c', 'a'], 'weight': [1.0, 2.0, 3.0]})
+
+    encoded = dictionary.encode_frame(df.copy())
+    assert idd.is_encoded(encoded.id1) and idd.is_encoded(encoded.id2)
+    assert encoded.id1.tolist() == encoded.id2.tolist()[-1:] + encoded.id2.tolist()[:-1]
+
+    # Already encoded columns are left as they are
+    assert dictionary.encode_frame(encoded.copy()).equals(encoded)
+
+    decoded = dictionary.decode_frame(encoded)
+    assert decoded.equals(df)
+    assert idd.is_encoded(encoded.id1)
+    assert dictionary.decode_frame(df) is df
@@ -0,0 +1,44 @@
+# Tests of the manifest lock of the parquet cache (see functions/parquet_cache.py): the lock of a dead process is
+# taken over and a process never removes a lock that is not its own
+
+import os
+import time
+import subprocess
+import sys
+
+import parquet_cache as pqc
+
+
+def get_dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return(process.pid)
+
+
+def test_lock_of_dead_process(tmp_path):
+
+    cache = pqc.ParquetCache(location = str(tmp_path))
+    lock_file_name = cache.manifest_file + '.lock'
+
+    with open(lock_file_name, 'w') as f:
+        f.write(f'{get_dead_pid()} {time.time()}')
+
+    cache.update_manifest(lambda partitions: partitions.update({'edges/A/2021-01-01': {'bytes': 1}}))
+
+    assert 'edges/A/2021-01-01' in cache.load_manifest()
+    assert not os.path.exists(lock_file_name)
+
+
+def test_lock_taken_over(tmp_path):
+
+    cache = pqc.ParquetCache(location = str(tmp_path))
+    lock_file_name = cache.manifest_file + '.lock'
+
+    def take_over(partitions):
+        # Another process takes the lock while this one holds it
+        with open(lock_file_name, 'w') as f:
+            f.write(f'{os.getppid()} {time.time()}')
+
+    cache.update_manifest(take_over)
+
+    assert pqc.read_lock_file(lock_file_name)[0] == os.getppid()
@@ -0,0 +1,51 @@
+# Tests of the power law engine (see functions/powerlaw_engine.py)
+
+import numpy as np
+import pytest
+from scipy.special import zeta
+
+import powerlaw_engine as ple
+
+
+def grid_alpha(values, xmin):
+    # Minimum of the exact negative log likelihood over a fine grid of the allowed exponents
+    grid = np.linspace(ple.min_alpha, ple.max_alpha, 90001)
+    nll = values.shape[0]*np.log(zeta(grid, xmin)) + grid*np.log(values).sum()
+    return(grid[nll.argmin()])
+
+
+@pytest.mark.parametrize('alpha, xmin', [(1.2, 1), (1.6, 10), (2.5, 3), (3.5, 10), (6, 1), (8, 3)])
+def test_fit_powerlaw(alpha, xmin):
+
+    values = ple.sample_powerlaw(alpha, xmin, 3000, np.random.default_rng(0))
+
+    assert ple.fit_powerlaw(values, xmin) == pytest.approx(grid_alpha(values, xmin), abs = 1e-3)
+
+
+def test_fit_powerlaw_bounds():
+
+    # Steeper than max_alpha: every value is xmin
+    assert ple.fit_powerlaw(np.full(100, 5.0), 5) == pytest.approx(ple.max_alpha, abs = 1e-4)
+
+
+def test_fit_lognormal():
+
+    values = np.round(np.exp(np.random.default_rng(0).normal(3, 0.8, 20000)))
+    mu, sigma = ple.fit_lognormal(values[values >= 10], 10)
+
+    assert mu == pytest.approx(3, abs = 0.1)
+    assert sigma == pytest.approx(0.8, abs = 0.05)
+
+
+def test_p_value():
+
+    values = ple.sample_powerlaw(2.5, 1, 2000, np.random.default_rng(0))
+
+    # Asymptotic by default, bootstrap only if asked
+    response = ple.powerlaw_test(values, xmin = 1)
+    assert 0 < response['p_value'] <= 1
+    assert ple.powerlaw_test(values, xmin = 1) == response
+
+    bootstrap_response = ple.powerlaw_test(values, xmin = 1, num_bootstrap = 10)
+    assert bootstrap_response['p_value'] in [i/10 for i in range(11)]
+    assert {key : bootstrap_response[key] for key in bootstrap_response if key != 'p_value'} == {key : response[key] for key in response if key != 'p_value'}
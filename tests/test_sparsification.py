@@ -0,0 +1,73 @@
+# Tests of the bounded size approximations of the edgelists (see functions/sparsification_engine.py)
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sparsification_engine as spe
+
+
+def get_edges(num_edges = 2000, seed = 0):
+    rng = np.random.default_rng(seed)
+    return(pd.DataFrame({'id1': rng.integers(0, 200, num_edges), 'id2': rng.integers(0, 200, num_edges), 'weight': rng.pareto(1.5, num_edges) + 1}))
+
+
+def weighted_degrees(edges):
+    return(pd.concat([edges[['id1', 'weight']].rename(columns = {'id1': 'node'}), edges[['id2', 'weight']].rename(columns = {'id2': 'node'})]).groupby('node').weight.sum())
+
+
+def test_top_k():
+
+    edges = get_edges()
+    kept, parameters = spe.sparsify(edges, spe.TOP_K, 100)
+
+    assert kept.shape[0] == 100
+    assert set(kept.weight) == set(edges.weight.nlargest(100))
+    assert parameters == {'max_edges': 100, 'min_weight': kept.weight.min()}
+
+    # Order of the edgelist kept
+    positions = edges.reset_index().merge(kept, on = ['id1', 'id2', 'weight'])['index'].values
+    assert (np.diff(positions) > 0).all()
+
+
+def test_within_limit():
+
+    edges = get_edges(50)
+
+    for method in spe.METHODS:
+        kept, _ = spe.sparsify(edges, method, 100)
+        assert kept.equals(edges)
+
+
+def test_edge_sample():
+
+    edges = get_edges()
+    kept, parameters = spe.sparsify(edges, spe.EDGE_SAMPLE, 500)
+
+    assert kept.shape[0] <= 500
+    assert kept.equals(spe.sparsify(edges, spe.EDGE_SAMPLE, 500)[0])
+
+    # Expected size is max_edges and the edges kept with probability 1 keep their weight
+    probabilities = np.minimum(1, parameters['scale']*edges.weight.values)
+    assert probabilities.sum() == pytest.approx(500)
+    assert (probabilities == 1).sum() > 0
+    assert set(edges.weight.values[probabilities == 1]) <= set(kept.weight.values)
+
+
+def test_edge_sample_unbiased():
+
+    edges = get_edges()
+    expected = weighted_degrees(edges)
+
+    # Weighted degrees preserved in expectation (average over seeds)
+    degrees = pd.concat([weighted_degrees(spe.sparsify(edges, spe.EDGE_SAMPLE, 500, seed = seed)[0]) for seed in range(200)], axis = 1).fillna(0).mean(axis = 1)
+    degrees = degrees.reindex(expected.index).fillna(0)
+
+    assert degrees.sum() == pytest.approx(expected.sum(), rel = 0.02)
+    assert np.abs(degrees - expected).max() < 0.25*expected.max()
+
+
+def test_unsupported_method():
+
+    with pytest.raises(ValueError):
+        spe.sparsify(get_edges(), 'spectral', 100)
@@ -0,0 +1,83 @@
+# Tests of the nearest point and nearest geometry indices (see functions/spatial_engine.py) against the haversine
+# brute force over every pair
+
+import numpy as np
+import pytest
+
+import spatial_engine as se
+
+
+def get_points(rng, size):
+    # Bogota sized box
+    return(rng.uniform(4.45, 4.85, size), rng.uniform(-74.25, -73.98, size))
+
+
+def brute_force(lat, lon, case_lat, case_lon):
+    return(np.array([se.haversine(la, lo, case_lat, case_lon).min() for la, lo in zip(lat, lon)]))
+
+
+def densify(vertices, step_meters = 0.5):
+    '''
+    Points along the (lon, lat) segments of the vertices, every step_meters at most
+    '''
+
+    points = [vertices[:1]]
+    for start, end in zip(vertices[:-1], vertices[1:]):
+        pieces = max(1, int(np.ceil(se.haversine(start[1], start[0], end[1], end[0])/step_meters)))
+        points.append(start + (end - start)*(np.arange(1, pieces + 1)/pieces)[:,None])
+
+    return(np.vstack(points))
+
+
+def test_nearest_point():
+
+    rng = np.random.default_rng(0)
+    case_lat, case_lon = get_points(rng, 2000)
+    lat, lon = get_points(rng, 300)
+
+    distances = se.NearestPointIndex(case_lat, case_lon).query(lat, lon)
+
+    assert distances == pytest.approx(brute_force(lat, lon, case_lat, case_lon), abs = 1e-3)
+
+
+def test_nearest_point_missing():
+
+    rng = np.random.default_rng(1)
+    case_lat, case_lon = get_points(rng, 100)
+    case_lat[:10] = np.nan
+
+    lat, lon = get_points(rng, 20)
+    lat[0] = np.nan
+
+    distances = se.NearestPointIndex(case_lat, case_lon).query(lat, lon)
+
+    assert np.isnan(distances[0])
+    assert distances[1:] == pytest.approx(brute_force(lat[1:], lon[1:], case_lat[10:], case_lon[10:]), abs = 1e-3)
+    assert np.isnan(se.NearestPointIndex([], []).query(lat, lon)).all()
+
+
+def test_nearest_geometry():
+
+    rng = np.random.default_rng(2)
+    case_lat, case_lon = get_points(rng, 300)
+    sizes = rng.uniform(0.0003, 0.0015, 300)
+
+    # Block sized squares, a line and a point
+    geometries = [{'type': 'Polygon', 'coordinates': [[[x, y], [x + s, y], [x + s, y + s], [x, y + s], [x, y]]]} for x, y, s in zip(case_lon, case_lat, sizes)]
+    geometries.append({'type': 'LineString', 'coordinates': [[-74.2, 4.5], [-74.1, 4.6]]})
+    geometries.append({'type': 'Point', 'coordinates': [-74.0, 4.8]})
+    geometries.append(None)
+
+    # Random houses and houses inside the squares
+    lat, lon = get_points(rng, 200)
+    lat = np.concatenate((lat, case_lat[:20] + sizes[:20]/2))
+    lon = np.concatenate((lon, case_lon[:20] + sizes[:20]/2))
+
+    distances = se.NearestGeometryIndex(geometries).query(lat, lon)
+
+    boundary = np.vstack([densify(np.array(g['coordinates'][0] if g['type'] == 'Polygon' else g['coordinates'], dtype = np.float64).reshape(-1, 2)) for g in geometries if g is not None])
+    inside = np.array([((la >= case_lat) & (la <= case_lat + sizes) & (lo >= case_lon) & (lo <= case_lon + sizes)).any() for la, lo in zip(lat, lon)])
+    expected = np.where(inside, 0, brute_force(lat, lon, boundary[:,1], boundary[:,0]))
+
+    assert inside[-20:].all()
+    assert distances == pytest.approx(expected, abs = 0.5)
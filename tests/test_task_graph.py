@@ -0,0 +1,66 @@
+# Tests of the task scheduler (see update_attributes.execute_task_graph) with a fake run_unit: failed and killed
+# workers fail the task and its dependents and the rest of the tasks still run
+
+import os
+
+import pytest
+
+import update_attributes as ua
+
+
+dates = ['2021-01-01', '2021-01-02', '2021-01-03', '2021-01-04']
+locations = ['A', 'B', 'C']
+
+# (attribute_name, location_id, date) -> how the fake run_unit fails
+failures = {}
+
+
+def fake_run_unit(kind, att_index, location_id, date_strings, derived = [], flush = True):
+
+    att = ua.get_attributes(kind)[att_index]
+    failure = failures.get((att.attribute_name, location_id, date_strings[0]))
+    if failure == 'raise':
+        raise RuntimeError('worker failure')
+    if failure == 'kill':
+        os._exit(1)
+
+    derived_results = [{'kind': ua.GRAPHS, 'attribute_name': ua.all_graph_attributes[i].attribute_name, 'location_id': location_id, 'dates': date_strings, 'computed': 1, 'skipped': 0, 'error': None, 'elapsed_seconds': 0} for i in derived]
+    return({'kind': kind, 'attribute_name': att.attribute_name, 'location_id': location_id, 'dates': date_strings, 'computed': 1, 'skipped': 0, 'error': None, 'elapsed_seconds': 0, 'derived_results': derived_results})
+
+
+@pytest.fixture
+def task_graph(monkeypatch):
+
+    monkeypatch.setattr(ua, 'run_unit', fake_run_unit)
+    monkeypatch.setattr(ua, 'init_worker', lambda: None)
+    monkeypatch.setattr(ua.pipeline_context.shared_context, 'get_graph_size', lambda location_id, date_string: (1000, 10000))
+
+    units = [(ua.NODES, att_index, location_id, dates) for att_index in range(len(ua.all_node_attributes)) for location_id in locations]
+    units += [(ua.GRAPHS, att_index, location_id, dates) for att_index in range(len(ua.all_graph_attributes)) for location_id in locations]
+    tasks, dependencies, dependents = ua.get_task_graph(units)
+    _, ranks = ua.get_task_costs(tasks, dependents)
+
+    yield tasks, dependencies, dependents, ranks, len(units) * len(dates)
+    failures.clear()
+
+
+@pytest.mark.parametrize('num_workers, failure', [(1, 'raise'), (3, 'raise'), (3, 'kill')])
+def test_worker_failure(task_graph, monkeypatch, num_workers, failure):
+
+    tasks, dependencies, dependents, ranks, num_results = task_graph
+    monkeypatch.setattr(ua, 'num_workers', num_workers)
+    failures[('node_degree', 'A', '2021-01-02')] = failure
+
+    results = ua.execute_task_graph(tasks, dependencies, dependents, ranks = ranks)
+
+    # Every task (and folded derived attribute) is reported once
+    assert len(results) == num_results
+    assert len({(res['attribute_name'], res['location_id'], res['dates'][0]) for res in results}) == num_results
+
+    failed = {(res['attribute_name'], res['location_id'], res['dates'][0]) for res in results if res['error'] is not None}
+    assert ('node_degree', 'A', '2021-01-02') in failed
+    assert ('node_degree', 'A', '2021-01-04') in failed
+    assert ('node_degree', 'A', '2021-01-01') not in failed
+
+    # Other locations are not affected
+    assert all(location_id == 'A' for _, location_id, _ in failed)
@@ -0,0 +1,53 @@
+# Tests of the wedge sampling transitivity (see functions/transitivity_engine.py) against igraph
+
+import numpy as np
+import igraph as ig
+import pytest
+
+import transitivity_engine as te
+
+
+def get_graph(seed = 0, n = 300, m = 3000):
+    '''
+    Random graph with communities (so it has triangles), self loops and parallel edges
+    '''
+
+    rng = np.random.default_rng(seed)
+    sources = rng.integers(0, n, m)
+    targets = np.where(rng.random(m) < 0.7, (sources//10)*10 + rng.integers(0, 10, m), rng.integers(0, n, m))
+    targets = np.minimum(targets, n - 1)
+
+    return(n, sources, targets)
+
+
+def test_transitivity():
+
+    n, sources, targets = get_graph()
+
+    G = ig.Graph(n = n, edges = list(zip(sources, targets)))
+    G.simplify()
+    expected = G.transitivity_undirected()
+
+    value = te.transitivity(n, sources, targets, epsilon = 0.01, delta = 0.001)
+
+    assert value == pytest.approx(expected, abs = 0.01)
+    assert value == te.transitivity(n, sources, targets, epsilon = 0.01, delta = 0.001)
+
+
+def test_transitivity_bounds():
+
+    # Triangle: every wedge is closed
+    assert te.transitivity(3, np.array([0, 1, 2]), np.array([1, 2, 0])) == 1.0
+
+    # Star: no wedge is closed
+    assert te.transitivity(5, np.zeros(4, dtype = int), np.arange(1, 5)) == 0.0
+
+    # No wedges (as igraph)
+    assert np.isnan(te.transitivity(4, np.array([0, 2]), np.array([1, 3])))
+
+
+def test_sample_size():
+
+    # Hoeffding: the error bound does not depend on the graph
+    assert te.get_sample_size(0.01, 0.01) == int(np.ceil(np.log(2/0.01)/(2*0.01**2)))
+    assert te.get_sample_size(0.005, 0.01) > te.get_sample_size(0.01, 0.01)
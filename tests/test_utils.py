@@ -0,0 +1,70 @@
+# Tests of the graph construction and aggregation helpers (see functions/utils.py)
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+
+
+def test_factorize_graph():
+
+    nodes = pd.DataFrame({'identifier': ['c', 'a', 'b', 'd']})
+    edges = pd.DataFrame({'id1': ['a', 'b', 'c'], 'id2': ['b', 'd', 'c'], 'weight': [1, 2, 3]})
+
+    identifiers, sources, targets, weights = utils.factorize_graph(nodes, edges)
+
+    # Ids are the positions of the nodes
+    assert list(identifiers) == ['c', 'a', 'b', 'd']
+    assert sources.dtype == np.int32 and targets.dtype == np.int32
+    assert list(identifiers[sources]) == ['a', 'b', 'c'] and list(identifiers[targets]) == ['b', 'd', 'c']
+    assert weights.dtype == np.float64 and list(weights) == [1.0, 2.0, 3.0]
+
+    assert utils.factorize_graph(nodes, edges, weight_column = None)[3] is None
+
+
+def test_factorize_graph_missing_node():
+
+    nodes = pd.DataFrame({'identifier': ['a', 'b']})
+    edges = pd.DataFrame({'id1': ['a'], 'id2': ['z'], 'weight': [1]})
+
+    with pytest.raises(ValueError):
+        utils.factorize_graph(nodes, edges)
+
+
+def test_csr_from_arrays():
+
+    sources = np.array([0, 1, 0, 2, 3])
+    targets = np.array([1, 0, 2, 2, 1])
+    weights = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+
+    A = utils.csr_from_arrays(4, sources, targets, weights)
+
+    # Parallel edges are summed, both directions, loops twice in the diagonal
+    expected = np.zeros((4, 4))
+    for u, v, w in zip(sources, targets, weights):
+        expected[u, v] += w
+        expected[v, u] += w
+
+    assert A.shape == (4, 4)
+    assert np.array_equal(A.toarray(), expected)
+    assert A[2, 2] == 8.0 and A[0, 1] == 3.0
+    assert A.has_canonical_format
+
+
+def test_aggregate_values():
+
+    values = np.array([1.0, 2.0, np.nan, 3.0, 10.0])
+
+    assert utils.aggregate_values(values, 'mean') == pytest.approx(4.0)
+    assert utils.aggregate_values(values, 'quantile_0.5') == pytest.approx(2.5)
+    assert utils.aggregate_values(values, 'gini') == pytest.approx(utils.gini(values[~np.isnan(values)]))
+
+    # Equal values: no inequality
+    assert utils.aggregate_values(np.ones(10), 'gini') == pytest.approx(0, abs = 1e-6)
+
+    assert utils.aggregate_values(np.array([np.nan]), 'mean') is None
+    assert utils.aggregate_values([], 'gini') is None
+
+    with pytest.raises(ValueError):
+        utils.aggregate_values(values, 'max')
@@ -5,6 +5,17 @@ from google.cloud import bigquery
 import pandas as pd
 from datetime import datetime, timedelta
 import numpy as np
+import graph_data_cache as gdc
+import daily_aggregates as dag
+import attribute_writer as aw
+import centrality_engine as ce
+import pipeline_context as pc
+import cost_model as cm
+import sparsification_engine as spe
+import subgraph_engine as sge
+import identifier_dictionary as idd
+import parquet_cache as pqc
+import json
 
 
 # Attribute Dictionary
@@ -29,8 +40,76 @@ default_property_values['starting_date'] = utils.global_min_attribute_date # GLo
 default_property_values['max_num_nodes'] = np.inf
 # Max number of nodes allow to proceed with calculation
 default_property_values['max_num_edges'] = np.inf
-# Priority of the attribute (lower -> first)
+# Priority of the attribute (lower -> first, among tasks with the same estimated cost)
 default_property_values['priority'] = 1
+# Complexity of the algorithm, used to estimate the cost of the tasks (see cost_model)
+default_property_values['complexity'] = cm.COMPLEXITY_EDGES
+# Degraded mode (opt in): graphs above max_num_edges are computed over a bounded size approximation of their
+# edgelist (see sparsification_engine: spe.TOP_K or spe.EDGE_SAMPLE) instead of being skipped. Empty to skip them
+default_property_values['degraded_mode'] = ''
+# Attributes (names) whose values are read by this attribute. Are computed first for the same location and date
+default_property_values['dependencies'] = []
+# Node attribute (name) that this graph attribute aggregates (empty for non derived attributes).
+# Derived attributes are computed from the node result while it is still in memory (see GenericGraphAttribute)
+default_property_values['derived_from'] = ''
+# Aggregation of the derived attribute (see utils.aggregate_values)
+default_property_values['aggregation'] = ''
+# Backend for the centralities (see centrality_engine): ce.BACKEND_SPARSE or ce.BACKEND_IGRAPH
+default_property_values['centrality_backend'] = ce.BACKEND_SPARSE
+
+
+# Graph Data Cache
+# -----------------------------
+# Shared by all the attribute instances, so the same window is only downloaded once
+# Max memory of the in memory tier
+cache_max_memory_bytes = gdc.default_max_memory_bytes
+# Folder of the disk tier (None to only use memory, or a temporary folder of the run when update_attributes
+# excecutes with several workers, see worker_cache_parent_location)
+cache_disk_location = None
+
+graph_data_cache = gdc.GraphDataCache(max_memory_bytes = cache_max_memory_bytes, disk_location = cache_disk_location, identifier_dictionary = idd.identifier_dictionary)
+
+# Local parquet cache of the raw daily edges and transits (see parquet_cache), shared with the figure generation
+# and the interventions. Past days are downloaded once across runs and grouped locally. None to group the days
+# in the warehouse
+parquet_cache_location = None
+# Max size of the parquet cache (the least recently read days are evicted)
+parquet_cache_max_bytes = pqc.default_max_bytes
+
+def parquet_fetch_function(client, query):
+    '''
+    Downloads the days missing from the parquet cache (through Arrow when the storage API is available)
+    '''
+    job_config = bigquery.QueryJobConfig(allow_large_results = True)
+    return(utils.query_to_dataframe_iterable(client.query(query, job_config = job_config), page_size = dag.page_size))
+
+parquet_cache = None
+if parquet_cache_location is not None:
+    parquet_cache = pqc.ParquetCache(location = parquet_cache_location, max_bytes = parquet_cache_max_bytes, fetch_function = parquet_fetch_function)
+
+# Per day aggregates (stored in the graph data cache). Windows are assembled from them, so
+# each day is grouped only once and consecutive windows are computed incrementally.
+# Identifiers are encoded to int32 when downloaded and decoded when the results are written (see identifier_dictionary)
+daily_aggregates = dag.DailyAggregateStore(graph_data_cache, identifier_dictionary = idd.identifier_dictionary, parquet_cache = parquet_cache)
+
+
+# Hierarchical mode: the edgelists of the locations covered by another one (for example, the localidades and
+# UPZs of Bogota) are the subgraphs of the parent edgelist induced by their nodes (see download_child_edgelist),
+# so the parent window is downloaded once for all its children. Induced subgraphs include the contacts of the
+# child nodes outside the child polygon, so it is opt in (see attributes_hierarchical_mode in config.py or the
+# hierarchical argument of excecute_attributes_update.py)
+hierarchical_mode = False
+
+
+# Attribute Writers
+# -----------------------------
+# Shared by all the attribute instances. Results are buffered and inserted in batches (see attribute_writer).
+# Must be flushed before reading the attributes back from the tables
+node_attribute_writer = aw.AttributeWriter(utils.nodes_attribute_table)
+graph_attribute_writer = aw.AttributeWriter(utils.graphs_attribute_table)
+# Approximations used by the degraded mode (which one and its parameters). One row per location, window and
+# approximation (see get_approximation_key): attributes with the same degraded_mode and max_num_edges share it
+approximation_writer = aw.AttributeWriter(utils.approximations_table)
 
 
 class GenericWeeklyAttribute():
@@ -40,12 +119,13 @@ class GenericWeeklyAttribute():
     This class can be used for both nodes and graphs attributes
     '''
     # Initializer
-    def __init__(self, edited_property_values):
+    def __init__(self, edited_property_values, context = None):
         '''
         Initializer of the class.
 
         The following parameters must be provided:
             - edited_property_values : the property dictionary of the class. All None default values must be included
+            - context (PipelineContext): Shared data of the attributes. None for the shared context of the process (see pipeline_context)
 
         '''
         
@@ -59,35 +139,44 @@ class GenericWeeklyAttribute():
             if k in edited_property_values:
                 val = edited_property_values[k]
                 
-            if pd.isna(val):
+            if val is None or (np.isscalar(val) and pd.isna(val)):
                 raise ValueError(f'The property {k} must be set by the subclass and was missing or was None, in edited_property_values parameter dictionary.')
 
             # Sets the attribute
             setattr(self, k, val)
+
+        if self.centrality_backend not in [ce.BACKEND_SPARSE, ce.BACKEND_IGRAPH]:
+            raise ValueError(f'Unsupported centrality backend: {self.centrality_backend}')
+
+        if self.complexity not in cm.COMPLEXITIES:
+            raise ValueError(f'Unsupported complexity: {self.complexity}')
+
+        if self.degraded_mode != '' and (self.degraded_mode not in spe.METHODS or self.max_num_edges == np.inf):
+            raise ValueError(f'Unsupported degraded mode: {self.degraded_mode} (requires one of {spe.METHODS} and a finite max_num_edges)')
+
+        # Derived attributes depend on the attribute they aggregate
+        if self.derived_from != '' and self.derived_from not in self.dependencies:
+            self.dependencies = self.dependencies + [self.derived_from]
                 
                        
-        # Edits the initial properties
-                
-        # Starts the client
-        self.client = bigquery.Client(location="US")
-                    
-            
-        # Extracts the locations
-        self.df_locations = utils.get_current_locations(self.client)
-        self.df_locations.index = self.df_locations.location_id
-        
-        # Extract locations min support date
-        self.min_location_start_dates = utils.get_min_support_date_for_location_attributes(self.client)
-        self.min_location_start_dates.index = self.min_location_start_dates.location_id
-        
-        
-        # Extracts the sizes
-        self.df_graph_sizes = utils.get_all_graph_sizes(self.client)
-        self.df_graph_sizes.date = self.df_graph_sizes.date.apply(pd.to_datetime)
-        self.df_graph_sizes.set_index(['location_id','date'], inplace = True)
-        
-        
-        
+        # Shared data (client, locations, min support dates and graph sizes). Loaded on first use
+        self.context = pc.shared_context if context is None else context
+
+        # Dates already computed: set of (location_id, date_string). None to query the database on each date
+        self.existing_dates = None
+
+
+    @property
+    def client(self):
+        return(self.context.get_client())
+
+    @property
+    def df_locations(self):
+        return(self.context.get_locations())
+
+    @property
+    def min_location_start_dates(self):
+        return(self.context.get_min_location_start_dates())
 
 
     # --- Global Abstract Methods
@@ -103,22 +192,30 @@ class GenericWeeklyAttribute():
 
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight od the edge (see get_compact_edgelist)      
 
         
         returns
             pd.DataFrame with the following structure
                 - attribute_name (str): The attribute name
-                - identifier (str): Identifier of the node or graph
+                - identifier (int32): Identifier of the node (encoded, decoded when written) or graph
                 - value (float): The value of the attribute
         '''
         raise NotImplementedError
 
+    def attribute_exists_in_database(self, location_id, date_string):
+        '''
+        Method that checks in the database if the attribute is already computed for the location at the given date.
+        Implemented by the node and graph generic classes.
+        '''
+        raise NotImplementedError
+
+
     # -- Editable Methods (Probably)
     # -----------------------------------------------
     def location_id_supported(self, location_id):
@@ -179,11 +276,15 @@ class GenericWeeklyAttribute():
 
             
         # Uses the sizes
-        num_edges = self.df_graph_sizes.loc[(location_id,current_date),'num_edges']
-        num_nodes = self.df_graph_sizes.loc[(location_id,current_date),'num_nodes']
+        num_nodes, num_edges = self.context.get_graph_size(location_id, current_date)
         
         support_size = num_edges <= self.max_num_edges and num_nodes <= self.max_num_nodes
-        
+
+        # Degraded mode (the edgelist is approximated, see get_compact_edgelist)
+        if not support_size and self.degraded_mode != '' and num_nodes <= self.max_num_nodes:
+            print(f'               Edges: {num_edges} exceeds max: {self.max_num_edges}. Computed with degraded mode: {self.degraded_mode}')
+            support_size = True
+
         if not support_size:
             print(f'               Nodes: {num_nodes} and Edges: {num_edges} exceeds max: ({self.max_num_nodes},{self.max_num_edges})')
         
@@ -191,6 +292,55 @@ class GenericWeeklyAttribute():
 
 
 
+    def estimate_work(self, num_nodes, num_edges):
+        '''
+        Work of the attribute for a graph of the given size (see cost_model). Override it when the
+        complexity depends on the size (for example, exact below a threshold and approximated above).
+        '''
+
+        # Degraded mode computes at most max_num_edges
+        if self.degraded_mode != '':
+            num_edges = min(num_edges, self.max_num_edges)
+
+        return(cm.get_work(self.complexity, num_nodes, num_edges))
+
+
+
+    def set_existing_dates(self, df_existing):
+        '''
+        Sets the dates that are already computed, so they are not checked one by one against the database.
+
+        params
+            - df_existing (pd.DataFrame): Existing dates (see utils.get_existing_graph_attribute_dates)
+                - location_id (str)
+                - attribute_name (str)
+                - date (str): Date in %Y-%m-%d
+        '''
+
+        df = df_existing[df_existing.attribute_name == self.attribute_name]
+        self.existing_dates = set(zip(df.location_id, df.date))
+
+
+    def attribute_exists(self, location_id, date_string):
+        '''
+        Checks if the attribute is already computed for the location at the given date. Uses the existing dates
+        if they were set (see set_existing_dates), if not, queries the database.
+        '''
+
+        if self.existing_dates is not None:
+            return((location_id, date_string) in self.existing_dates)
+
+        return(self.attribute_exists_in_database(location_id, date_string))
+
+
+    def mark_as_existing(self, location_id, date_string):
+        '''
+        Adds the date to the existing dates (if they were set)
+        '''
+        if self.existing_dates is not None:
+            self.existing_dates.add((location_id, date_string))
+
+
     def compute_attribute_for_interval(self, location_id, start_date_string, end_date_string):
         '''
         Method that computes the attribute of the class for the given dates. Edit this method if the attributes requieres more than just the nodes and
@@ -251,6 +401,48 @@ class GenericWeeklyAttribute():
 
     # -- Other Methods
     # -----------------------------------------------
+    def get_approximation_key(self):
+        '''
+        Method that identifies the edgelists the attribute computes over: None for the complete ones, or the
+        degraded mode and its max number of edges (see approximate_edgelist). Included in the keys of the
+        results shared among attributes, so attributes with different approximations do not share them.
+
+        returns
+            tuple or None
+        '''
+
+        if self.degraded_mode == '':
+            return(None)
+
+        return((self.degraded_mode, self.max_num_edges))
+
+
+    def get_centrality_engine(self, nodes, edges, location_id = None, start_date_string = None, end_date_string = None):
+        '''
+        Method that gets the sparse centrality engine (see centrality_engine) of the graph. If the location and dates
+        are given, the engine is shared among the attributes that compute centralities over the same window.
+
+        parameters
+            - nodes (pd.DataFrame): the compact nodes
+            - edges (pd.DataFrame): the compact edgelist
+            - location_id(str): The graph id
+            - start_date_string (str): Start date in %Y-%m-%d
+            - end_date_string (str): End date in %Y-%m-%d
+
+        returns
+            ce.CentralityEngine (rows follow the order of the nodes)
+        '''
+
+        build_function = lambda: ce.CentralityEngine(*utils.build_csr_pair(nodes, edges))
+
+        if location_id is None:
+            return(build_function())
+
+        # Approximated edgelists (see degraded_mode) have their own engine. Rows must follow the nodes
+        key = (location_id, start_date_string, end_date_string, self.get_approximation_key())
+        return(ce.get_engine(key, build_function, identifiers = pd.Index(nodes.identifier.values)))
+
+
     def get_complete_edgelist(self, location_id, start_date_string, end_date_string):
         '''
         Method that gets the edgelist of the location. Both dates are inclusive
@@ -277,14 +469,15 @@ class GenericWeeklyAttribute():
         job_config = bigquery.QueryJobConfig(allow_large_results=True)
         query_job = self.client.query(query, job_config=job_config) 
 
-        # Return the results as a pandas DataFrame
-        df = query_job.to_dataframe()
+        # Return the results as a pandas DataFrame (through Arrow, see utils.query_to_dataframe)
+        df = utils.query_to_dataframe(query_job)
 
         return(df)
 
     def get_compact_edgelist(self, location_id, start_date_string, end_date_string):
         '''
-        Method that gets the compact edgelist of the location. Both dates are inclusive
+        Method that gets the compact edgelist of the location. Both dates are inclusive.
+        The result is shared among all attributes through the graph data cache.
 
         parameters
             location_id(str): The graph id        
@@ -293,28 +486,107 @@ class GenericWeeklyAttribute():
 
         returns
             pd.DataFrame with the grouped edglist.
-                - id1 (str)
-                - id2 (str)
-                - weight (num) : sum of contacts
+                - id1 (int32): encoded identifier (see identifier_dictionary)
+                - id2 (int32): encoded identifier
+                - weight (num) : number of records of the pair
+                - total_contacts (num) : sum of contacts
+        '''
+
+        edges = graph_data_cache.get(location_id, start_date_string, end_date_string, gdc.KIND_COMPACT_EDGES,
+                                     lambda: self.download_compact_edgelist(location_id, start_date_string, end_date_string))
+
+        if self.degraded_mode != '' and edges.shape[0] > self.max_num_edges:
+            # The approximation is also shared through the cache, so it is computed (and recorded) once per window
+            kind = f'{gdc.KIND_APPROXIMATED_EDGES}_{self.degraded_mode}_{int(self.max_num_edges)}'
+            edges = graph_data_cache.get(location_id, start_date_string, end_date_string, kind,
+                                         lambda: self.approximate_edgelist(location_id, start_date_string, end_date_string, edges))
+
+        return(edges)
+
+
+    def approximate_edgelist(self, location_id, start_date_string, end_date_string, edges):
+        '''
+        Degraded mode: bounded size approximation (at most max_num_edges) of the edgelist (see
+        sparsification_engine). The approximation and its parameters are recorded (see approximation_writer).
+
+        parameters
+            location_id(str): The graph id
+            start_date_string (str): Start date in %Y-%m-%d
+            end_date_string (str): End date in %Y-%m-%d
+            edges (pd.DataFrame): The compact edgelist
+
+        returns
+            pd.DataFrame with the approximated edgelist
         '''
+
+        approximated, parameters = spe.sparsify(edges, self.degraded_mode, self.max_num_edges)
+
+        print(f'            {location_id} from {start_date_string} to {end_date_string}: {edges.shape[0]} edges approximated to {approximated.shape[0]} ({self.degraded_mode})')
+
+        approximation_writer.append(pd.DataFrame({'location_id': [location_id],
+                                                  'start_date': [pd.to_datetime(start_date_string)],
+                                                  'date': [pd.to_datetime(end_date_string)],
+                                                  'approximation': [self.degraded_mode],
+                                                  'max_num_edges': [int(self.max_num_edges)],
+                                                  'parameters': [json.dumps(parameters)],
+                                                  'num_edges': [edges.shape[0]],
+                                                  'approximated_num_edges': [approximated.shape[0]]}))
+
+        return(approximated)
+
+
+    def download_compact_edgelist(self, location_id, start_date_string, end_date_string):
+        '''
+        Method that downloads the compact edgelist of the location (see get_compact_edgelist). Both dates are inclusive.
+        The window is assembled from the per day aggregates (see daily_aggregates)
+
+        parameters
+            location_id(str): The graph id        
+            start_date_string (str): Start date in %Y-%m-%d
+            end_date_string (str): End date in %Y-%m-%d
+
+        returns
+            pd.DataFrame with the grouped edglist.
+        '''
+
+        if hierarchical_mode:
+            parent_id = self.context.get_parent(location_id)
+            if parent_id is not None:
+                return(self.download_child_edgelist(location_id, parent_id, start_date_string, end_date_string))
+
         dataset_id = utils.get_dataset_of_location(self.client, location_id)
 
-        query = f"""
+        return(daily_aggregates.get_window_edgelist(self.client, location_id, dataset_id, start_date_string, end_date_string))
 
-            SELECT id1, id2, COUNT(*) as weight, SUM(contacts) as total_contacts
-            FROM grafos-alcaldia-bogota.{dataset_id}.{location_id}
-            WHERE date >= "{start_date_string}" AND date <= "{end_date_string}"
-            GROUP BY id1, id2
 
-        """
-        
-        job_config = bigquery.QueryJobConfig(allow_large_results=True)
-        query_job = self.client.query(query, job_config=job_config) 
+    def download_child_edgelist(self, location_id, parent_id, start_date_string, end_date_string):
+        '''
+        Hierarchical mode: the compact edgelist of the location is the subgraph of the parent edgelist (same
+        window, shared through the graph data cache) induced by the nodes of the location (see subgraph_engine)
 
-        # Return the results as a pandas DataFrame
-        df = query_job.to_dataframe()
+        parameters
+            location_id(str): The graph id
+            parent_id(str): The graph id of the parent (see pipeline_context.get_parents)
+            start_date_string (str): Start date in %Y-%m-%d
+            end_date_string (str): End date in %Y-%m-%d
 
-        return(df)
+        returns
+            pd.DataFrame with the grouped edglist.
+        '''
+
+        def build_parent():
+            # Not copied, the parent graph does not edit it
+            edges = graph_data_cache.get_if_present(parent_id, start_date_string, end_date_string, gdc.KIND_COMPACT_EDGES)
+            if edges is None:
+                dataset_id = utils.get_dataset_of_location(self.client, parent_id)
+                edges = graph_data_cache.get(parent_id, start_date_string, end_date_string, gdc.KIND_COMPACT_EDGES,
+                                             lambda: daily_aggregates.get_window_edgelist(self.client, parent_id, dataset_id, start_date_string, end_date_string))
+            return(sge.ParentGraph(edges))
+
+        parent = sge.get_parent_graph((parent_id, start_date_string, end_date_string), build_parent)
+        nodes = self.get_compact_nodes(location_id, start_date_string, end_date_string)
+
+        return(parent.induced_edgelist(nodes.identifier.values))
 
 
 
@@ -354,8 +626,8 @@ class GenericWeeklyAttribute():
         job_config = bigquery.QueryJobConfig(allow_large_results=True)
         query_job = self.client.query(query, job_config=job_config) 
 
-        # Return the results as a pandas DataFrame
-        df = query_job.to_dataframe()
+        # Return the results as a pandas DataFrame (through Arrow, see utils.query_to_dataframe)
+        df = utils.query_to_dataframe(query_job)
 
         return(df)
 
@@ -366,6 +638,7 @@ class GenericWeeklyAttribute():
         '''
         Method that extracts the grouped transits (nodes) given the location id. If the
         construction type is static, will invoke the entire duration.
+        The result is shared among all attributes through the graph data cache.
 
         parameters
             - location_id(str): The graph id
@@ -374,7 +647,7 @@ class GenericWeeklyAttribute():
 
         returns
             pd.DataFrame with the ungrouped nodes.
-                - identifier (str)
+                - identifier (int32): encoded identifier (see identifier_dictionary)
                 - weight (int): the sum of the total_transits       
     
         '''
@@ -385,34 +658,23 @@ class GenericWeeklyAttribute():
             # End date. Substracts 1 day because end date in static scheme is not inlusive
             end_date_string = (pd.to_datetime(self.df_locations.loc[location_id, 'end_date']) - timedelta(days = 1)).strftime(utils.date_format)
 
-
-        query = f"""
-
-            SELECT identifier, SUM(total_transits) as weight
-            FROM grafos-alcaldia-bogota.transits.hourly_transits
-            WHERE location_id = "{location_id}"
-                  AND date >= "{start_date_string}" 
-                  AND date <= "{end_date_string}"
-
-            GROUP BY identifier
-
-        """
-
-        job_config = bigquery.QueryJobConfig(allow_large_results=True)
-        query_job = self.client.query(query, job_config=job_config) 
-
-        # Return the results as a pandas DataFrame
-        df = query_job.to_dataframe()
-
-        return(df)
-
-
-
-
-
+        return(graph_data_cache.get(location_id, start_date_string, end_date_string, gdc.KIND_COMPACT_NODES,
+                                    lambda: self.download_compact_nodes(location_id, start_date_string, end_date_string)))
 
 
 
+    def download_compact_nodes(self, location_id, start_date_string, end_date_string):
+        '''
+        Method that downloads the grouped transits (nodes) of the location between the given dates (see get_compact_nodes).
+        Does not adjust the dates for the static construction type. The window is assembled from the per day aggregates (see daily_aggregates)
 
+        parameters
+            - location_id(str): The graph id
+            - start_date_string (str): Start date in %Y-%m-%d
+            - end_date_string (str): End date in %Y-%m-%d
 
+        returns
+            pd.DataFrame with the ungrouped nodes.
+        '''
 
+        return(daily_aggregates.get_window_nodes(self.client, location_id, start_date_string, end_date_string))
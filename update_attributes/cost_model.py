@@ -0,0 +1,155 @@
+# Cost Model
+# Estimated cost (seconds) of computing an attribute for a location and date, from the size of its graph
+# (see pipeline_context.get_graph_size). Each attribute declares the complexity of its algorithm (see the
+# complexity property) and the cost is overhead + coefficient*work. The coefficient of each attribute is
+# recalibrated from the log of the predicted and actual costs of previous runs.
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+
+# Complexities (work as a function of the number of nodes V and edges E)
+COMPLEXITY_CONSTANT = 'constant' # 1
+COMPLEXITY_NODES = 'nodes' # V
+COMPLEXITY_EDGES = 'edges' # E
+COMPLEXITY_NODES_EDGES = 'nodes_edges' # V*E
+
+COMPLEXITIES = [COMPLEXITY_CONSTANT, COMPLEXITY_NODES, COMPLEXITY_EDGES, COMPLEXITY_NODES_EDGES]
+
+# Default seconds per unit of work of each complexity (before calibration)
+default_coefficients = {}
+default_coefficients[COMPLEXITY_CONSTANT] = 1
+default_coefficients[COMPLEXITY_NODES] = 1e-5
+default_coefficients[COMPLEXITY_EDGES] = 1e-6
+default_coefficients[COMPLEXITY_NODES_EDGES] = 1e-10
+
+# Seconds of every task (queries and inserts)
+default_overhead_seconds = 2
+
+# Log of the predicted and actual costs. Must persist between runs (the calibration is built from it), so it
+# is kept in the home folder (see attributes_cost_log_file in config.py)
+default_log_file = os.path.join(os.path.expanduser('~'), '.covid_contact_graphs', 'attribute_costs', 'task_costs.csv')
+log_columns = ['run_date', 'attribute_name', 'location_id', 'date', 'num_nodes', 'num_edges', 'work', 'predicted_seconds', 'actual_seconds']
+
+# Min number of logged tasks (of an attribute) to recalibrate its coefficient
+min_calibration_rows = 5
+# Max number of logged rows used (the most recent ones)
+max_calibration_rows = 1000
+
+
+def get_work(complexity, num_nodes, num_edges):
+    '''
+    Work of the given complexity for a graph with the given size
+    '''
+
+    num_nodes, num_edges = float(num_nodes), float(num_edges)
+
+    if complexity == COMPLEXITY_CONSTANT:
+        return(1.0)
+    if complexity == COMPLEXITY_NODES:
+        return(num_nodes)
+    if complexity == COMPLEXITY_EDGES:
+        return(num_edges)
+    if complexity == COMPLEXITY_NODES_EDGES:
+        return(num_nodes*num_edges)
+
+    raise ValueError(f'Complexity: {complexity} not supported')
+
+
+class CostModel():
+    '''
+    Estimates the cost of the tasks and logs their actual cost
+    '''
+
+    def __init__(self, log_file = default_log_file, overhead_seconds = default_overhead_seconds):
+        '''
+        params
+            - log_file (str): CSV with the costs of previous runs (appended after each run). None to disable
+            - overhead_seconds (float): Seconds of every task
+        '''
+
+        self.log_file = log_file
+        self.overhead_seconds = overhead_seconds
+        self.lock = threading.Lock()
+
+        # attribute_name -> seconds per unit of work (calibrated)
+        self.coefficients = None
+
+
+    def load_coefficients(self):
+        '''
+        Calibrates the coefficient of each attribute as the median of (actual - overhead)/work over its most
+        recent logged tasks
+        '''
+
+        with self.lock:
+            if self.coefficients is not None:
+                return
+
+            self.coefficients = {}
+
+            if self.log_file is None or not os.path.isfile(self.log_file):
+                return
+
+            try:
+                df = pd.read_csv(self.log_file)
+            except (pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+                print(f'            Could not read the cost log {self.log_file}: {e}')
+                return
+
+            df = df[(df.work > 0) & (df.actual_seconds.notna())]
+            for attribute_name, df_att in df.groupby('attribute_name'):
+                df_att = df_att.tail(max_calibration_rows)
+                if df_att.shape[0] < min_calibration_rows:
+                    continue
+
+                coefficient = np.median(np.maximum(df_att.actual_seconds.values - self.overhead_seconds, 0)/df_att.work.values)
+                if coefficient > 0:
+                    self.coefficients[attribute_name] = float(coefficient)
+
+
+    def get_coefficient(self, att):
+        '''
+        Seconds per unit of work of the attribute (calibrated or the default of its complexity)
+        '''
+
+        self.load_coefficients()
+
+        if att.attribute_name in self.coefficients:
+            return(self.coefficients[att.attribute_name])
+
+        return(default_coefficients[att.complexity])
+
+
+    def estimate(self, att, num_nodes, num_edges):
+        '''
+        Estimated seconds of the attribute for a graph with the given size
+
+        returns
+            work (float): see the estimate_work method of the attributes
+            seconds (float)
+        '''
+
+        work = att.estimate_work(num_nodes, num_edges)
+        return(work, self.overhead_seconds + self.get_coefficient(att)*work)
+
+
+    def log(self, rows):
+        '''
+        Appends the predicted and actual costs of the tasks to the log
+
+        params
+            - rows (list): dicts with the log_columns
+        '''
+
+        if self.log_file is None or len(rows) == 0:
+            return
+
+        folder = os.path.dirname(self.log_file)
+        if folder != '' and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok = True)
+
+        df = pd.DataFrame(rows, columns = log_columns)
+        df.to_csv(self.log_file, mode = 'a', index = False, header = not os.path.isfile(self.log_file))
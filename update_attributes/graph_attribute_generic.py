@@ -12,13 +12,77 @@ class GenericGraphAttribute(GenericWeeklyAttribute):
     Class for the Generic Graph Attribute
     '''
 
-    def __init__(self, edited_property_values):
+    def __init__(self, edited_property_values, context = None):
         # Initilizes the super class
-        GenericWeeklyAttribute.__init__(self, edited_property_values)
+        GenericWeeklyAttribute.__init__(self, edited_property_values, context = context)
+
+
+    def attribute_exists_in_database(self, location_id, date_string):
+        '''
+        OVERWRITTEN
+        # ---------------
+
+        Checks the graphs attribute table
+        '''
+        return(utils.graph_attribute_exists(self.client, location_id, self.attribute_name, date_string))
+
+
+    def is_derived(self):
+        '''
+        Returns True if the attribute is derived from a node attribute (see derived_from and aggregation)
+        '''
+        return(self.derived_from != '')
+
+
+    def compute_derived_attribute(self, df_node_result):
+        '''
+        Computes the derived attribute from the node level result (for example, the frame saved by the node
+        attribute it aggregates, while it is still in memory).
+
+        params
+            - df_node_result (pd.DataFrame): Node result with the column attribute_value
+
+        returns
+            pd.DataFrame with the columns value and attribute_name
+        '''
+
+        value = None
+        if df_node_result.shape[0] > 0:
+            value = utils.aggregate_values(df_node_result.attribute_value.values, self.aggregation)
+
+        return(pd.DataFrame({'value':[value], 'attribute_name':[self.attribute_name]}))
+
+
+    def compute_attribute_for_interval(self, location_id, start_date_string, end_date_string):
+        '''
+        OVERWRITTEN
+        # ---------------
+
+        Derived attributes whose node attribute was not computed in the same unit of work, read the node
+        attribute from the database.
+        '''
+
+        if not self.is_derived():
+            return(GenericWeeklyAttribute.compute_attribute_for_interval(self, location_id, start_date_string, end_date_string))
+
+        query = f"""
+            SELECT identifier, attribute_value
+            FROM {utils.nodes_attribute_table}
+            WHERE location_id = "{location_id}"
+                AND attribute_name = "{self.derived_from}"
+                AND date = "{end_date_string}"
+        """
+
+        df = utils.run_simple_query(self.client, query)
+
+        if df.shape[0] == 0:
+            print('             ' + f'No {self.derived_from} found for {location_id} on {end_date_string}')
+
+        return(self.compute_derived_attribute(df))
 
 
     # For next implementation
-    def save_attribute_for_date(self, location_id, date_string):
+    def save_attribute_for_date(self, location_id, date_string, df_node_result = None):
         '''
         Method that computes the attribute for a given week and savess it in the database.
         All weeks are saved as the sunday and the go from monday to sunday.
@@ -27,13 +91,15 @@ class GenericGraphAttribute(GenericWeeklyAttribute):
         params
             - location_id(str): The graph id
             - date_string (str): Date in the format yyyy-mm-dd
+            - df_node_result (pd.DataFrame): For derived attributes, the result of the node attribute they
+                                             aggregate for the same location and date. None to compute normally
 
         generates
             - Exception if the databaase already contains the attribute for the given week for the given graph id
             - Exception if the the result does not contain the defined  strucure. See GenericWeeklyAttribute.compute_attribute
         '''
 
-        if utils.graph_attribute_exists(self.client, location_id, self.attribute_name, date_string):
+        if self.attribute_exists(location_id, date_string):
             raise ValueError(f'Attribute: {self.attribute_name} already exists for {date_string}')
 
         # Goes back the window
@@ -42,7 +108,10 @@ class GenericGraphAttribute(GenericWeeklyAttribute):
         end_date_string = date_string
 
         # Computes
-        df_result = self.compute_attribute_for_interval(location_id, start_date_string, end_date_string)
+        if df_node_result is not None:
+            df_result = self.compute_derived_attribute(df_node_result)
+        else:
+            df_result = self.compute_attribute_for_interval(location_id, start_date_string, end_date_string)
 
         if 'value' not in df_result.columns:
             raise ValueError(f'The column "value" was not found in the columns {df_result.columns}')
@@ -66,7 +135,8 @@ class GenericGraphAttribute(GenericWeeklyAttribute):
         df_result.attribute_name = df_result.attribute_name.astype(str)
         df_result.attribute_value = df_result.attribute_value.astype(float)
         
-        utils.insert_graphs_attributes(self.client, df_result)
+        attribute_generic.graph_attribute_writer.append(df_result)
+        self.mark_as_existing(location_id, date_string)
 
         
     def save_attribute_for_week(self, location_id, year, week):
@@ -88,7 +158,7 @@ class GenericGraphAttribute(GenericWeeklyAttribute):
         date_time = utils.get_date_of_week(year, week)
         date_string = date_time.strftime( utils.date_format)
 
-        if utils.graph_attribute_exists(self.client, location_id, self.attribute_name, date_string):
+        if self.attribute_exists(location_id, date_string):
             raise ValueError(f'Attribute: {self.attribute_name} already exists for {date_string}')
 
 
@@ -121,4 +191,5 @@ class GenericGraphAttribute(GenericWeeklyAttribute):
         df_result.attribute_name = df_result.attribute_name.astype(str)
         df_result.attribute_value = df_result.attribute_value.astype(float)
         
-        utils.insert_graphs_attributes(self.client, df_result)        
\ No newline at end of file
+        attribute_generic.graph_attribute_writer.append(df_result)
+        self.mark_as_existing(location_id, date_string)        
\ No newline at end of file
@@ -6,6 +6,7 @@ import pandas as pd
 import numpy as np
 import utils
 import positive_db_functions as pos_fun
+import cost_model as cm
 
 # Dictionary to include property values
 property_values = {}
@@ -13,6 +14,13 @@ property_values = {}
 # Attribute name
 property_values['attribute_name'] = 'average_distance_to_infected'
 
+# Derived from the node attribute (computed from its result, see GenericGraphAttribute)
+property_values['derived_from'] = 'distance_to_infected'
+property_values['aggregation'] = 'mean'
+
+# Complexity (see cost_model)
+property_values['complexity'] = cm.COMPLEXITY_NODES
+
 
 class GraphAvgDistanceToInfected(GenericGraphAttributeWithCases):
     '''
@@ -36,11 +44,11 @@ class GraphAvgDistanceToInfected(GenericGraphAttributeWithCases):
         identifier column is ignored
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight od the edge (see get_compact_edgelist)      
         
         returns
@@ -50,34 +58,3 @@ class GraphAvgDistanceToInfected(GenericGraphAttributeWithCases):
         '''
     
         raise ValueError('Should not enter here')
-    
-    
-    def compute_attribute_for_interval(self, location_id, start_date_string, end_date_string):
-        '''
-        Method that computes the attribute of the class for the given dates. Edit this method if the attributes requieres more than just the nodes and
-        the ids. See weighted_pagerank for an example.
-        parameters
-            - location_id(str): The graph id
-            - start_date_string (str): Start date in %Y-%m-%d
-            - end_date_string (str): End date in %Y-%m-%d
-        returns
-            pd.DataFrame with the structure of the output of the method compute_attribute   
-        '''
-                
-        query = f"""
-            SELECT AVG(attribute_value) as value
-            FROM {utils.nodes_attribute_table}
-            WHERE location_id = "{location_id}" AND attribute_name = "distance_to_infected" AND date = "{end_date_string}"
-        """
-        
-        df = utils.run_simple_query(self.client, query)
-        
-        # Extracts the value
-        value = df['value'].values[0]
-        
-        if pd.isna(value):
-            print('             ' + f'No distance to infected found for {location_id} on {end_date_string}')
-            return(pd.DataFrame({'value':None, 'attribute_name':[self.attribute_name] }))
-        df_response = pd.DataFrame({'value':[value], 'attribute_name':[self.attribute_name] })
-        
-        return(df_response)
\ No newline at end of file
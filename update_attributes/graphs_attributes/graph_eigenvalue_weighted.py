@@ -6,6 +6,8 @@ import pandas as pd
 import numpy as np
 import igraph as ig
 import utils
+import spectral_engine as se
+import sparsification_engine as spe
 
 
 # Dictionary to include property values
@@ -19,6 +21,9 @@ property_values['attribute_name'] = 'largest_eigenvalue_weighted'
 property_values['max_num_nodes'] = np.inf
 property_values['max_num_edges'] = 20000000 # 50 Millions
 
+# Degraded mode above the max edges (see sparsification_engine)
+property_values['degraded_mode'] = spe.TOP_K
+
 
 class GraphEigenValueWeighted(GenericGraphAttribute):
     '''
@@ -45,37 +50,49 @@ class GraphEigenValueWeighted(GenericGraphAttribute):
 
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight of the edge (see get_compact_edgelist)      
 
         
         returns
             pd.DataFrame with the following structure
                 - attribute_name (str): The attribute name           
-                - identifier (str): Identifier of the node or graph
+                - identifier (int32): Identifier of the node (encoded, decoded when written) or graph
                 - value (float): The value of the attribute
         '''
 
-        # Create the graph
-        G = ig.Graph()
-        
-        # Adds the values
-        G.add_vertices(nodes.identifier.values)
-                   
-        if edges.shape[0] > 0:
-            G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
+        # Adjacency matrix
+        A, _ = utils.build_csr(nodes, edges, weighted = True)
         
         # Exctracs the eigen value
-        _, eigen_value = G.evcent(weights = edges.weight.values, directed = False, return_eigenvalue = True)
+        eigen_value, _, _ = se.spectral_radius(A)
         
         # Creates the response
         df_response = pd.DataFrame({'value':[eigen_value], 'attribute_name':[self.attribute_name] })
         
         return(df_response)
-    
 
-    
\ No newline at end of file
+
+    def compute_attribute_for_interval(self, location_id, start_date_string, end_date_string):
+        '''
+        OVERWRITTEN
+        # ---------------
+
+        Both variants (weighted and unweighted) are computed together from the same matrices, warm started with the 
+        eigenvector of the previous window of the location (see spectral_engine)
+        '''
+
+        nodes = self.get_compact_nodes(location_id, start_date_string, end_date_string)
+        edges = self.get_compact_edgelist(location_id, start_date_string, end_date_string)
+
+        engine = self.get_centrality_engine(nodes, edges, location_id, start_date_string, end_date_string)
+        radii = se.get_spectral_radii(location_id, start_date_string, end_date_string, engine, approximation = self.get_approximation_key())
+
+        # Creates the response
+        df_response = pd.DataFrame({'value':[radii[se.WEIGHTED]], 'attribute_name':[self.attribute_name] })
+
+        return(df_response)
@@ -6,6 +6,8 @@ import pandas as pd
 import utils
 import numpy as np
 import positive_db_functions as pos_fun
+import case_index as ci
+import cost_model as cm
 
 
 # Dictionary to include property values
@@ -14,33 +16,12 @@ property_values = {}
 # Attribute name
 property_values['attribute_name'] = 'number_of_cases_accumulated'
 
+# Complexity (see cost_model)
+property_values['complexity'] = cm.COMPLEXITY_CONSTANT
 
 
-# Queries
-# ---------
-# Generic Query
-generic_sql = """
 
-        SELECT COUNT(*) as total
-        FROM  grafos-alcaldia-bogota.positives.{table_name}
-        WHERE  date_start_symtoms <= "{end_date_string}"
-            AND ST_DWithin(ST_GeogPoint(lon, lat), 
-                (SELECT geometry FROM grafos-alcaldia-bogota.geo.locations_geometries WHERE location_id = "{location_id}"), 
-                  (SELECT precision FROM grafos-alcaldia-bogota.geo.locations_geometries WHERE location_id = "{location_id}"))
-"""
-
-
-# Bogota
-# --------
-bogota_sql = """
-
-        SELECT COUNT(*) as total
-        FROM  `servinf-unacast-prod.AlcaldiaBogota.positivos_agg_fecha` 
-        WHERE  fechainici <= "{end_date_string}"
-           AND ST_DWithin(geometry, 
-                (SELECT geometry FROM grafos-alcaldia-bogota.geo.locations_geometries WHERE location_id = "{location_id}"), 
-                  (SELECT precision FROM grafos-alcaldia-bogota.geo.locations_geometries WHERE location_id = "{location_id}"))
-"""
+# Cases are counted by the case index (see case_index), with a single query for all the locations of the city
 
 class GraphNumberOfCasesAccumulated(GenericGraphAttributeWithCases):
     '''
@@ -63,11 +44,11 @@ class GraphNumberOfCasesAccumulated(GenericGraphAttributeWithCases):
 
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight od the edge (see get_compact_edgelist)      
 
         
@@ -95,25 +76,11 @@ class GraphNumberOfCasesAccumulated(GenericGraphAttributeWithCases):
         '''
            
         city = utils.get_city(self.client, location_id, self.df_codes)
-                
-        if city == utils.BOGOTA:
-            query = bogota_sql.format(end_date_string = end_date_string, location_id = location_id)
-            
-        else:
-            query = generic_sql.format(table_name = city, end_date_string = end_date_string, location_id = location_id)
-            
+
         # Computes the total
-        response = utils.run_simple_query(self.client, query)
-        
-        # Sets the value
-        response.rename(columns = {'total':'value'}, inplace = True)
-                
-        # Adds the attribute name
-        response['attribute_name'] = self.attribute_name
-        
+        total = ci.case_index_service.get_accumulated_cases(self.client, city, location_id, end_date_string)
+
+        response = pd.DataFrame({'value':[total], 'attribute_name':[self.attribute_name]})
 
         # Returns the value
         return(response)
-    
-    
-            
\ No newline at end of file
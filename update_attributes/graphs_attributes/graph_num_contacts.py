@@ -37,11 +37,11 @@ class GraphNumberOfContacts(GenericGraphAttribute):
 
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight od the edge (see get_compact_edgelist)      
 
         
@@ -68,17 +68,10 @@ class GraphNumberOfContacts(GenericGraphAttribute):
             pd.DataFrame with the structure of the output of the method compute_attribute   
         '''
                 
-        datset_id = self.df_locations.loc[location_id, 'dataset']
-        
-        query = f"""
-            SELECT COUNT(*) as num_contacts
-            FROM grafos-alcaldia-bogota.{datset_id}.{location_id}
-            WHERE date >= "{start_date_string}" AND date <= "{end_date_string}"
-        """
-        
-        df = utils.run_simple_query(self.client, query)
-        df.rename(columns = {'num_contacts':'value'}, inplace = True)
-        df['attribute_name'] = self.attribute_name
+        # Uses the shared compact edgelist. The weight of each edge is the number of records of the pair
+        edges = self.get_compact_edgelist(location_id, start_date_string, end_date_string)
+
+        df = pd.DataFrame({'value':[edges.weight.sum()], 'attribute_name':[self.attribute_name] })
 
         return(df)
     
\ No newline at end of file
@@ -33,11 +33,11 @@ class GraphNumEdges(GenericGraphAttribute):
 
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight od the edge (see get_compact_edgelist)      
 
         
@@ -61,22 +61,10 @@ class GraphNumEdges(GenericGraphAttribute):
         returns
             pd.DataFrame with the structure of the output of the method compute_attribute   
         '''
-        dataset_id = utils.get_dataset_of_location(self.client, location_id)
+        # Uses the shared compact edgelist
+        edges = self.get_compact_edgelist(location_id, start_date_string, end_date_string)
 
-        query = f"""
-            SELECT COUNT(*) as num_edges
-            FROM
-            (
-                SELECT id1, id2
-                FROM grafos-alcaldia-bogota.{dataset_id}.{location_id}
-                WHERE date >= "{start_date_string}" AND date <= "{end_date_string}"
-                GROUP BY id1, id2
-            )
-        """
-                
-        df = utils.run_simple_query(self.client, query)
-        df.rename(columns = {'num_edges':'value'}, inplace = True)
-        df['attribute_name'] = self.attribute_name
+        df = pd.DataFrame({'value':[edges.shape[0]], 'attribute_name':[self.attribute_name] })
 
         return(df)
     
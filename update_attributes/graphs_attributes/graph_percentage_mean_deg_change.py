@@ -17,6 +17,9 @@ property_values = {}
 # Attribute name
 property_values['attribute_name'] = 'percetange_contact_change'
 
+# Dependencies
+property_values['dependencies'] = ['distance_to_infected']
+
 class GraphPercentageContactChange(GenericGraphAttributeWithCases):
     '''
     Script that computes the average distance to infected
@@ -37,11 +40,11 @@ class GraphPercentageContactChange(GenericGraphAttributeWithCases):
         identifier column is ignored
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight od the edge (see get_compact_edgelist)      
         
         returns
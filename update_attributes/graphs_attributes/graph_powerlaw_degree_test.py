@@ -5,13 +5,14 @@ from graph_attribute_generic import GenericGraphAttribute
 import pandas as pd
 import numpy as np
 import utils
-from scipy.stats import powerlaw
-from scipy.stats import expon
-from scipy.stats import lognorm
-from scipy.stats import kstest
+import powerlaw_engine as ple
+import cost_model as cm
 
 
 # This Class has multiple attrbiute names
+# The dates computed before the tail fit (values >= xmin, zeros excluded, see powerlaw_engine) used a fit over
+# all the degrees. They are not recomputed: the series keep their names (read by other attributes and the
+# figures), so no backfill is needed. powerlaw_degree_xmin only exists for the tail fit.
 
 # Dictionary to include property values
 property_values = {}
@@ -19,12 +20,18 @@ property_values = {}
 # Attribute name
 property_values['attribute_name'] = 'powerlaw_degree_is_dist'
 
+# Derived from the node degree (computed from its result, see GenericGraphAttribute)
+property_values['derived_from'] = 'node_degree'
+
+# Complexity (see cost_model)
+property_values['complexity'] = cm.COMPLEXITY_NODES
+
 
 class GraphPowerLawTest(GenericGraphAttribute):
     '''
-    Script that computes the gini index of the nodes pagerank.
+    Script that excecutes a power law test over the degrees of the nodes (see powerlaw_engine).
     
-    This script uses the results from the pagerank node attribute. If nothing is found will return None and writes a warning
+    This script uses the results from the node degree attribute. If nothing is found will return None and writes a warning
     '''
 
     def __init__(self):
@@ -43,11 +50,11 @@ class GraphPowerLawTest(GenericGraphAttribute):
 
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight od the edge (see get_compact_edgelist)      
 
         
@@ -61,57 +68,22 @@ class GraphPowerLawTest(GenericGraphAttribute):
     
     
     
-    def compute_attribute_for_interval(self, location_id, start_date_string, end_date_string):
+    def compute_derived_attribute(self, df_node_result):
         '''
-        Method that computes the attribute of the class for the given dates. Edit this method if the attributes requieres more than just the nodes and
-        the ids. See weighted_pagerank for an example.
-
-        parameters
-            - location_id(str): The graph id
-            - start_date_string (str): Start date in %Y-%m-%d
-            - end_date_string (str): End date in %Y-%m-%d
+        OVERWRITTEN
+        # ---------------
 
-        returns
-            pd.DataFrame with the structure of the output of the method compute_attribute   
+        Excecutes the test over the degrees (node result). Has multiple attribute names.
         '''
-                
-        query = f"""
-            SELECT location_id, identifier, attribute_name, attribute_value
-            FROM {utils.nodes_attribute_table}
-            WHERE location_id = "{location_id}" AND attribute_name = "node_degree" AND date = "{end_date_string}"
-        """
-        
-        eps = 1e-10
-        df = utils.run_simple_query(self.client, query)
-        
-        if df.shape[0] == 0:
-            print('             ' + f'No Degree found for {location_id} on {end_date_string}')
-            return(pd.DataFrame({'value':None, 'attribute_name':[self.attribute_name] }))            
-        
-        
-        # Excecutes the power law test
-        
-        # Extracts dsitribution
-        distribution = df['attribute_value'].values
-                
-        # Powerlaw
-        params = powerlaw.fit(distribution)
-        # Extracts alfa
-        alpha = params[0]
-        ks, p = kstest(distribution,"powerlaw",args=params, N = df.shape[0])
-        
-        # Exponential
-        params = expon.fit(distribution)
-        ks_e, p_e = kstest(distribution,"expon",args=params, N = df.shape[0])
-        
-        # LogNormal
-        params = lognorm.fit(distribution)
-        ks_l, p_l = kstest(distribution,"lognorm",args=params, N = df.shape[0])   
-        
-        is_power = int((ks <  ks_e) and (ks < ks_l))
-        
-        df_response = pd.DataFrame({'value':[is_power,ks,p, alpha], 'attribute_name': ['powerlaw_degree_is_dist', 'powerlaw_degree_ks_statistic', 'powerlaw_degree_p_value', 'powerlaw_degree_alpha']})
-        
+
+        response = None
+        if df_node_result.shape[0] > 0:
+            response = ple.powerlaw_test(df_node_result.attribute_value.values)
+
+        if response is None:
+            return(pd.DataFrame({'value':None, 'attribute_name':[self.attribute_name] }))
+
+        df_response = pd.DataFrame({'value':[response['is_powerlaw'], response['ks'], response['p_value'], response['alpha'], response['xmin']],
+                                    'attribute_name': ['powerlaw_degree_is_dist', 'powerlaw_degree_ks_statistic', 'powerlaw_degree_p_value', 'powerlaw_degree_alpha', 'powerlaw_degree_xmin']})
+
         return(df_response)
-    
-    
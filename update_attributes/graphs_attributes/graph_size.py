@@ -5,7 +5,6 @@ from graph_attribute_generic import GenericGraphAttribute
 import pandas as pd
 import utils
 import numpy as np
-from datetime import timedelta
 
 
 # Dictionary to include property values
@@ -37,11 +36,11 @@ class GraphSize(GenericGraphAttribute):
 
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight od the edge (see get_compact_edgelist)      
 
         
@@ -69,28 +68,10 @@ class GraphSize(GenericGraphAttribute):
             pd.DataFrame with the structure of the output of the method compute_attribute   
         '''
 
-        # If static will collect all devices        
-        if self.df_locations.loc[location_id, 'construction_type'] == utils.CT_STATIC:
-            # Starts dates
-            start_date_string = pd.to_datetime(self.df_locations.loc[location_id, 'start_date'] ).strftime(utils.date_format)
-            # End date. Substracts 1 day because end date in static scheme is not inlusive
-            end_date_string = (pd.to_datetime(self.df_locations.loc[location_id, 'end_date']) - timedelta(days = 1)).strftime(utils.date_format)
-
-
-        query = f"""
-            SELECT COUNT(*) as num_nodes
-            FROM
-            (SELECT identifier
-            FROM grafos-alcaldia-bogota.transits.hourly_transits
-            WHERE location_id = "{location_id}"
-                  AND date >= "{start_date_string}" 
-                  AND date <= "{end_date_string}"
-            GROUP BY identifier )
-        """
-        
-        df = utils.run_simple_query(self.client, query)
-        df.rename(columns = {'num_nodes':'value'}, inplace = True)
-        df['attribute_name'] = self.attribute_name
+        # Uses the shared compact nodes (static dates are handled by get_compact_nodes)
+        nodes = self.get_compact_nodes(location_id, start_date_string, end_date_string)
+
+        df = pd.DataFrame({'value':[nodes.shape[0]], 'attribute_name':[self.attribute_name] })
 
         return(df)
     
@@ -5,6 +5,7 @@ import pandas as pd
 import numpy as np
 import igraph as ig
 import utils
+import transitivity_engine as te
 
 
 # Dictionary to include property values
@@ -16,13 +17,23 @@ property_values['attribute_name'] = 'graph_transitivity'
 
 # Max Support
 property_values['max_num_nodes'] = np.inf
-property_values['max_num_edges'] = 20000000 # 20 Millions
+property_values['max_num_edges'] = np.inf
 
 
+# Other properties
+
+# Graphs with at most this number of edges are computed exactly (igraph)
+max_exact_num_edges = 1000000 # 1 Million
+# Target error and probability of the approximation (see transitivity_engine.get_sample_size)
+epsilon = te.default_epsilon
+delta = te.default_delta
+# Seed for the wedges
+seed = te.default_seed
+
 
 class GraphTransitivity(GenericGraphAttribute):
     '''
-    Script that computes the transitivity
+    Script that computes the transitivity. Large graphs are approximated by wedge sampling (see transitivity_engine)
     
     '''
 
@@ -34,7 +45,6 @@ class GraphTransitivity(GenericGraphAttribute):
     # --- Global Abstract Methods
     def compute_attribute(self, nodes, edges):
         '''
-        # TODO
         Main Method to Implement
         
         This method must be implemented by the subclass. It receives compact nodes and edges and 
@@ -44,29 +54,23 @@ class GraphTransitivity(GenericGraphAttribute):
 
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight of the edge (see get_compact_edgelist)      
 
         
         returns
             pd.DataFrame with the following structure
                 - attribute_name (str): The attribute name           
-                - identifier (str): Identifier of the node or graph
+                - identifier (int32): Identifier of the node (encoded, decoded when written) or graph
                 - value (float): The value of the attribute
         '''
 
-        # Create the graph
-        G = ig.Graph()
-        
-        # Adds the values
-        G.add_vertices(nodes.identifier.values)
-                   
-        if edges.shape[0] > 0:
-            G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
+        # Create the graph (vertices follow the order of the nodes)
+        G, _ = utils.build_graph(nodes, edges, weighted = False)
         
         # Calculates the transitivity
         trans = G.transitivity_undirected()
@@ -75,6 +79,31 @@ class GraphTransitivity(GenericGraphAttribute):
         df_response = pd.DataFrame({'value':[trans], 'attribute_name':[self.attribute_name] })
         
         return(df_response)
-    
 
-    
\ No newline at end of file
+
+    def compute_attribute_for_interval(self, location_id, start_date_string, end_date_string):
+        '''
+        OVERWRITTEN
+        # ---------------
+
+        Small graphs are computed exactly (see compute_attribute). For large graphs (according to the graph sizes) the 
+        transitivity is approximated by wedge sampling (see transitivity_engine)
+        '''
+
+        nodes = self.get_compact_nodes(location_id, start_date_string, end_date_string)
+        edges = self.get_compact_edgelist(location_id, start_date_string, end_date_string)
+
+        _, num_edges = self.context.get_graph_size(location_id, end_date_string)
+
+        if num_edges <= max_exact_num_edges:
+            return(self.compute_attribute(nodes, edges))
+
+        identifiers, sources, targets, _ = utils.factorize_graph(nodes, edges, weight_column = None)
+
+        print(f'            {self.attribute_name} for {location_id}: approximated with {te.get_sample_size(epsilon, delta)} wedges')
+        trans = te.transitivity(len(identifiers), sources, targets, epsilon = epsilon, delta = delta, seed = seed)
+
+        # Creates the response
+        df_response = pd.DataFrame({'value':[trans], 'attribute_name':[self.attribute_name] })
+
+        return(df_response)
@@ -6,15 +6,26 @@ import utils
 from datetime import datetime, timedelta
 import pandas as pd
 import numpy as np
+import identifier_dictionary as idd
 
 class GenericNodeAttribute(GenericWeeklyAttribute):
     '''
     Class for the Generic Graph Attribute
     '''
         
-    def __init__(self, edited_property_values):
+    def __init__(self, edited_property_values, context = None):
         # Initilizes the super class
-        GenericWeeklyAttribute.__init__(self, edited_property_values)
+        GenericWeeklyAttribute.__init__(self, edited_property_values, context = context)
+
+
+    def attribute_exists_in_database(self, location_id, date_string):
+        '''
+        OVERWRITTEN
+        # ---------------
+
+        Checks the nodes attribute table
+        '''
+        return(utils.node_attribute_exists(self.client, location_id, self.attribute_name, date_string))
 
         
         
@@ -32,9 +43,12 @@ class GenericNodeAttribute(GenericWeeklyAttribute):
         generates
             - Exception if the databaase already contains the attribute for the given week for the given graph id
             - Exception if the the result does not contain the defined  strucure. See GenericWeeklyAttribute.compute_attribute
+
+        returns
+            pd.DataFrame with the saved rows
         '''
 
-        if utils.graph_attribute_exists(self.client, location_id, self.attribute_name, date_string):
+        if self.attribute_exists(location_id, date_string):
             raise ValueError(f'Attribute: {self.attribute_name} already exists for {date_string}')
 
 
@@ -63,6 +77,9 @@ class GenericNodeAttribute(GenericWeeklyAttribute):
         df_result['type'] = self.df_locations.loc[location_id, 'type']        
 
         df_result = df_result[['identifier','location_id','date','attribute_name','attribute_value','type']].copy()
+
+        # Identifiers are written as strings (see identifier_dictionary)
+        df_result = idd.identifier_dictionary.decode_frame(df_result)
         
         # Sets the types
         df_result.identifier = df_result.identifier.astype(str)
@@ -72,7 +89,11 @@ class GenericNodeAttribute(GenericWeeklyAttribute):
         df_result.attribute_name = df_result.attribute_name.astype(str)
         df_result.attribute_value = df_result.attribute_value.astype(float)
 
-        utils.insert_node_attributes(self.client, df_result)
+        attribute_generic.node_attribute_writer.append(df_result)
+        self.mark_as_existing(location_id, date_string)
+
+        # Returned, so the derived graph attributes can be computed from it (see GenericGraphAttribute)
+        return(df_result)
         
         
     def save_attribute_for_week(self, location_id, year, week):
@@ -94,7 +115,7 @@ class GenericNodeAttribute(GenericWeeklyAttribute):
         date_time = utils.get_date_of_week(year, week)
         date_string = date_time.strftime( utils.date_format)
 
-        if utils.node_attribute_exists(self.client, location_id, self.attribute_name, date_string):
+        if self.attribute_exists(location_id, date_string):
 
             raise ValueError(f'Attribute: {self.attribute_name} already exists for {date_string}')
 
@@ -122,6 +143,9 @@ class GenericNodeAttribute(GenericWeeklyAttribute):
         df_result['type'] = self.df_locations.loc[location_id, 'type']        
 
         df_result = df_result[['identifier','location_id','date','attribute_name','attribute_value','type']]
+
+        # Identifiers are written as strings (see identifier_dictionary)
+        df_result = idd.identifier_dictionary.decode_frame(df_result)
         
         # Sets the types
         df_result.identifier = df_result.identifier.astype(str)
@@ -131,4 +155,5 @@ class GenericNodeAttribute(GenericWeeklyAttribute):
         df_result.attribute_name = df_result.attribute_name.astype(str)
         df_result.attribute_value = df_result.attribute_value.astype(float)
 
-        utils.insert_node_attributes(self.client, df_result)
+        attribute_generic.node_attribute_writer.append(df_result)
+        self.mark_as_existing(location_id, date_string)
@@ -13,17 +13,23 @@ class GenericNodeAttributeWithCases(GenericNodeAttribute):
     Class for the Generic Graph Attribute with Cases
     '''
 
-    def __init__(self, property_values):
+    def __init__(self, property_values, context = None):
         # Initilizes the super class
-        GenericNodeAttribute.__init__(self, property_values)  
+        GenericNodeAttribute.__init__(self, property_values, context = context)
 
 
-        self.df_codes =  utils.get_geo_codes(self.client, location_id = None)
-        self.df_codes.index = self.df_codes.location_id
-        
-        # Gets the max date of symptoms for each supported location        
-        self.max_dates = pos_fun.get_positive_max_dates(self.client) 
-        self.min_dates = pos_fun.get_positive_min_dates(self.client)
+    # Geo codes and the max and min date of symptoms for each supported location (see pipeline_context)
+    @property
+    def df_codes(self):
+        return(self.context.get_geo_codes())
+
+    @property
+    def max_dates(self):
+        return(self.context.get_positive_max_dates())
+
+    @property
+    def min_dates(self):
+        return(self.context.get_positive_min_dates())
         
 
     def location_id_supported(self, location_id):
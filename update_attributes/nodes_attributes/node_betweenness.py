@@ -6,6 +6,8 @@ import pandas as pd
 import igraph as ig
 import utils
 import numpy as np
+import betweenness_engine as be
+import cost_model as cm
 
 
 # Dictionary to include property values
@@ -18,6 +20,24 @@ property_values['attribute_name'] = 'betweenness_centrality'
 property_values['max_num_nodes'] = np.inf
 property_values['max_num_edges'] = 50000000 # 50 Millions
 
+# Complexity (exact)
+property_values['complexity'] = cm.COMPLEXITY_NODES_EDGES
+
+
+# Other properties
+
+# Graphs with num_nodes*num_edges bellow this value are computed exactly (igraph)
+max_exact_work = 1e10
+# Pivots of the approximation and its budget (pivots*edges, see betweenness_engine.get_num_pivots). The number of
+# pivots is a heuristic without an error bound. With the defaults, a window of 2M edges takes about 11 minutes
+num_pivots = be.default_num_pivots
+max_work = be.default_max_work
+# Seed for the pivots
+seed = be.default_seed
+# Processes for the pivots. The tasks already run in several worker processes (see update_attributes, that sets
+# the budget of each worker), so by default the pivots are computed in the process of the task
+num_processes = 1
+
 
 class NodeBetweenness(GenericNodeAttribute):
     '''
@@ -42,32 +62,26 @@ class NodeBetweenness(GenericNodeAttribute):
 
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight od the edge (see get_compact_edgelist)      
 
         
         returns
             pd.DataFrame with the following structure
                 - attribute_name (str): The attribute name           
-                - identifier (str): Identifier of the node or graph
+                - identifier (int32): Identifier of the node (encoded, decoded when written) or graph
                 - value (float): The value of the attribute
         '''
 
-        # Create the graph
-        G = ig.Graph()
-        
-        # Adds the values
-        G.add_vertices(nodes.identifier.values)
-        
-        if edges.shape[0] > 0:
-            G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
+        # Create the graph (vertices follow the order of the nodes)
+        G, _ = utils.build_graph(nodes, edges, weighted = True)
         
         # Exctracs the betweenness
-        betweenness = G.betweenness(weights =  edges.weight.values, directed = False)
+        betweenness = G.betweenness(weights = 'weight', directed = False)
         
         # Adds it to the nodes
         nodes['value'] = betweenness
@@ -77,8 +91,48 @@ class NodeBetweenness(GenericNodeAttribute):
         
         # Constructs the dataframe
         return(nodes)
-    
 
-        
-    
-    
\ No newline at end of file
+
+    def estimate_work(self, num_nodes, num_edges):
+        '''
+        OVERWRITTEN
+        # ---------------
+
+        V*E when exact and (number of pivots)*E when approximated
+        '''
+
+        if num_nodes*num_edges <= max_exact_work:
+            return(float(num_nodes)*float(num_edges))
+
+        return(float(be.get_num_pivots(num_nodes, num_edges, num_pivots = num_pivots, max_work = max_work))*float(num_edges))
+
+
+    def compute_attribute_for_interval(self, location_id, start_date_string, end_date_string):
+        '''
+        OVERWRITTEN
+        # ---------------
+
+        Small graphs are computed exactly (see compute_attribute). For large graphs (according to the graph sizes) the 
+        betweenness is approximated by pivot sampling (see betweenness_engine)
+        '''
+
+        nodes = self.get_compact_nodes(location_id, start_date_string, end_date_string)
+        edges = self.get_compact_edgelist(location_id, start_date_string, end_date_string)
+
+        num_nodes, num_edges = self.context.get_graph_size(location_id, end_date_string)
+
+        if num_nodes*num_edges <= max_exact_work:
+            return(self.compute_attribute(nodes, edges))
+
+        identifiers, sources, targets, weights = utils.factorize_graph(nodes, edges)
+
+        sample_size = be.get_num_pivots(len(identifiers), sources.shape[0], num_pivots = num_pivots, max_work = max_work)
+        print(f'            {self.attribute_name} for {location_id}: approximated with {sample_size} pivots (heuristic)')
+
+        # Adds it to the nodes
+        nodes['value'] = be.betweenness(len(identifiers), sources, targets, weights, sample_size = sample_size, seed = seed, num_processes = num_processes)
+
+        # Adds the attribute name
+        nodes['attribute_name'] = self.attribute_name
+
+        return(nodes)
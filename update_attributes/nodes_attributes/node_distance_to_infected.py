@@ -6,8 +6,12 @@ import pandas as pd
 import numpy as np
 import igraph as ig
 import utils
+from google.cloud import bigquery
 import positive_db_functions as pos_fun
+import case_index as ci
 from datetime import timedelta
+import cost_model as cm
+import identifier_dictionary as idd
 
 #NOTA
 # Los intervalos de dias a incluir según fecha de inicio sintomas, fueron ajustados después de
@@ -20,10 +24,22 @@ property_values = {}
 property_values['attribute_name'] = 'distance_to_infected'
 property_values['priority'] = 2
 
+# Complexity (see cost_model)
+property_values['complexity'] = cm.COMPLEXITY_NODES
+
+# Other properties
+
+# Threads of the nearest case queries (-1 for all). One, since the attributes already run in parallel workers
+num_processes = 1
+
 # Queries
 # ---------
-# Generic Query
-generic_sql = """
+# Distances are computed locally (see spatial_engine): the houses of the nodes are downloaded and the nearest
+# active case of each house is found with the spatial index of the city (see case_index), instead of a cross join.
+# As the cross join, the distance is to the geometry of the case (0 inside it) where the cases have geometries
+
+# Houses of the nodes (nodes without house are included with null coordinates)
+houses_sql = """
 
         with 
         -- Graph Ids
@@ -43,89 +59,19 @@ generic_sql = """
           ON loc.identifier = graph_ids.identifier
           WHERE loc.week_date >= DATE_SUB(DATE("{end_date_string}"), INTERVAL 4 WEEK)
              AND loc.week_date <= DATE_ADD(DATE("{end_date_string}"), INTERVAL 1 WEEK)  -- Casas del ultimo mes (mas una semana)
-           ),
-
-        -- Distance to infected
-        distances as (
-        SELECT identifier, MIN(distance) as distance_to_infected
-        FROM
-        (
-         SELECT
-         houses.identifier as identifier,
-         ST_DISTANCE(ST_GEOGPOINT(houses.lon, houses.lat), ST_GEOGPOINT(infectados.lon, infectados.lat)) as distance -- Distancia a infectado (en metros)
-         FROM houses as houses -- Tabla con las casas
-         CROSS JOIN (SELECT * FROM  positives.{table_name}
-          WHERE  "{end_date_string}" >= DATE_SUB(DATE(date_start_symtoms), INTERVAL 5 DAY) 
-                AND "{end_date_string}" <= DATE_ADD(DATE(date_start_symtoms), INTERVAL 15 DAY)   
-          ) as infectados -- Tabla con los infectados (del ultimo mes)
-         ) as d -- Matriz de distancia entre las casas y los infectados
-         GROUP BY identifier -- Agrupa por el identificador para encontrar la minima distancia
-         )
-
+           )
 
          -- Final Query
-         SELECT graph_ids.identifier as identifier, distances.distance_to_infected as distance_to_infected
+         SELECT graph_ids.identifier as identifier, houses.lat as lat, houses.lon as lon
          FROM graph_ids
-         LEFT JOIN distances
-         ON graph_ids.identifier = distances.identifier
+         LEFT JOIN houses
+         ON graph_ids.identifier = houses.identifier
 
 """
 
-
-# Bogota
-# --------
-bogota_sql = """
-                
-                with 
-                -- Graph Ids
-                graph_ids as (
-                     SELECT identifier
-                     FROM grafos-alcaldia-bogota.transits.hourly_transits
-                     WHERE location_id = "{location_id}"
-                           AND date <= "{end_date_string}"
-                           AND date >=  "{start_date_string}"
-                     GROUP BY identifier
-                ),
-                -- Housing
-                houses as (
-                  SELECT loc.identifier, lat,lon
-                  FROM grafos-alcaldia-bogota.housing_location.colombia_housing_location as loc
-                  JOIN graph_ids
-                  ON loc.identifier = graph_ids.identifier
-                  WHERE loc.week_date >= DATE_SUB(DATE("{end_date_string}"), INTERVAL 4 WEEK)
-                     AND loc.week_date <= DATE_ADD(DATE("{end_date_string}"), INTERVAL 1 WEEK)  -- Casas del ultimo mes (mas una semana)
-                   ),
-
-                -- Distance to infected
-                distances as (
-                SELECT identifier, MIN(distance) as distance_to_infected
-                FROM
-                (
-                 SELECT
-                 houses.identifier as identifier,
-                 ST_DISTANCE(ST_GEOGPOINT(houses.lon, houses.lat), infectados.geometry) as distance -- Distancia a infectado (en metros)
-                 FROM houses as houses -- Tabla con las casas
-                 CROSS JOIN (SELECT * FROM `servinf-unacast-prod.AlcaldiaBogota.positivos_agg_fecha`                  
-                    WHERE  TRIM(fechainici) <> "" AND "{end_date_string}" >= DATE_SUB(DATE(TIMESTAMP(fechainici)), INTERVAL 5 DAY) 
-                            AND "{end_date_string}" <= DATE_ADD(DATE(TIMESTAMP(fechainici)), INTERVAL 15 DAY)   
-                      ) as infectados -- Tabla con los infectados (del ultimo mes)             
-                 ) as d -- Matriz de distancia entre las casas y los infectados
-                 GROUP BY identifier -- Agrupa por el identificador para encontrar la minima distancia
-                 )
-
-                 -- Final Query
-                 SELECT graph_ids.identifier as identifier, distances.distance_to_infected as distance_to_infected
-                 FROM graph_ids
-                 LEFT JOIN distances
-                 ON graph_ids.identifier = distances.identifier                
-                
-        """
-
-
-
 class NodeDistanceToInfected(GenericNodeAttributeWithCases):
     '''
-    Script that computes the distance to infected
+    Script that computes the distance (meters) from the house of each node to the nearest active case
     '''
 
     def __init__(self):
@@ -146,18 +92,18 @@ class NodeDistanceToInfected(GenericNodeAttributeWithCases):
 
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight od the edge (see get_compact_edgelist)      
 
         
         returns
             pd.DataFrame with the following structure
                 - attribute_name (str): The attribute name                     
-                - identifier (str): Identifier of the node or graph
+                - identifier (int32): Identifier of the node (encoded, decoded when written) or graph
                 - value (float): The value of the attribute
         '''
 
@@ -186,28 +132,25 @@ class NodeDistanceToInfected(GenericNodeAttributeWithCases):
             end_date_string = (pd.to_datetime(self.df_locations.loc[location_id, 'end_date']) - timedelta(days = 1)).strftime(utils.date_format)
         
         city = utils.get_city(self.client, location_id, self.df_codes)
-        
-        if city == utils.BOGOTA:
-            query = bogota_sql.format(location_id = location_id, start_date_string = start_date_string, end_date_string = end_date_string)
-            
-        else:
-            query = generic_sql.format(table_name = city, location_id = location_id, start_date_string = start_date_string, end_date_string = end_date_string)
-            
-        # Compute Weights
-        nodes = utils.run_simple_query(self.client, query, allow_large_results = True)
-        
-        # Sets the value
-        nodes.rename(columns = {'distance_to_infected':'value'}, inplace = True)
+
+        # Index over the active cases (shared by the locations of the city)
+        index = ci.case_index_service.get_active_index(self.client, city, end_date_string)
+
+        # Houses
+        query = houses_sql.format(location_id = location_id, start_date_string = start_date_string, end_date_string = end_date_string)
+        query_job = self.client.query(query, job_config = bigquery.QueryJobConfig(allow_large_results = True))
+
+        # Columns as arrays (coordinates are not copied, see utils.query_to_arrays)
+        houses = utils.query_to_arrays(query_job)
+
+        # Distance of each house to its nearest case. Nodes with several houses keep the min (grouped over
+        # the encoded identifiers, see identifier_dictionary)
+        df_houses = pd.DataFrame({'identifier': idd.identifier_dictionary.encode(houses['identifier']),
+                                  'value': index.query(houses['lat'], houses['lon'], num_processes = num_processes)})
+        nodes = df_houses.groupby('identifier', as_index = False)['value'].min()
                 
         # Adds the attribute name
         nodes['attribute_name'] = self.attribute_name
         
         # Returns the value
         return(nodes)
-    
-    
-    
-    
-    
-    
-    
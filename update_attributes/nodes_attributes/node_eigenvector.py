@@ -6,6 +6,7 @@ import pandas as pd
 import igraph as ig
 import utils
 import numpy as np
+import centrality_engine as ce
 
 
 # Dictionary to include property values
@@ -42,32 +43,58 @@ class NodeEigenvector(GenericNodeAttribute):
 
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight of the edge (see get_compact_edgelist)      
 
         
         returns
             pd.DataFrame with the following structure
                 - attribute_name (str): The attribute name           
-                - identifier (str): Identifier of the node or graph
+                - identifier (int32): Identifier of the node (encoded, decoded when written) or graph
                 - value (float): The value of the attribute
         '''
 
-        # Create the graph
-        G = ig.Graph()
-        
-        # Adds the values
-        G.add_vertices(nodes.identifier.values)
-                   
-        if edges.shape[0] > 0:
-            G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
-        
-        # Exctracs the eigenvector
-        eigenvector = G.evcent(weights = edges.weight.values, directed = False)
+        return(self.compute_eigenvector(nodes, edges))
+
+
+    def compute_attribute_for_interval(self, location_id, start_date_string, end_date_string):
+        '''
+        OVERWRITTEN
+        # ---------------
+
+        Same as the generic one, but the sparse engine is shared with the other centralities of the window
+        '''
+
+        nodes = self.get_compact_nodes(location_id, start_date_string, end_date_string)
+        edges = self.get_compact_edgelist(location_id, start_date_string, end_date_string)
+
+        return(self.compute_eigenvector(nodes, edges, location_id, start_date_string, end_date_string))
+
+
+    def compute_eigenvector(self, nodes, edges, location_id = None, start_date_string = None, end_date_string = None):
+        '''
+        Computes the weighted eigenvector centrality with the selected backend
+        '''
+
+        if self.centrality_backend == ce.BACKEND_IGRAPH:
+
+            # Create the graph (vertices follow the order of the nodes)
+            G, _ = utils.build_graph(nodes, edges, weighted = True)
+
+            # Exctracs the eigenvector
+            eigenvector = G.evcent(weights = 'weight', directed = False)
+
+        else:
+
+            # Adjacency matrix (rows follow the order of the nodes)
+            engine = self.get_centrality_engine(nodes, edges, location_id, start_date_string, end_date_string)
+
+            # Exctracs the eigenvector
+            eigenvector, _ = engine.eigenvector(weighted = True)
         
         # Adds it to the nodes
         nodes['value'] = eigenvector
@@ -77,4 +104,3 @@ class NodeEigenvector(GenericNodeAttribute):
         
         # Constructs the dataframe
         return(nodes)
-    
@@ -6,6 +6,9 @@ import pandas as pd
 import igraph as ig
 import utils
 import numpy as np
+import pagerank_engine as pe
+import centrality_engine as ce
+import sparsification_engine as spe
 
 
 # Dictionary to include property values
@@ -18,6 +21,17 @@ property_values['attribute_name'] = 'pagerank_centrality'
 property_values['max_num_nodes'] = np.inf
 property_values['max_num_edges'] = 25000000 # 25 Millions
 
+# Degraded mode above the max edges (see sparsification_engine)
+property_values['degraded_mode'] = spe.EDGE_SAMPLE
+
+
+# Other properties
+
+# Tolerance of the power iteration (L1)
+tol = pe.default_tol
+# Max number of iterations
+max_iter = pe.default_max_iter
+
 
 class NodePageRank(GenericNodeAttribute):
     '''
@@ -42,36 +56,62 @@ class NodePageRank(GenericNodeAttribute):
 
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight od the edge (see get_compact_edgelist)      
 
         
         returns
             pd.DataFrame with the following structure
                 - attribute_name (str): The attribute name           
-                - identifier (str): Identifier of the node or graph
+                - identifier (int32): Identifier of the node (encoded, decoded when written) or graph
                 - value (float): The value of the attribute
         '''
 
-        # Create the graph
-        G = ig.Graph()
-        
-        # Adds the values
-        G.add_vertices(nodes.identifier.values)
-        
-        if edges.shape[0] > 0:
-            G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
-            
-        # Adds weights    
-        G.es['weight'] = edges.weight.values
-        
-        # Exctracs the pagerank
-        page_rank = G.pagerank(weights = 'weight',  directed = False)
-        
+        return(self.compute_pagerank(nodes, edges))
+
+
+    def compute_attribute_for_interval(self, location_id, start_date_string, end_date_string):
+        '''
+        OVERWRITTEN
+        # ---------------
+
+        Same as the generic one, but the adjacency matrix is shared with the other centralities of the window (see get_centrality_engine)
+        '''
+
+        nodes = self.get_compact_nodes(location_id, start_date_string, end_date_string)
+        edges = self.get_compact_edgelist(location_id, start_date_string, end_date_string)
+
+        return(self.compute_pagerank(nodes, edges, location_id, start_date_string, end_date_string))
+
+
+    def compute_pagerank(self, nodes, edges, location_id = None, start_date_string = None, end_date_string = None):
+        '''
+        Computes the weighted pagerank with the selected backend (see pagerank_engine for the sparse one)
+        '''
+
+        if self.centrality_backend == ce.BACKEND_IGRAPH:
+
+            # Create the graph (vertices follow the order of the nodes)
+            G, _ = utils.build_graph(nodes, edges, weighted = True)
+
+            # Exctracs the pagerank
+            page_rank = G.pagerank(weights = 'weight', directed = False)
+
+        else:
+
+            # Adjacency matrix (rows follow the order of the nodes)
+            engine = self.get_centrality_engine(nodes, edges, location_id, start_date_string, end_date_string)
+
+            # Exctracs the pagerank
+            page_rank, iterations = pe.pagerank(engine.A_weighted, tol = tol, max_iter = max_iter)
+
+            if iterations >= max_iter:
+                print(f'            Warning: {self.attribute_name} did not converge in {max_iter} iterations')
+
         # Adds it to the nodes
         nodes['value'] = page_rank
         
@@ -80,11 +120,3 @@ class NodePageRank(GenericNodeAttribute):
         
         # Constructs the dataframe
         return(nodes)
-    
-
-    
-    
-    
-    
-    
-    
@@ -7,6 +7,10 @@ import numpy as np
 import igraph as ig
 import utils
 import positive_db_functions as pos_fun
+import pagerank_engine as pe
+import centrality_engine as ce
+import sparsification_engine as spe
+import identifier_dictionary as idd
 
 
 # Dictionary to include property values
@@ -18,10 +22,16 @@ property_values['attribute_name'] = 'personalized_pagerank_centrality'
 # Priority
 property_values['priority'] = 2
 
+# Dependencies
+property_values['dependencies'] = ['distance_to_infected']
+
 # Max Support
 property_values['max_num_nodes'] = np.inf
 property_values['max_num_edges'] = 25000000 # 25 Millions
 
+# Degraded mode above the max edges (see sparsification_engine)
+property_values['degraded_mode'] = spe.EDGE_SAMPLE
+
 
 # Other properties
 
@@ -29,6 +39,10 @@ property_values['max_num_edges'] = 25000000 # 25 Millions
 eps = 1e-16
 # Constant for division (For weight depending on distance)
 div = 1200 # in meters
+# Tolerance of the power iteration (L1)
+tol = pe.default_tol
+# Max number of iterations
+max_iter = pe.default_max_iter
 
 class NodePersonalizedPageRank(GenericNodeAttributeWithCases):
     '''
@@ -53,18 +67,18 @@ class NodePersonalizedPageRank(GenericNodeAttributeWithCases):
 
         params
             nodes (pd.DataFrame) Pandas Dataframe with the nodes of the graph:
-                - identifier (str): Id of the node
+                - identifier (int32): Id of the node (encoded, see identifier_dictionary)
                 - weight (int): Weight of the node (see get_compact_nodes) 
             edges (pd.DataFrame) Pandas dataFrame with the grouped edglist (undirected)
-                - id1 (str) 
-                - id2 (str)
+                - id1 (int32): encoded identifier
+                - id2 (int32): encoded identifier
                 - weight (num) Weight od the edge (see get_compact_edgelist)      
 
         
         returns
             pd.DataFrame with the following structure
                 - attribute_name (str): The attribute name                     
-                - identifier (str): Identifier of the node or graph
+                - identifier (int32): Identifier of the node (encoded, decoded when written) or graph
                 - value (float): The value of the attribute
         '''
 
@@ -90,6 +104,7 @@ class NodePersonalizedPageRank(GenericNodeAttributeWithCases):
              SELECT identifier, attribute_value as distance_to_infected
                 FROM {utils.nodes_attribute_table}
                 WHERE location_id = '{location_id}'
+                    AND attribute_name = 'distance_to_infected'
                     AND date = '{end_date_string}'
         """
         
@@ -108,6 +123,11 @@ class NodePersonalizedPageRank(GenericNodeAttributeWithCases):
         
         # Nodes
         nodes = self.get_compact_nodes(location_id, start_date_string, end_date_string)
+
+        # Merges over the encoded identifiers (see identifier_dictionary). Identifiers not in the dictionary are not nodes
+        if idd.is_encoded(nodes.identifier):
+            df_distances['identifier'] = idd.identifier_dictionary.lookup(df_distances.identifier.values)
+            df_distances = df_distances[df_distances.identifier >= 0]
         
         # Merges with weights        
         nodes = nodes.merge(df_distances, on = 'identifier', how = 'left')
@@ -117,21 +137,25 @@ class NodePersonalizedPageRank(GenericNodeAttributeWithCases):
         # Edges               
         edges = self.get_compact_edgelist(location_id, start_date_string, end_date_string)    
         
-        # Create the graph
-        G = ig.Graph()
-        
-        # Adds the values
-        G.add_vertices(nodes.identifier.values)        
-                    
-        if edges.shape[0] > 0:
-            G.add_edges(edges.apply(lambda df: (df.id1, df.id2), axis = 1))
-        
-        # Adds weights to edges
-        G.es['weight'] = edges.weight.values
-        
-        # Exctracs the personalized pagerank
-        personalized_page_rank = G.personalized_pagerank(weights = 'weight', directed = False, reset = nodes['dist_weight'].values)
-        
+        if self.centrality_backend == ce.BACKEND_IGRAPH:
+
+            # Create the graph (vertices follow the order of the nodes)
+            G, _ = utils.build_graph(nodes, edges, weighted = True)
+
+            # Exctracs the personalized pagerank
+            personalized_page_rank = G.personalized_pagerank(weights = 'weight', directed = False, reset = nodes['dist_weight'].values)
+
+        else:
+
+            # Adjacency matrix (rows follow the order of the nodes). Shared with the other centralities of the window
+            engine = self.get_centrality_engine(nodes, edges, location_id, start_date_string, end_date_string)
+
+            # Exctracs the personalized pagerank
+            personalized_page_rank, iterations = pe.pagerank(engine.A_weighted, reset = nodes['dist_weight'].values, tol = tol, max_iter = max_iter)
+
+            if iterations >= max_iter:
+                print(f'            Warning: {self.attribute_name} did not converge in {max_iter} iterations')
+
         # Adds it to the nodes
         nodes['value'] = personalized_page_rank
         
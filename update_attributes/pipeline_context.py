@@ -0,0 +1,233 @@
+# Pipeline Context
+# Data shared by all the attribute instances (client, locations, min support dates, graph sizes, geo codes and
+# positives dates). Each table is loaded once, on first use, instead of once per attribute when it is created.
+
+import threading
+import pandas as pd
+from google.cloud import bigquery
+
+import utils
+import positive_db_functions as pos_fun
+import case_index as ci
+
+
+class PipelineContext():
+    '''
+    Lazily built context of the attributes update
+    '''
+
+    def __init__(self):
+
+        self.lock = threading.RLock()
+
+        self.client = None
+        self.df_locations = None
+        self.min_location_start_dates = None
+        self.df_codes = None
+        self.positive_max_dates = None
+        self.positive_min_dates = None
+
+        # Parent of each location (see utils.get_location_hierarchy)
+        self.parents = None
+
+        # Graph sizes, indexed by (location_id, date). Only the loaded locations (since min date) are present
+        self.df_graph_sizes = None
+        self.graph_sizes_min_dates = {}
+
+
+    def get_client(self):
+        '''
+        Returns the BigQuery client (created on first use)
+        '''
+
+        with self.lock:
+            if self.client is None:
+                self.client = bigquery.Client(location="US")
+
+        return(self.client)
+
+
+    def set_client(self, client):
+        '''
+        Replaces the client (clients can't be shared between processes)
+        '''
+        self.client = client
+
+
+    def get_locations(self):
+        '''
+        Returns the locations (see utils.get_current_locations) indexed by location_id
+        '''
+
+        with self.lock:
+            if self.df_locations is None:
+                self.df_locations = utils.get_current_locations(self.get_client())
+                self.df_locations.index = self.df_locations.location_id
+
+        return(self.df_locations)
+
+
+    def get_min_location_start_dates(self):
+        '''
+        Returns the min support date of the locations indexed by location_id
+        '''
+
+        with self.lock:
+            if self.min_location_start_dates is None:
+                self.min_location_start_dates = utils.get_min_support_date_for_location_attributes(self.get_client())
+                self.min_location_start_dates.index = self.min_location_start_dates.location_id
+
+        return(self.min_location_start_dates)
+
+
+    def get_geo_codes(self):
+        '''
+        Returns the geo codes of all locations indexed by location_id
+        '''
+
+        with self.lock:
+            if self.df_codes is None:
+                self.df_codes = utils.get_geo_codes(self.get_client(), location_id = None)
+                self.df_codes.index = self.df_codes.location_id
+
+        return(self.df_codes)
+
+
+    def get_positive_max_dates(self):
+        '''
+        Returns the max date of the positives of each city (see positive_db_functions)
+        '''
+
+        with self.lock:
+            if self.positive_max_dates is None:
+                self.positive_max_dates = pos_fun.get_positive_max_dates(self.get_client())
+
+        return(self.positive_max_dates)
+
+
+    def get_positive_min_dates(self):
+        '''
+        Returns the min date of the positives of each city (see positive_db_functions)
+        '''
+
+        with self.lock:
+            if self.positive_min_dates is None:
+                self.positive_min_dates = pos_fun.get_positive_min_dates(self.get_client())
+
+        return(self.positive_min_dates)
+
+
+    def get_parents(self):
+        '''
+        Returns the parent of each dynamic location (see utils.get_location_hierarchy). Only parents that are
+        not children of another location are kept, so the hierarchy has a single level.
+
+        returns
+            dict location_id -> parent_id
+        '''
+
+        with self.lock:
+            if self.parents is None:
+                df_locations = self.get_locations()
+                dynamic = set(df_locations[df_locations.construction_type == utils.CT_DYNAMIC].location_id)
+
+                df = utils.get_location_hierarchy(self.get_client(), location_ids = list(dynamic))
+                children = set(df.location_id)
+
+                self.parents = {row.location_id : row.parent_id for row in df.itertuples() if row.parent_id not in children}
+
+        return(self.parents)
+
+
+    def get_parent(self, location_id):
+        '''
+        Returns the parent of the location (see get_parents) or None
+        '''
+        return(self.get_parents().get(location_id, None))
+
+
+    def load_graph_sizes(self, location_ids, min_date = None):
+        '''
+        Loads (with a single query) the graph sizes of the given locations since min date. Call it with the
+        pending locations before excecuting, so the rest of the table is never downloaded.
+
+        params
+            - location_ids (list): The locations
+            - min_date (str): Min date in %Y-%m-%d. None for all dates
+        '''
+
+        location_ids = [location_id for location_id in set(location_ids) if location_id not in self.graph_sizes_min_dates or (self.graph_sizes_min_dates[location_id] is not None and (min_date is None or min_date < self.graph_sizes_min_dates[location_id]))]
+
+        if len(location_ids) == 0:
+            return
+
+        with self.lock:
+
+            df = utils.get_graph_sizes(self.get_client(), location_ids = location_ids, min_date = min_date)
+            df.date = df.date.apply(pd.to_datetime)
+            df.set_index(['location_id','date'], inplace = True)
+
+            if self.df_graph_sizes is None:
+                self.df_graph_sizes = df
+            else:
+                self.df_graph_sizes = pd.concat([self.df_graph_sizes, df])
+                self.df_graph_sizes = self.df_graph_sizes[~self.df_graph_sizes.index.duplicated(keep = 'last')]
+
+            for location_id in location_ids:
+                self.graph_sizes_min_dates[location_id] = min_date
+
+
+    def prepare(self, location_ids, min_date, load_parents = False):
+        '''
+        Loads the data read by the tasks (only the graph sizes of the pending locations and dates) and the
+        cases of the cities. Called before 
+        the worker processes are forked, so they inherit it instead of querying it again.
+
+        params
+            - location_ids (list): The pending locations
+            - min_date (str): The first pending date in %Y-%m-%d
+            - load_parents (boolean): Loads the hierarchy of the locations (see get_parents)
+        '''
+
+        self.get_locations()
+        self.get_min_location_start_dates()
+        self.get_geo_codes()
+        self.get_positive_max_dates()
+        self.get_positive_min_dates()
+        self.load_graph_sizes(location_ids, min_date = min_date)
+
+        if load_parents:
+            self.get_parents()
+
+        # Cases of the cities (see case_index)
+        for city in pos_fun.cities_with_positives:
+            ci.case_index_service.load_cases(self.get_client(), city)
+
+
+    def get_graph_size(self, location_id, current_date):
+        '''
+        Returns the number of nodes and edges of the graph of the location on the given date. If the location
+        was not loaded (see load_graph_sizes), all its dates are loaded.
+
+        returns
+            num_nodes (int)
+            num_edges (int)
+
+        generates
+            - KeyError if there is no size for the location and date
+        '''
+
+        current_date = pd.to_datetime(current_date)
+
+        min_date = self.graph_sizes_min_dates.get(location_id, None)
+        if location_id not in self.graph_sizes_min_dates or (min_date is not None and current_date < pd.to_datetime(min_date)):
+            self.load_graph_sizes([location_id], min_date = None)
+
+        row = self.df_graph_sizes.loc[(location_id, current_date)]
+
+        return(row['num_nodes'], row['num_edges'])
+
+
+
+# Shared by all the attribute instances of the process
+shared_context = PipelineContext()
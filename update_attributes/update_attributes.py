@@ -8,9 +8,21 @@ import time
 import numpy as np
 from datetime import timedelta, datetime
 import os
+import shutil
+import tempfile
+import traceback
+import multiprocessing
+import multiprocessing.util
+import heapq
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 
 # Custom Scripts
 import utils
+import attribute_generic
+import pipeline_context
+import cost_model
+import case_index
 
 
 # imports all the attributes
@@ -43,8 +55,9 @@ import graphs_attributes.graph_num_contacts_inside as graph_num_contacts_inside
 # Include here the desired node attributes
 # ------------------------------------
 all_node_attributes = []
-#all_node_attributes.append(node_degree.NodeDegree())
+all_node_attributes.append(node_degree.NodeDegree())
 all_node_attributes.append(node_pagerank.NodePageRank())
+all_node_attributes.append(node_betweenness.NodeBetweenness())
 #all_node_attributes.append(node_eigenvector.NodeEigenvector())
 all_node_attributes.append(node_distance_to_infected.NodeDistanceToInfected())
 all_node_attributes.append(node_personalized_pagerank.NodePersonalizedPageRank())
@@ -60,59 +73,80 @@ all_graph_attributes.append(graph_num_contacts_inside.GraphNumberOfContactsInsid
 all_graph_attributes.append(graph_pagerank_gini.GraphPageRankGini())
 #all_graph_attributes.append(graph_eigenvector_gini.GraphEigenvectorGini())
 all_graph_attributes.append(graph_personalized_pagerank_gini.GraphPersonalizedPageRankGini())
-#all_graph_attributes.append(graph_powerlaw_degree_test.GraphPowerLawTest())
-#all_graph_attributes.append(graph_eigenvalue_unweighted.GraphEigenValueUnweighted())
-#all_graph_attributes.append(graph_eigenvalue_weighted.GraphEigenValueWeighted())
-#all_graph_attributes.append(graph_transitivity.GraphTransitivity())
+all_graph_attributes.append(graph_powerlaw_degree_test.GraphPowerLawTest())
+all_graph_attributes.append(graph_eigenvalue_unweighted.GraphEigenValueUnweighted())
+all_graph_attributes.append(graph_eigenvalue_weighted.GraphEigenValueWeighted())
+all_graph_attributes.append(graph_transitivity.GraphTransitivity())
 all_graph_attributes.append(graph_num_cases_accumulated.GraphNumberOfCasesAccumulated())
 
 
 
-# Orders the list by priority
-# Nodes
-node_order = [elem.priority for elem in all_node_attributes]
-all_node_attributes = (np.array(all_node_attributes)[np.argsort(node_order)]).tolist()
+# Attributes are excecuted following their declared dependencies (see get_task_graph). The dates of the
+# same attribute and location are excecuted in order, so a failed date is never left behind the max date.
+# Ready tasks are dispatched longest first by their estimated cost (see cost_model). Priority only breaks ties.
+# Each location has a home worker, that runs its tasks whenever it is free (see execute_task_graph).
 
-# Graphs
-graph_order = [elem.priority for elem in all_graph_attributes]
-all_graph_attributes = (np.array(all_graph_attributes)[np.argsort(graph_order)]).tolist()
 
+# Parallel Excecution
+# ------------------------------------
+# Number of worker processes (1 to excecute everything in the current process)
+num_workers = max(1, os.cpu_count() - 1)
 
-def main():
-    
+# Workers have their own memory tier of the graph data cache, so with several workers the disk tier is
+# required for the attributes of the same window to share its data. If attribute_generic.cache_disk_location
+# is not set, a temporary folder is used for the run (removed at the end)
+worker_cache_parent_location = tempfile.gettempdir()
 
-    # Extracts the current date
-    end_date = utils.get_today(only_date = True)
-    end_date = end_date - timedelta(days = 1) # Graphs are computed until the end of previuos date
-    
-    # DEBUG
-    #end_date = pd.to_datetime('2020-11-08')
- 
-    # Extracts the locations
-    client = bigquery.Client(location="US")
-    df_locations_all = utils.get_current_locations_for_attributes(client)
-    
-    # Nodes
-    df_att_all = utils.get_max_dates_for_node_attributes(client)
-    
-    
-    print(f'Computing {len(all_node_attributes)} Node Attributes')
-    # Excecutes all the Node attributes
-    
-    start_time = time.time()
+# Threads that download the pending spans before the workers start (see prefetch_pending_spans)
+prefetch_threads = 4
+
+# Estimated cost of the tasks (calibrated with the log of the previous runs)
+task_cost_model = cost_model.CostModel()
+
+# Kinds of units
+NODES = 'nodes'
+GRAPHS = 'graphs'
+
+
+def get_attributes(kind):
+    '''
+    Returns the list of attributes of the given kind
+    '''
+    if kind == NODES:
+        return(all_node_attributes)
+
+    return(all_graph_attributes)
+
+
+def get_pending_units(kind, attributes, df_att_all, df_locations_all, end_date):
+    '''
+    Gets the pending work units of the given attributes. A unit is a location and the dates to compute for
+    a single attribute.
+
+    params
+        - kind (str): NODES or GRAPHS
+        - attributes (list): The attributes (all_node_attributes or all_graph_attributes)
+        - df_att_all (pd.DataFrame): Max computed date of each attribute and location
+        - df_locations_all (pd.DataFrame): The locations
+        - end_date (pd.datetime): The last date to compute
+
+    returns
+        list of tuples (kind, attribute_index, location_id, date_strings)
+    '''
+
+    units = []
 
     j = 0
-    for n_att in all_node_attributes:
-        
+    for att_index, att in enumerate(attributes):
+
         j += 1
-        print(f'   Coputing { n_att.attribute_name}. ({j} of {len(all_node_attributes)})')
-        df_att = df_att_all[df_att_all.attribute_name == n_att.attribute_name].copy()
+        df_att = df_att_all[df_att_all.attribute_name == att.attribute_name].copy()
 
         # Merges
         df_current = df_locations_all[['location_id']].merge(df_att, on = 'location_id', how = 'left')
         
         # Removes the locations with no support
-        df_current = df_current[df_current.location_id.apply(lambda l: n_att.location_id_supported(l))]
+        df_current = df_current[df_current.location_id.apply(lambda l: att.location_id_supported(l))]
 
         # Filters out
         selected = df_current[(df_current.max_date.isna()) | (df_current.max_date < (end_date - timedelta(days = utils.global_attribute_window_shift_days)))].copy()
@@ -120,98 +154,730 @@ def main():
         # Transforms the date into datetime (bug?)
         selected.max_date = selected.max_date.apply(pd.to_datetime)
 
+        print(f'   { att.attribute_name} ({j} of {len(attributes)}): Found {selected.shape[0]}')
 
-        print(f'      Found {selected.shape[0]}')
-        
-        i = 0
         for ind, row in selected.iterrows():
-            
-            i += 1
 
             if pd.isna(row.max_date):
-                start_date = n_att.starting_date
+                start_date = att.starting_date
             else:
                 start_date = row.max_date + timedelta(days = utils.global_attribute_window_shift_days) # Next Day Shifted
 
+            date_strings = []
+            current_date = start_date
+            while current_date <= end_date:
+                date_strings.append(current_date.strftime( utils.date_format))
+                current_date = current_date + timedelta(days = utils.global_attribute_window_shift_days)
 
-            print(f'         Calculating { n_att.attribute_name} for {row.location_id} ({i} of {selected.shape[0]}), from: {start_date} to {end_date}')
+            if len(date_strings) > 0:
+                units.append((kind, att_index, row.location_id, date_strings))
 
+    return(units)
 
-            current_date = start_date
-            while current_date <= end_date:
 
-                if n_att.location_id_supported_on_date(row.location_id, current_date):
-                    n_att.save_attribute_for_date(row.location_id, current_date.strftime( utils.date_format))
-                    print(f'            {current_date}: OK.')
-                else:
-                    print(f'            {current_date}: Skipped by implementation.')
+def set_pending_spans(units):
+    '''
+    Batch mode of the daily aggregates: declares the days covered by the pending windows of each (dynamic)
+    location, so its daily edges and nodes are downloaded once (first window) and the rest of the windows are
+    sliced in memory. Called before the worker processes are forked, so they inherit the spans.
 
+    params
+        - units (list): Units (see get_pending_units)
+    '''
 
-                current_date = current_date + timedelta(days = utils.global_attribute_window_shift_days)
-            
-            print(f'   Elapsed Time: {np.round((time.time() - start_time)/3600,3)} hours')
+    df_locations = pipeline_context.shared_context.get_locations()
+    dynamic = set(df_locations[df_locations.construction_type == utils.CT_DYNAMIC].location_id)
 
+    spans = {}
+    for _, _, location_id, date_strings in units:
+        if location_id not in dynamic:
+            continue
 
-    print()
-    print('Completed Node Attribute')
-    print('---------------------------------------')
-    print('')
+        # In hierarchical mode the edges of the children come from their parent (see attribute_generic)
+        span_ids = [location_id]
+        if attribute_generic.hierarchical_mode and pipeline_context.shared_context.get_parent(location_id) is not None:
+            span_ids.append(pipeline_context.shared_context.get_parent(location_id))
 
-    
-    # Graphs
-    df_att_all = utils.get_max_dates_for_graph_attributes(client)
-    
-    print(f'Computing {len(all_graph_attributes)} Graphs Attributes')
-    # Excecutes all the graph attributes
-    
-    j = 0
-    for g_att in all_graph_attributes:
-        
-        j += 1
-        print(f'   Computing { g_att.attribute_name} ({j} of {len(all_graph_attributes)})')
-        df_att = df_att_all[df_att_all.attribute_name == g_att.attribute_name].copy()
+        for span_id in span_ids:
+            start, end = date_strings[0], date_strings[-1]
+            if span_id in spans:
+                start, end = min(start, spans[span_id][0]), max(end, spans[span_id][1])
 
-        # Merges
-        df_current = df_locations_all[['location_id']].merge(df_att, on = 'location_id', how = 'left')
-        
-        # Removes the locations with no support
-        df_current = df_current[df_current.location_id.apply(lambda l: g_att.location_id_supported(l))]
-        
-        # Filters out
-        selected = df_current[(df_current.max_date.isna()) | (df_current.max_date < (end_date - timedelta(days = utils.global_attribute_window_shift_days)))]
+            spans[span_id] = (start, end)
 
+    for location_id, (start, end) in spans.items():
+        # Each window ends on its date
+        start = (pd.to_datetime(start) - timedelta(days = utils.global_attribute_window - 1)).strftime( utils.date_format)
+        attribute_generic.daily_aggregates.set_pending_span(location_id, start, end)
 
-        print(f'      Found {selected.shape[0]}')
-        i = 0
-        for ind, row in selected.iterrows():
+    return(len(spans))
 
-            i += 1
-            
-            if pd.isna(row.max_date):
-                start_date = g_att.starting_date
+
+def prefetch_pending_spans(client):
+    '''
+    Downloads the pending spans (see set_pending_spans) in the current process, into the disk tier of the
+    graph data cache. Workers have their own memory, so without it every worker computing a window of a
+    location would download its whole span again. The memory tier of the current process is cleared after.
+    '''
+
+    spans = attribute_generic.daily_aggregates.pending_spans
+
+    def prefetch(location_id):
+        # In hierarchical mode the edges of the children come from their parent
+        if attribute_generic.hierarchical_mode and pipeline_context.shared_context.get_parent(location_id) is not None:
+            dataset_id = None
+        else:
+            dataset_id = utils.get_dataset_of_location(client, location_id)
+
+        return(attribute_generic.daily_aggregates.prefetch_pending_span(client, location_id, dataset_id = dataset_id))
+
+    with ThreadPoolExecutor(max_workers = prefetch_threads) as executor:
+        num_days = sum(executor.map(prefetch, list(spans)))
+
+    attribute_generic.graph_data_cache.clear()
+
+    return(num_days)
+
+
+def check_dependencies():
+    '''
+    Checks that the declared dependencies between the attributes have no cycles.
+
+    generates
+        - Exception if a cycle is found
+    '''
+
+    names = [att.attribute_name for att in all_node_attributes + all_graph_attributes]
+    dependencies = {att.attribute_name : [dep for dep in att.dependencies if dep in names] for att in all_node_attributes + all_graph_attributes}
+
+    for att in all_node_attributes + all_graph_attributes:
+        for dep in att.dependencies:
+            if dep not in names:
+                print(f'   {att.attribute_name} depends on {dep}, which is not excecuted. Assumes its values exist.')
+
+    # Removes attributes without pending dependencies until none is left
+    while len(dependencies) > 0:
+        free = [name for name in dependencies if len([dep for dep in dependencies[name] if dep in dependencies]) == 0]
+        if len(free) == 0:
+            raise ValueError(f'The dependencies between the attributes have a cycle: {dependencies}')
+
+        for name in free:
+            dependencies.pop(name)
+
+
+def get_task_graph(units):
+    '''
+    Builds the DAG of tasks. Each task is an (attribute, location, date) and depends on:
+        - The tasks of the attributes it reads (see the dependencies property) for the same location and date.
+          Only pending tasks are waited for, the rest are assumed to exist.
+        - The task of the previous pending date of the same attribute and location. Dates are resumed from the
+          max computed date, so if a date fails the later ones must not be computed.
+
+    Derived graph attributes (see GenericGraphAttribute) whose node attribute is also pending are not
+    separate tasks: they are computed in the task of the node attribute, from its result.
+
+    params
+        - units (list): Units (see get_pending_units)
+
+    returns
+        - tasks (dict): key (attribute_name, location_id, date_string) -> unit with a single date and the
+                        indices of the derived graph attributes computed with it
+        - dependencies (dict): key -> set of keys it waits for
+        - dependents (dict): key -> list of keys that wait for it
+    '''
+
+    tasks = {}
+    for kind, att_index, location_id, date_strings in units:
+        att = get_attributes(kind)[att_index]
+        for date_string in date_strings:
+            tasks[(att.attribute_name, location_id, date_string)] = (kind, att_index, location_id, [date_string], [])
+
+    # Pending dates of each attribute and location (before folding)
+    chains = {}
+    for key in tasks:
+        chains.setdefault((key[0], key[1]), []).append(key)
+
+    # Folds the derived attributes into the task of their node attribute
+    folded = {}
+    for key, unit in list(tasks.items()):
+        att = get_attributes(unit[0])[unit[1]]
+        if unit[0] == GRAPHS and att.is_derived() and att.dependencies == [att.derived_from]:
+            source_key = (att.derived_from, key[1], key[2])
+            if source_key in tasks and tasks[source_key][0] == NODES:
+                tasks[source_key][4].append(unit[1])
+                folded[key] = source_key
+                del tasks[key]
+
+    dependencies = {key : set() for key in tasks}
+    dependents = {key : [] for key in tasks}
+
+    def add_dependency(key, dep_key):
+        key, dep_key = folded.get(key, key), folded.get(dep_key, dep_key)
+        if dep_key in tasks and dep_key != key and dep_key not in dependencies[key]:
+            dependencies[key].add(dep_key)
+            dependents[dep_key].append(key)
+
+    for key, unit in tasks.items():
+        att = get_attributes(unit[0])[unit[1]]
+        for dep_name in att.dependencies:
+            add_dependency(key, (dep_name, key[1], key[2]))
+
+    for chain in chains.values():
+        chain.sort(key = lambda k: k[2])
+        for previous_key, key in zip(chain[:-1], chain[1:]):
+            add_dependency(key, previous_key)
+
+    return(tasks, dependencies, dependents)
+
+
+def get_task_costs(tasks, dependents):
+    '''
+    Estimates the cost (seconds) of each task from the size of its graph (see cost_model) and its rank: its
+    cost plus the largest rank of the tasks that wait for it (the longest chain of work it unlocks).
+
+    params
+        - tasks (dict): see get_task_graph
+        - dependents (dict): see get_task_graph
+
+    returns
+        - costs (dict): key -> dict with num_nodes, num_edges and the work and predicted seconds of each attribute
+                        computed in the task (the derived ones included)
+        - ranks (dict): key -> seconds
+    '''
+
+    costs = {}
+    for key, unit in tasks.items():
+        kind, att_index, location_id, date_strings, derived = unit
+
+        try:
+            num_nodes, num_edges = pipeline_context.shared_context.get_graph_size(location_id, date_strings[0])
+        except KeyError:
+            # Without graph (only the overhead)
+            num_nodes, num_edges = 0, 0
+
+        cost = {'num_nodes': num_nodes, 'num_edges': num_edges, 'attributes': {}}
+        for att in [get_attributes(kind)[att_index]] + [all_graph_attributes[i] for i in derived]:
+            cost['attributes'][att.attribute_name] = task_cost_model.estimate(att, num_nodes, num_edges)
+
+        cost['seconds'] = sum([seconds for _, seconds in cost['attributes'].values()])
+        costs[key] = cost
+
+    # Ranks (dependents first)
+    ranks = {}
+    def get_rank(key):
+        if key not in ranks:
+            ranks[key] = costs[key]['seconds'] + max([get_rank(dep_key) for dep_key in dependents[key]], default = 0)
+        return(ranks[key])
+
+    for key in tasks:
+        get_rank(key)
+
+    return(costs, ranks)
+
+
+def log_task_costs(results, costs):
+    '''
+    Logs the predicted and actual cost of the computed tasks (see cost_model), so the model is recalibrated
+    on the next run
+
+    returns
+        predicted seconds
+        actual seconds
+    '''
+
+    run_date = utils.get_today().strftime( utils.date_format)
+
+    # By attribute (derived attributes are computed in the task of their node attribute)
+    attribute_costs = {(name, location_id, date_string) : cost for (_, location_id, date_string), cost in costs.items() for name in cost['attributes']}
+
+    rows = []
+    for res in results:
+        if res['error'] is not None or res['computed'] == 0:
+            continue
+
+        key = (res['attribute_name'], res['location_id'], res['dates'][0])
+        if key not in attribute_costs:
+            continue
+
+        cost = attribute_costs[key]
+
+        work, predicted_seconds = cost['attributes'][key[0]]
+        rows.append({'run_date': run_date, 'attribute_name': key[0], 'location_id': key[1], 'date': key[2],
+                     'num_nodes': cost['num_nodes'], 'num_edges': cost['num_edges'], 'work': work,
+                     'predicted_seconds': predicted_seconds, 'actual_seconds': res['elapsed_seconds']})
+
+    try:
+        task_cost_model.log(rows)
+    except OSError as e:
+        print(f'            Could not write the cost log: {e}')
+
+    return(sum([row['predicted_seconds'] for row in rows]), sum([row['actual_seconds'] for row in rows]))
+
+
+def init_worker():
+    '''
+    Initializer of the worker processes. Clients can't be shared between processes, so each worker starts its own.
+    '''
+
+    pipeline_context.shared_context.set_client(bigquery.Client(location="US"))
+
+    for writer in [attribute_generic.node_attribute_writer, attribute_generic.graph_attribute_writer, attribute_generic.approximation_writer]:
+        writer.client = None
+
+        # Workers do not run atexit, the remaining rows are flushed when the pool shuts down
+        multiprocessing.util.Finalize(writer, writer.flush, exitpriority = 10)
+
+
+def run_unit(kind, att_index, location_id, date_strings, derived = [], flush = True):
+    '''
+    Computes and saves the attribute for the location on the given dates.
+
+    params
+        - kind (str): NODES or GRAPHS
+        - att_index (int): Index of the attribute (see get_attributes)
+        - location_id (str): The graph id
+        - date_strings (list): Dates in %Y-%m-%d
+        - derived (list): Indices of the derived graph attributes computed from the result of this (node) attribute
+        - flush (boolean): Flush the results before returning (when other units read them)
+
+    returns
+        dict with the result of the unit. The results of the derived attributes are in derived_results
+    '''
+
+    att = get_attributes(kind)[att_index]
+    writer = attribute_generic.node_attribute_writer if kind == NODES else attribute_generic.graph_attribute_writer
+
+    result = {'kind': kind, 'attribute_name': att.attribute_name, 'location_id': location_id, 'dates': date_strings, 'computed': 0, 'skipped': 0, 'error': None}
+    derived_atts = [all_graph_attributes[i] for i in derived]
+    derived_results = [{'kind': GRAPHS, 'attribute_name': d_att.attribute_name, 'location_id': location_id, 'dates': date_strings, 'computed': 0, 'skipped': 0, 'error': None, 'elapsed_seconds': 0} for d_att in derived_atts]
+    start_time = time.time()
+
+    try:
+        for date_string in date_strings:
+
+            df_result = None
+            if att.location_id_supported_on_date(location_id, pd.to_datetime(date_string)):
+                df_result = att.save_attribute_for_date(location_id, date_string)
+                result['computed'] += 1
             else:
-                start_date = pd.to_datetime(row.max_date) + timedelta(days = utils.global_attribute_window_shift_days) # Next Day
+                result['skipped'] += 1
+
+            # Derived attributes (from the result still in memory)
+            for d_att, d_result in zip(derived_atts, derived_results):
+                d_start_time = time.time()
+                try:
+                    if d_att.location_id_supported_on_date(location_id, pd.to_datetime(date_string)):
+                        d_att.save_attribute_for_date(location_id, date_string, df_node_result = df_result)
+                        d_result['computed'] += 1
+                    else:
+                        d_result['skipped'] += 1
+                except Exception:
+                    d_result['error'] = traceback.format_exc()
+
+                d_result['elapsed_seconds'] += time.time() - d_start_time
+
+        if flush:
+            writer.flush()
+            if len(derived_atts) > 0:
+                attribute_generic.graph_attribute_writer.flush()
+
+    except Exception:
+        result['error'] = traceback.format_exc()
+        for d_result in derived_results:
+            if d_result['error'] is None and d_result['computed'] < len(date_strings):
+                d_result['error'] = f'Dependency {att.attribute_name} failed'
+
+    # Without the derived attributes (see log_task_costs)
+    result['elapsed_seconds'] = time.time() - start_time - sum([d_result['elapsed_seconds'] for d_result in derived_results])
+    result['derived_results'] = derived_results
+
+    print(f'         { att.attribute_name} for {location_id} on {", ".join(date_strings)}: {result["computed"]} computed, {result["skipped"]} skipped by implementation, failed: {result["error"] is not None}')
+    for d_result in derived_results:
+        print(f'            { d_result["attribute_name"]} (derived): {d_result["computed"]} computed, {d_result["skipped"]} skipped by implementation, failed: {d_result["error"] is not None}')
+
+    return(result)
+
+
+def get_affinity_key(location_id):
+    '''
+    Returns the key whose tasks go to the same worker (see execute_task_graph). In hierarchical mode the
+    children go with their parent, since their edgelists are derived from the parent window (see
+    subgraph_engine, that keeps the recent parents of the process)
+    '''
+
+    if attribute_generic.hierarchical_mode:
+        parent_id = pipeline_context.shared_context.get_parent(location_id)
+        if parent_id is not None:
+            return(parent_id)
+
+    return(location_id)
+
+
+def execute_task_graph(tasks, dependencies, dependents, ranks = None):
+    '''
+    Excecutes the tasks. Each task is dispatched as soon as all its dependencies finish and a worker is free
+    (see num_workers). Ready tasks go longest first (largest rank, see get_task_costs), so the largest windows
+    are not left for the end.
+
+    Location affinity: the first worker that runs a task of a location (see get_affinity_key) becomes its home.
+    A free worker takes the ready tasks of its home locations first and only takes other tasks when it has none
+    (never those of a location its home worker is running, since it takes them next with the data already
+    fetched), so consecutive windows of a location run in the same process (the in memory state of the daily aggregates,
+    the warm starts and the batch mode are per process).
+
+    The dependents of a failed task are not excecuted and are reported as failed. If a derived attribute fails,
+    its later dates for the location are not excecuted either. A task whose worker fails (an exception outside
+    run_unit or a killed process) is reported as failed the same way and the worker is replaced.
+
+    params
+        - tasks, dependencies, dependents: see get_task_graph
+        - ranks (dict): key -> estimated seconds (see get_task_costs). None to only use the priority
+
+    returns
+        list with the result of each task (see run_unit)
+    '''
+
+    results = []
+    remaining = {key : len(dependencies[key]) for key in tasks}
+
+    def new_executor():
+        if num_workers <= 1:
+            return(ThreadPoolExecutor(max_workers = 1))
+        # A single process per executor, so each task is sent to a given worker
+        return(ProcessPoolExecutor(max_workers = 1, initializer = init_worker, mp_context = multiprocessing.get_context('fork')))
+
+    executors = [new_executor() for _ in range(max(num_workers, 1))]
+
+    # Ready tasks (heaps by dispatch order): all of them and by affinity key. Dispatched tasks are left in
+    # the heaps and skipped when popped
+    ready = []
+    ready_by_affinity = {}
+    taken = set()
+
+    # Affinity key -> home worker and worker -> its affinity keys
+    homes = {}
+    home_keys = [set() for _ in executors]
+
+    # Running futures (future -> (key, worker)) and the affinity key each busy worker is running
+    running = {}
+    running_affinity = {}
+
+    def dispatch_order(key):
+        # Longest first, then the tasks that unlock others
+        unit = tasks[key]
+        rank = 0 if ranks is None else ranks[key]
+        return((-1*rank, get_attributes(unit[0])[unit[1]].priority, -1*len(dependents[key]), key))
+
+    def failed_result(kind, attribute_name, location_id, date_string, error):
+        return({'kind': kind, 'attribute_name': attribute_name, 'location_id': location_id, 'dates': [date_string], 'computed': 0, 'skipped': 0, 'error': error, 'elapsed_seconds': 0})
+
+    def fail_task(key, error):
+        remaining[key] = None
+        results.append(failed_result(tasks[key][0], key[0], key[1], key[2], error))
+        for derived_index in tasks[key][4]:
+            results.append(failed_result(GRAPHS, all_graph_attributes[derived_index].attribute_name, key[1], key[2], error))
+        fail_dependents(key, error)
+
+    def fail_dependents(key, error):
+        for dep_key in dependents[key]:
+            if remaining[dep_key] is None:
+                continue
+            fail_task(dep_key, error)
+
+    def fail_later_dates(attribute_name, location_id, date_string, error):
+        # Later dates of a derived attribute (its own tasks or folded in the tasks of its node attribute)
+        for key, unit in tasks.items():
+            if key[1] != location_id or key[2] <= date_string or remaining[key] is None or key in taken:
+                continue
+
+            if key[0] == attribute_name:
+                fail_task(key, error)
+                continue
+
+            for derived_index in list(unit[4]):
+                if all_graph_attributes[derived_index].attribute_name == attribute_name:
+                    unit[4].remove(derived_index)
+                    results.append(failed_result(GRAPHS, attribute_name, location_id, key[2], error))
+
+    def push_ready(key):
+        order = dispatch_order(key)
+        heapq.heappush(ready, order)
+        heapq.heappush(ready_by_affinity.setdefault(get_affinity_key(key[1]), []), order)
+
+    def pop_home_task(worker):
+        best = None
+        for affinity_key in home_keys[worker]:
+            heap = ready_by_affinity.get(affinity_key, [])
+            while len(heap) > 0 and heap[0][-1] in taken:
+                heapq.heappop(heap)
+            if len(heap) > 0 and (best is None or heap[0] < ready_by_affinity[best][0]):
+                best = affinity_key
+
+        if best is None:
+            return(None)
+
+        return(heapq.heappop(ready_by_affinity[best])[-1])
+
+    def pop_any_task(worker):
+        # Called only when the worker has no home tasks. Does not take the tasks of a location whose home
+        # worker is running it (its data is being fetched there, so the home takes them next)
+        skipped = []
+        key = None
+        while len(ready) > 0:
+            order = heapq.heappop(ready)
+            if order[-1] in taken:
+                continue
+
+            affinity_key = get_affinity_key(order[-1][1])
+            home = homes.get(affinity_key)
+            if home is not None and home != worker and running_affinity.get(home) == affinity_key:
+                skipped.append(order)
+                continue
+
+            key = order[-1]
+            break
+
+        for order in skipped:
+            heapq.heappush(ready, order)
+
+        return(key)
+
+    for key in tasks:
+        if remaining[key] == 0:
+            push_ready(key)
+
+    try:
+
+        def submit(worker, key):
+            taken.add(key)
+            affinity_key = get_affinity_key(key[1])
+            if affinity_key not in homes:
+                homes[affinity_key] = worker
+                home_keys[worker].add(affinity_key)
+            running_affinity[worker] = affinity_key
+
+            # Flushes the results read by other attributes (the next date of the same attribute does not read them)
+            flush = any(dep_key[0] != key[0] for dep_key in dependents[key])
+            future = executors[worker].submit(run_unit, *tasks[key], flush = flush)
+            running[future] = (key, worker)
+
+        def submit_ready():
+            # Home tasks first, then any ready task for the workers that are still free
+            for pop_function in [pop_home_task, pop_any_task]:
+                for worker in range(len(executors)):
+                    if worker in running_affinity:
+                        continue
+                    key = pop_function(worker)
+                    if key is not None:
+                        submit(worker, key)
+
+        submit_ready()
+
+        while len(running) > 0:
+
+            done, _ = wait(running, return_when = FIRST_COMPLETED)
+
+            for future in done:
+                key, worker = running.pop(future)
+                running_affinity.pop(worker, None)
+
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # run_unit reports its own errors, so this is the worker failing (e.g. killed). The task and
+                    # its derived attributes are failed and the rest keeps going
+                    error = ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+                    print(f'   Worker {worker} failed on {key}: {repr(e)}')
+                    remaining[key] = None
+                    results.append(failed_result(tasks[key][0], key[0], key[1], key[2], error))
+                    for derived_index in list(tasks[key][4]):
+                        attribute_name = all_graph_attributes[derived_index].attribute_name
+                        results.append(failed_result(GRAPHS, attribute_name, key[1], key[2], error))
+                        fail_later_dates(attribute_name, key[1], key[2], f'Previous date of {attribute_name} failed')
+                    fail_dependents(key, f'Dependency {key} failed')
+
+                    if isinstance(e, BrokenProcessPool):
+                        # Its buffered rows stay in its spill files (recovered on the next run)
+                        executors[worker].shutdown(wait = False)
+                        executors[worker] = new_executor()
+                    continue
+
+                derived_results = result.pop('derived_results')
+                results.extend(derived_results)
+                results.append(result)
+
+                if result['error'] is not None:
+                    fail_dependents(key, f'Dependency {key} failed')
+                    continue
+
+                for d_result in derived_results:
+                    if d_result['error'] is not None:
+                        fail_later_dates(d_result['attribute_name'], key[1], key[2], f'Previous date of {d_result["attribute_name"]} failed')
+
+                for dep_key in dependents[key]:
+                    if remaining[dep_key] is None:
+                        continue
+                    remaining[dep_key] -= 1
+                    if remaining[dep_key] == 0:
+                        push_ready(dep_key)
+
+            submit_ready()
+
+    finally:
+        for executor in executors:
+            executor.shutdown(wait = True)
 
+    return(results)
 
-            print(f'         Calculating { g_att.attribute_name} for {row.location_id} ({i} of {selected.shape[0]}), from: {start_date.date()} to {end_date.date()}')
 
-            current_date = start_date
-            while current_date <= end_date:
+def get_min_pending_date(df_att_all, attributes):
+    '''
+    Returns the earliest max date (already computed) of the given attributes. Pending dates are after the max
+    date of their location and locations without rows start at the starting date of the attribute (they have
+    no existing dates), so the query of the existing dates is bounded by it. None if there are no rows.
+    '''
 
-                if g_att.location_id_supported_on_date(row.location_id, current_date):                 
-                    g_att.save_attribute_for_date(row.location_id, current_date.strftime( utils.date_format))
-                    print(f'            {current_date.date()}: OK.')
-                else:
-                    print(f'            {current_date.date()}: Skipped by implementation.')
+    df_att = df_att_all[df_att_all.attribute_name.isin([att.attribute_name for att in attributes])]
+    if df_att.shape[0] == 0 or df_att.max_date.isna().all():
+        return(None)
 
-                current_date = current_date + timedelta(days = utils.global_attribute_window_shift_days)
-            
-            print(f'   Elapsed Time: {np.round((time.time() - start_time)/3600,3)} hours')
+    return(pd.to_datetime(df_att.max_date.min()))
+
+
+def get_existing_dates(client, kind, df_att_all, attributes):
+    '''
+    Gets the existing dates of the attributes in their pending range (see get_min_pending_date)
+
+    returns
+        pd.DataFrame with location_id, attribute_name and date
+    '''
+
+    min_pending_date = get_min_pending_date(df_att_all, attributes)
+    if min_pending_date is None:
+        return(pd.DataFrame(columns = ['location_id', 'attribute_name', 'date']))
+
+    if kind == NODES:
+        return(utils.get_existing_node_attribute_dates(client, min_pending_date.strftime( utils.date_format)))
+
+    return(utils.get_existing_graph_attribute_dates(client, min_pending_date.strftime( utils.date_format)))
+
+
+def main():
+    
+
+    # Extracts the current date
+    end_date = utils.get_today(only_date = True)
+    end_date = end_date - timedelta(days = 1) # Graphs are computed until the end of previuos date
+    
+    # DEBUG
+    #end_date = pd.to_datetime('2020-11-08')
+ 
+    # Extracts the locations
+    client = pipeline_context.shared_context.get_client()
+    df_locations_all = utils.get_current_locations_for_attributes(client)
+
+    # Inserts the rows left by previous runs that did not finish
+    for writer in [attribute_generic.node_attribute_writer, attribute_generic.graph_attribute_writer, attribute_generic.approximation_writer]:
+        num_recovered = writer.recover_spilled_rows()
+        if num_recovered > 0:
+            print(f'Recovered {num_recovered} rows for {writer.table_id}')
+            writer.flush()
+    
+    start_time = time.time()
+
+    check_dependencies()
+
+    # Processes that each task can start (the pivots of the betweenness). The cores are split among the
+    # workers. Set before the workers are forked
+    node_betweenness.num_processes = max(1, os.cpu_count() // num_workers)
+
+    # Nodes
+    df_att_all = utils.get_max_dates_for_node_attributes(client)
+    
+    # Existing dates (single query over the pending range, instead of one query per date)
+    df_existing = get_existing_dates(client, NODES, df_att_all, all_node_attributes)
+    for n_att in all_node_attributes:
+        n_att.set_existing_dates(df_existing)
+
+    print(f'Computing {len(all_node_attributes)} Node Attributes')
+    node_units = get_pending_units(NODES, all_node_attributes, df_att_all, df_locations_all, end_date)
+
+    
+    # Graphs
+    df_att_all = utils.get_max_dates_for_graph_attributes(client)
+    
+    # Existing dates (single query over the pending range, instead of one query per date)
+    df_existing = get_existing_dates(client, GRAPHS, df_att_all, all_graph_attributes)
+    for g_att in all_graph_attributes:
+        g_att.set_existing_dates(df_existing)
+    
+    print(f'Computing {len(all_graph_attributes)} Graphs Attributes')
+    graph_units = get_pending_units(GRAPHS, all_graph_attributes, df_att_all, df_locations_all, end_date)
+
+
+    # Disk tier shared by the workers
+    run_cache_location = None
+    if num_workers > 1 and attribute_generic.graph_data_cache.disk_location is None:
+        run_cache_location = tempfile.mkdtemp(prefix = 'graph_data_cache_', dir = worker_cache_parent_location)
+        attribute_generic.graph_data_cache.set_disk_location(run_cache_location)
+        print(f'Graph data cache disk tier: {run_cache_location}')
+
+    # Shared data of the pending locations and dates (inherited by the workers)
+    units = node_units + graph_units
+    if len(units) > 0:
+        pipeline_context.shared_context.prepare([unit[2] for unit in units], min([unit[3][0] for unit in units]), load_parents = attribute_generic.hierarchical_mode)
+        num_spans = set_pending_spans(units)
+        print(f'Batch mode for {num_spans} locations')
+
+        if num_workers > 1 and num_spans > 0:
+            start_prefetch = time.time()
+            num_days = prefetch_pending_spans(client)
+            print(f'   Prefetched {num_days} days in {np.round((time.time() - start_prefetch)/60,2)} minutes')
+
+    # Excecutes all the units as (attribute, location, date) tasks following the dependencies
+    tasks, dependencies, dependents = get_task_graph(units)
+    costs, ranks = get_task_costs(tasks, dependents)
+    print(f'Excecuting {len(tasks)} tasks ({sum([len(d) for d in dependencies.values()])} dependencies) with {num_workers} workers')
+    print(f'   Estimated cost: {np.round(sum([c["seconds"] for c in costs.values()])/3600,3)} hours, longest chain: {np.round(max(ranks.values(), default = 0)/3600,3)} hours')
+    try:
+        results = execute_task_graph(tasks, dependencies, dependents, ranks = ranks)
+    finally:
+        if run_cache_location is not None:
+            shutil.rmtree(run_cache_location, ignore_errors = True)
+
+    predicted_seconds, actual_seconds = log_task_costs(results, costs)
+
+    # Remaining results of the current process
+    attribute_generic.node_attribute_writer.flush()
+    attribute_generic.graph_attribute_writer.flush()
+    attribute_generic.approximation_writer.flush()
+
+    print(f'   Elapsed Time: {np.round((time.time() - start_time)/3600,3)} hours')
             
     print()
-    print('Completed Graphs Attribute')
+    print('Completed Attributes')
     print('---------------------------------------')
     print('')
+    print(f'Graph Data Cache: {attribute_generic.graph_data_cache.get_summary()}')
+    print(f'Daily Aggregates: {attribute_generic.daily_aggregates.get_summary()}')
+    if attribute_generic.parquet_cache is not None:
+        print(f'Parquet Cache: {attribute_generic.parquet_cache.get_summary()}')
+    print(f'Case Index: {case_index.case_index_service.get_summary()}')
+    print(f'Task Costs: {np.round(predicted_seconds/3600,3)} hours predicted, {np.round(actual_seconds/3600,3)} hours actual (logged to {task_cost_model.log_file})')
+    print(f'Node Attribute Writer: {attribute_generic.node_attribute_writer.get_summary()}')
+    print(f'Graph Attribute Writer: {attribute_generic.graph_attribute_writer.get_summary()}')
+    print(f'Approximation Writer: {attribute_generic.approximation_writer.get_summary()}')
+
+    # Errors
+    failed = [res for res in results if res['error'] is not None]
+    print(f'Tasks: {len(results)}, Failed: {len(failed)}')
+    for res in failed:
+        print(f'   {res["attribute_name"]} for {res["location_id"]} on {", ".join(res["dates"])}:')
+        print(res['error'])
+
+    if len(failed) > 0:
+        raise ValueError(f'{len(failed)} of {len(results)} tasks failed. See above.')
+
     print('All Done')
 
 